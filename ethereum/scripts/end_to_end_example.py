@@ -17,7 +17,7 @@ from cairo import CairoInterface
 from model import ProverPayload, ProverOutput
 from oracle import Oracle, ProverPayloadSource, TVLContract
 import config as oracle_config
-from utils import IntUtils
+from utils import IntUtils, PubkeyUtils
 
 from brownie import accounts, NodeOperatorRegistry, TVLOracle, MockFactRegistry
 from brownie.network.transaction import TransactionReceipt
@@ -112,7 +112,7 @@ class ControlledChainState:
     @property
     def all_validators(self):
         return [
-            Validator(pubkey=key, balance=balance)
+            Validator(pubkey=PubkeyUtils.from_hex_str(key), balance=balance)
             for key, balance in self._all_validators.items()
         ]
 
@@ -150,7 +150,7 @@ class ControlledProverPayloadSource(ProverPayloadSource):
     def get_prover_payload(self) -> ProverPayload:
         return ProverPayload(
             beacon_state=self._chain_state.beacon_state,
-            lido_operator_keys=self._chain_state.lido_validator_keys
+            lido_operator_keys=[PubkeyUtils.from_hex_str(key) for key in self._chain_state.lido_validator_keys]
         )
 
 
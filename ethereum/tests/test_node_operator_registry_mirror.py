@@ -0,0 +1,23 @@
+from brownie import web3
+
+from api.node_operator_registry import NodeOperatorRegistryMirror
+
+
+def _add_keys(registry, sender, first: int, count: int):
+    for value in range(first, first + count):
+        registry.add_key(value.to_bytes(48, 'big'), {'from': sender})
+
+
+class TestNodeOperatorRegistryMirror:
+    def test_follows_keys_root(self, node_operator_registry, node_operator_contract_admin):
+        mirror = NodeOperatorRegistryMirror.for_contract(web3, node_operator_registry.address)
+        mirror.sync()
+        assert mirror.tree.root_hex() == node_operator_registry.get_keys_root()
+
+        _add_keys(node_operator_registry, node_operator_contract_admin, 1, 3)
+        assert mirror.sync() == 6
+        assert mirror.tree.root_hex() == node_operator_registry.get_keys_root()
+
+        _add_keys(node_operator_registry, node_operator_contract_admin, 4, 2)
+        assert mirror.sync() == 4
+        assert mirror.tree.root_hex() == node_operator_registry.get_keys_root()
@@ -0,0 +1,93 @@
+import json
+import logging
+import time
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import requests
+
+
+@dataclass
+class BeaconEvent:
+    event: str
+    data: Dict[str, Any]
+
+
+class BeaconEventStream:
+    """
+    Reads the beacon node server-sent events stream (`/eth/v1/events`), reconnecting when the connection drops
+    """
+    LOGGER = logging.getLogger(__name__ + ".BeaconEventStream")
+    EVENTS_ENDPOINT = "/eth/v1/events"
+    DEFAULT_TOPICS = ('head', 'finalized_checkpoint')
+    # (connect, read) - `head` events come every slot, so a minute without any means the connection is stale
+    TIMEOUT = (10, 60)
+
+    def __init__(
+            self, base_url: str, topics: Tuple[str, ...] = DEFAULT_TOPICS, reconnect_delay: float = 5.0,
+            session: Optional[requests.Session] = None
+    ):
+        self._base_url = base_url
+        self._topics = topics
+        self._reconnect_delay = reconnect_delay
+        self._session = session if session is not None else requests.Session()
+        self._stopped = False
+
+    def events(self) -> Iterator[BeaconEvent]:
+        while not self._stopped:
+            try:
+                yield from self._read_stream()
+            except requests.RequestException:
+                self.LOGGER.exception("Beacon event stream failed")
+            if not self._stopped:
+                self.LOGGER.info(f"Beacon event stream disconnected, reconnecting in {self._reconnect_delay}s")
+                time.sleep(self._reconnect_delay)
+
+    def stop(self):
+        """
+        The stream stops after the next received event - beacon node sends `head` events every slot, so
+        it doesn't take long. Closing the connection from another thread is not safe for `requests`
+        """
+        self._stopped = True
+
+    def _read_stream(self) -> Iterator[BeaconEvent]:
+        url = self._base_url + self.EVENTS_ENDPOINT
+        params = {"topics": ",".join(self._topics)}
+        self.LOGGER.info(f"Subscribing to beacon events {self._topics}")
+        with self._session.get(url, params=params, headers={"Accept": "text/event-stream"}, stream=True,
+                               timeout=self.TIMEOUT) as response:
+            response.raise_for_status()
+            if response.encoding is None:
+                response.encoding = "utf-8"
+            # events are small and infrequent - reading byte by byte makes sure each one is dispatched as soon as it
+            # arrives, rather than when the read buffer fills up
+            for event in self.parse_lines(response.iter_lines(chunk_size=1, decode_unicode=True)):
+                if self._stopped:
+                    return
+                yield event
+
+    @classmethod
+    def parse_lines(cls, lines: Iterable[str]) -> Iterator[BeaconEvent]:
+        """
+        Minimal SSE parser - only `event` and `data` fields are used by the beacon node API. Events with malformed
+        data are logged and skipped
+        """
+        event, data = None, []
+        for line in lines:
+            if not line:
+                if event is not None and data:
+                    try:
+                        yield BeaconEvent(event, json.loads("\n".join(data)))
+                    except ValueError:
+                        cls.LOGGER.warning(f"Skipping malformed {event} event: {data}")
+                event, data = None, []
+                continue
+            if line.startswith(":"):
+                continue
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
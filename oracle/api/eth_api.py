@@ -2,20 +2,32 @@ from eth_typing import HexStr
 
 import config
 import logging
+import os
+import threading
 
-from dataclasses_json import DataClassJsonMixin
-from typing import List, Dict, Optional, Generator, Iterator, TypedDict
+import requests
+from dataclasses_json import DataClassJsonMixin, config as dataclass_json_config
+from typing import IO, List, Dict, Optional, Generator, Iterator, TypedDict, Iterable, Tuple
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from decimal import Decimal
 
 from web3 import Web3, HTTPProvider
 from web3.beacon import Beacon
 
+from api.prefetch import BackgroundPrefetcher
+from api.web3_cache import RPCCacheMiddleware
+from api.web3_batching import BatchingHTTPProvider
 from disk_cache.cache import TypedJsonDiskCache
+from disk_cache.columnar import Column, TypedColumnarDiskCache
+from disk_cache.index import CacheIndex
+from disk_cache.memory import MemoryTier
+from disk_cache.metrics import CACHE_METRICS
+from disk_cache.snapshots import SnapshotStore
+from json_protocol import DecimalJsonProtocol, JsonObject, JsonSchema, PubkeyJsonProtocol
 from keccak_utils import KeccakInput
 from merkle.merkle_tree import MerkleTreeNode, ProgressiveMerkleTreeBuilder
-from utils import AsDict, IntUtils
+from utils import PUBKEY_LENGTH, AsDict, IntUtils, Pubkey, PubkeyUtils
 
 
 class ValidatorCairoSerialized(TypedDict):
@@ -27,28 +39,55 @@ BeaconStateCairoSerialized = Dict[str, List[ValidatorCairoSerialized]]
 
 @dataclass
 class Validator(DataClassJsonMixin, AsDict):
-    pubkey: HexStr
+    pubkey: Pubkey = field(
+        metadata=dataclass_json_config(encoder=PubkeyUtils.to_hex_str, decoder=PubkeyUtils.from_hex_str)
+    )
     balance: Decimal
 
     @classmethod
     def parse(cls, raw_data):
         # assert raw_data["validator"]["effective_balance"] == raw_data['balance']
         return cls(
-            pubkey=HexStr(raw_data["validator"]["pubkey"]),
+            pubkey=PubkeyUtils.from_hex_str(raw_data["validator"]["pubkey"]),
             balance=Decimal(int(raw_data["balance"])),
         )
 
     def to_cairo(self) -> ValidatorCairoSerialized:
-        return ValidatorCairoSerialized(pubkey=self.pubkey, balance=self.balance)
+        return ValidatorCairoSerialized(pubkey=self.pubkey_hex, balance=self.balance)
 
     @property
-    def pubkey_int(self) -> int:
-        return int(self.pubkey, 16)
+    def pubkey_hex(self) -> HexStr:
+        return PubkeyUtils.to_hex_str(self.pubkey)
 
     @property
     def balance_int(self) -> int:
         return int(self.balance)
 
+    # Columnar cache layout - balances are gwei, so they fit into uint64
+    COLUMNS = [Column.fixed_bytes('pubkey', PUBKEY_LENGTH), Column.uint64('balance')]
+
+    def to_row(self) -> Tuple[bytes, int]:
+        return self.pubkey, self.balance_int
+
+    @classmethod
+    def from_row(cls, row: Tuple[bytes, int]) -> 'Validator':
+        pubkey, balance = row
+        return cls(Pubkey(pubkey), Decimal(balance))
+
+    # Json cache layout - same as `to_dict` + CustomJsonEncoder, without dataclasses_json overhead
+    def to_json(self) -> JsonObject:
+        return VALIDATOR_JSON_SCHEMA.encode(self)
+
+    @classmethod
+    def from_json(cls, raw: JsonObject) -> 'Validator':
+        return VALIDATOR_JSON_SCHEMA.decode(raw)
+
+
+VALIDATOR_JSON_SCHEMA: JsonSchema[Validator] = JsonSchema(Validator, {
+    'pubkey': PubkeyJsonProtocol(),
+    'balance': DecimalJsonProtocol(),
+})
+
 
 @dataclass
 class BeaconState:
@@ -57,10 +96,26 @@ class BeaconState:
     
     def __init__(self, validators):
         self.validators = validators
-        self._validator_lookup = {int(validator.pubkey, 16): validator for validator in validators}
+        self._validator_lookup = None
+        self._balances = None
+
+    def find_validator(self, pubkey: Pubkey) -> Optional[Validator]:
+        if self._validator_lookup is None:
+            self._validator_lookup = {validator.pubkey: validator for validator in self.validators}
+        return self._validator_lookup.get(pubkey)
+
+    @property
+    def balances(self) -> List[int]:
+        """
+        Balances "column", indexed by validator index
+        """
+        if self._balances is None:
+            self._balances = [validator.balance_int for validator in self.validators]
+        return self._balances
 
-    def find_validator(self, pubkey: HexStr) -> Optional[Validator]:
-        return self._validator_lookup.get(int(pubkey, 16))
+    def gather_balances(self, indices: Iterable[int]) -> List[int]:
+        balances = self.balances
+        return [balances[index] for index in indices]
 
     def _flatten(self) -> Iterator[KeccakInput]:
         """
@@ -71,7 +126,7 @@ class BeaconState:
         :return:
         """
         for validator in self.validators:
-            yield from IntUtils.pubkey_to_keccak_input(validator.pubkey_int)
+            yield from PubkeyUtils.to_keccak_input(validator.pubkey)
             yield IntUtils.to_keccak_input(validator.balance_int, size_hint=32)
 
     def merkle_tree_builder(self) -> ProgressiveMerkleTreeBuilder:
@@ -89,6 +144,24 @@ class BeaconState:
                 for validator in self.validators
             ]
         }
+
+    CAIRO_CHUNK = 4096
+
+    def write_cairo(self, out: IO[str]):
+        """
+        Streams `to_cairo` as compact json with sorted keys, without building the intermediate dicts
+        """
+        out.write('{"validators":[')
+        validators = self.validators
+        for start in range(0, len(validators), self.CAIRO_CHUNK):
+            if start:
+                out.write(",")
+            out.write(",".join(
+                f'{{"balance":"{validator.balance}","pubkey":"0x{validator.pubkey.hex()}"}}'
+                for validator in validators[start:start + self.CAIRO_CHUNK]
+            ))
+        out.write("]}")
+
     @property
     def total_validators(self):
         return len(self.validators)
@@ -100,8 +173,88 @@ class BeaconState:
         return f"BeaconState(total_validators={self.total_validators}, first_10_validators={self.validators[:10]}"
 
 
-def get_web3_connection(endpoint) -> Web3:
-    return Web3(HTTPProvider(endpoint))
+@dataclass
+class BeaconStateDiff(DataClassJsonMixin):
+    """
+    Changes between two BeaconState snapshots.
+
+    Validator registry is append-only, so the diff is validators appended after `base_validators`, plus
+    balance deltas for the pre-existing validators whose balance has changed.
+    """
+    base_validators: int
+    new_validators: List[Validator]
+    changed_indices: List[int]
+    balance_deltas: List[int]
+
+    @classmethod
+    def compute(cls, old: BeaconState, new: BeaconState) -> 'BeaconStateDiff':
+        assert new.total_validators >= old.total_validators, "Validators can't be removed from BeaconState"
+        changed_indices, balance_deltas = [], []
+        for index, (old_balance, new_balance) in enumerate(zip(old.balances, new.balances)):
+            if old_balance != new_balance:
+                changed_indices.append(index)
+                balance_deltas.append(new_balance - old_balance)
+
+        return cls(
+            base_validators=old.total_validators,
+            new_validators=new.validators[old.total_validators:],
+            changed_indices=changed_indices,
+            balance_deltas=balance_deltas,
+        )
+
+    @property
+    def total_validators(self) -> int:
+        return self.base_validators + len(self.new_validators)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.new_validators and not self.changed_indices
+
+    def apply(self, base: BeaconState) -> BeaconState:
+        assert base.total_validators == self.base_validators, \
+            f"Diff expects {self.base_validators} validators, got {base.total_validators}"
+        validators = list(base.validators)
+        for index, delta in zip(self.changed_indices, self.balance_deltas):
+            validator = validators[index]
+            validators[index] = Validator(validator.pubkey, Decimal(validator.balance_int + delta))
+        validators.extend(self.new_validators)
+        return BeaconState(validators)
+
+    def balance_delta(self, indices: Iterable[int]) -> int:
+        """
+        Change of the total balance of validators at given indices - allows updating TVL without a full pass
+        """
+        deltas = dict(zip(self.changed_indices, self.balance_deltas))
+        total = 0
+        for index in indices:
+            if index >= self.total_validators:
+                continue
+            if index >= self.base_validators:
+                total += self.new_validators[index - self.base_validators].balance_int
+            else:
+                total += deltas.get(index, 0)
+        return total
+
+    def __str__(self):
+        return f"BeaconStateDiff(base_validators={self.base_validators}, new_validators={len(self.new_validators)}, " \
+               f"changed_balances={len(self.changed_indices)})"
+
+
+def get_web3_connection(
+        endpoint, batch_size: int = config.WEB3_BATCH_SIZE, parallel_batches: int = config.WEB3_PARALLEL_BATCHES,
+        rpc_cache: bool = config.WEB3_RPC_CACHE
+) -> Web3:
+    if batch_size <= 1:
+        w3 = Web3(HTTPProvider(endpoint))
+    else:
+        w3 = Web3(BatchingHTTPProvider(endpoint, batch_size=batch_size, parallel_batches=parallel_batches))
+    if rpc_cache:
+        middleware = RPCCacheMiddleware(
+            config.WEB3_CACHE_LOCATION, confirmations=config.WEB3_RPC_CACHE_CONFIRMATIONS,
+            metrics=CACHE_METRICS.namespace('web3')
+        )
+        w3.middleware_onion.inject(middleware, name='rpc_cache', layer=0)
+    return w3
 
 
 class BeaconAPIWrapper:
@@ -119,28 +272,140 @@ class BeaconAPIWrapper:
             for raw_record in raw_data["data"]
         ]
 
+    def state_root(self, state='head') -> str:
+        return self._beacon.get_hash_root(state_id=state)["data"]["root"]
+
+    def checkpoint_state_root(self, slot: int) -> str:
+        """
+        State root that finalized_checkpoint events report for the checkpoint at `slot` - the post-state of the latest
+        block at or before it, rather than the state at `slot` itself when that slot was skipped
+        """
+        for block_slot in range(slot, -1, -1):
+            try:
+                header = self._beacon.get_block_header(str(block_slot))
+            except requests.HTTPError as error:
+                if error.response is not None and error.response.status_code == 404:
+                    continue
+                raise
+            return header["data"]["header"]["message"]["state_root"]
+        raise ValueError(f"No block at or before slot {slot}")
+
+    def pin(self, state):
+        """
+        Keeps the state available while it is still needed, e.g. by a pending proof
+        """
+        pass
+
+    def unpin(self, state):
+        pass
+
+    def prefetch(self, state):
+        """
+        Starts fetching the state in the background, so that it is ready when requested - no-op without a cache
+        """
+        pass
+
+    def cancel_prefetch(self):
+        pass
+
+    def close(self, timeout: Optional[float] = None):
+        pass
+
 class CachedBeaconAPIWrapper(BeaconAPIWrapper):
     LOGGER = logging.getLogger(__name__ + ".CachedBeaconAPIWrapper")
 
-    def __init__(self, beacon: Beacon, storage_folder: str):
+    def __init__(
+            self, beacon: Beacon, storage_folder: str, cache_format: str = config.ETH2_CACHE_FORMAT,
+            max_bytes: Optional[int] = config.ETH2_CACHE_MAX_BYTES, ttl: Optional[Dict[str, float]] = None,
+            memory_bytes: int = config.ETH2_CACHE_MEMORY_BYTES
+    ):
         super(CachedBeaconAPIWrapper, self).__init__(beacon)
-        self._validator_cache: TypedJsonDiskCache[Validator] = TypedJsonDiskCache(
-            config.ETH2_CACHE_LOCATION, Validator.from_dict, Validator.to_dict
-        )
+        metrics = CACHE_METRICS.namespace('eth2')
+        index = CacheIndex(storage_folder, max_bytes, ttl if ttl is not None else config.CACHE_TTL, metrics=metrics)
+        memory = MemoryTier(memory_bytes)
+        if cache_format == 'columnar':
+            self._validator_cache = TypedColumnarDiskCache(
+                storage_folder, Validator.COLUMNS, Validator.from_row, Validator.to_row, index=index, memory=memory,
+                metrics=metrics
+            )
+        elif cache_format == 'json':
+            self._validator_cache = TypedJsonDiskCache(
+                storage_folder, Validator.from_json, Validator.to_json, index=index, memory=memory, metrics=metrics
+            )
+        elif cache_format == 'snapshots':
+            self._validator_cache = SnapshotStore(
+                os.path.join(storage_folder, 'snapshots'), Validator.COLUMNS, Validator.from_row, Validator.to_row,
+                max_bytes=max_bytes, ttl=ttl if ttl is not None else config.CACHE_TTL, metrics=metrics
+            )
+        else:
+            raise ValueError(f"Unknown cache format {cache_format}")
+        self._prefetcher = BackgroundPrefetcher(self._warm, name="beacon-prefetch")
 
     def validators(self, state='head') -> List[Validator]:
         self.LOGGER.info("Fetching ETH2 validators")
+        return self._read_through(state)
+
+    def _read_through(self, state, cancelled: Optional[threading.Event] = None) -> Optional[List[Validator]]:
         cache_key = ['validators', state]
         cached = list(self._validator_cache.read_model(*cache_key))
         if cached:
-            self.LOGGER.debug("Found validators in json disk cache")
+            self.LOGGER.debug("Found validators in disk cache")
             return cached
 
-        self.LOGGER.debug("Json disk cache is empty")
-        read_from_api = super(CachedBeaconAPIWrapper, self).validators()
-        self.LOGGER.debug(f"Saving {len(read_from_api)} validators into json disk cache")
-        self._validator_cache.save_models(read_from_api, *cache_key)
-        return read_from_api
+        with self._validator_cache.write_lock(*cache_key):
+            # another process might have fetched the state while we were waiting for the lock
+            cached = list(self._validator_cache.read_model(*cache_key))
+            if cached:
+                self.LOGGER.debug("Validators were saved into disk cache by another process")
+                return cached
+
+            self.LOGGER.debug("Disk cache is empty")
+            read_from_api = super(CachedBeaconAPIWrapper, self).validators(state)
+            if cancelled is not None and cancelled.is_set():
+                self.LOGGER.debug(f"Prefetch of {state} cancelled, not saving")
+                return None
+            self.LOGGER.debug(f"Saving {len(read_from_api)} validators into disk cache")
+            self._validator_cache.save_models(read_from_api, *cache_key)
+            return read_from_api
+
+    def pin(self, state):
+        self._validator_cache.pin('validators', state)
+
+    def unpin(self, state):
+        self._validator_cache.unpin('validators', state)
+
+    def prefetch(self, state):
+        """
+        Fetches the state into the disk cache and decodes it into the memory tier in a background thread. Only the
+        latest requested state is kept waiting; `validators` for a state being prefetched waits for it to be saved
+        rather than fetching it again.
+        Cache entries are keyed by state root - a checkpoint expected to be finalized later, given by its slot, is
+        resolved to the state root its finalized_checkpoint event will report, other state ids to their state root.
+        """
+        self._prefetcher.submit(state)
+
+    def cancel_prefetch(self):
+        self._prefetcher.cancel()
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Cancels prefetching and waits up to `timeout` seconds for the running prefetch to stop
+        """
+        self._prefetcher.close(timeout)
+
+    def _warm(self, state, cancelled: threading.Event):
+        if state.startswith("0x"):
+            state_root = state
+        elif state.isdigit():
+            state_root = self.checkpoint_state_root(int(state))
+        else:
+            state_root = self.state_root(state)
+        if cancelled.is_set():
+            return
+        self._read_through(state_root, cancelled)
+        if not cancelled.is_set():
+            # columnar and json caches decode the entry into the memory tier on read
+            self._validator_cache.read_model('validators', state_root)
 
 def main():
     beacon = CachedBeaconAPIWrapper(Beacon(config.ETH2_API), config.ETH2_CACHE_LOCATION)
@@ -1,9 +1,18 @@
+import mmap
+import os
+import struct
+import time
+
 from dataclasses import dataclass
 
 from eth_typing import HexStr
-from typing import List, Any, Dict, Generator, Iterator, Literal
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import takewhile
+from typing import List, Any, Dict, Generator, Iterator, Literal, Tuple, Callable, Optional, Sequence, Union, overload
 
-from lido_sdk.methods.typing import OperatorKey
+from lido_sdk.methods.operators import get_keys_by_indexes
+from lido_sdk.methods.typing import OperatorKey, Operator
 
 import config
 import logging
@@ -11,15 +20,20 @@ import logging
 from web3 import Web3
 
 from disk_cache.cache import TypedJsonDiskCache
+from disk_cache.files import atomic_write, file_lock
+from disk_cache.metrics import CACHE_METRICS
 from api.eth_api import get_web3_connection
 from lido_sdk import Lido
 
 from keccak_utils import KeccakInput
 from merkle.merkle_tree import MerkleTreeNode, ProgressiveMerkleTreeBuilder
-from utils import IntUtils, ByteEndianness, BytesUtils
+from utils import PUBKEY_LENGTH, Pubkey, PubkeyUtils
 
 OperatorKeyAttributes = Literal['index', 'operator_index', 'key', 'depositSignature', 'used']
 OperatorKeysCairoSerialized = List[HexStr]
+SIGNATURE_LENGTH = 96
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
 
 class OperatorKeyAdapter:
     """
@@ -27,55 +41,62 @@ class OperatorKeyAdapter:
     """
     def __init__(self, operator_key: OperatorKey):
         self._operator_key = operator_key
-
-    def _decode_hex(self, raw: bytes, endianness: ByteEndianness = 'big', signed=False) -> int:
-        return int.from_bytes(self._operator_key["key"], endianness, signed=signed)
-
-    def _maybe_pad(self, value: bytes, padding=False):
-        if not padding:
-            return value
-        else:
-            return BytesUtils.pad_to_32_multiple(value)
+        self._key = PubkeyUtils.from_bytes(operator_key["key"])
 
     @property
     def key_bytes(self):
         return self._operator_key["key"]
 
     @property
-    def key(self) -> HexStr:
-        return IntUtils.to_hex_str(self._decode_hex(self._operator_key["key"]))
+    def key(self) -> Pubkey:
+        return self._key
 
-    def key_int(self) -> int:
-        return self._decode_hex(self._operator_key["key"])
+    @property
+    def key_hex(self) -> HexStr:
+        return PubkeyUtils.to_hex_str(self._key)
 
     @property
-    def deposit_signature(self):
-        return self._decode_hex(self._operator_key["depositSignature"])
+    def deposit_signature(self) -> Optional[bytes]:
+        return self._operator_key["depositSignature"]
 
     def __getattr__(self, name: OperatorKeyAttributes):
         return self._operator_key[name]
 
     def __repr__(self):
-        return f"OperatorKeyAdapter(key={self.key}, signature={self.deposit_signature:#x})"
+        if self.deposit_signature is None:
+            return f"OperatorKeyAdapter(key={self.key_hex})"
+        return f"OperatorKeyAdapter(key={self.key_hex}, signature=0x{self.deposit_signature.hex()})"
 
 
 @dataclass
 class LidoOperatorList:
     LOGGER = logging.getLogger(__name__ + ".LidoOperatorList")
-    operators: List[OperatorKeyAdapter]
+    operators: Sequence[OperatorKeyAdapter]
 
     def _flatten(self) -> Iterator[KeccakInput]:
-        for operator in self.operators:
-            yield from IntUtils.pubkey_to_keccak_input(operator.key_int())
+        for key in self.keys:
+            yield from PubkeyUtils.to_keccak_input(key)
 
     def merkle_tree_root(self) -> MerkleTreeNode:
         tree_builder = ProgressiveMerkleTreeBuilder()
         tree_builder.add_values(self._flatten())
         return tree_builder.build()
 
-    def to_cairo(self):
+    @property
+    def keys(self) -> List[Pubkey]:
+        if isinstance(self.operators, OperatorKeyTable):
+            return self.operators.keys
         return [operator.key for operator in self.operators]
 
+    @property
+    def operator_indices(self) -> List[int]:
+        if isinstance(self.operators, OperatorKeyTable):
+            return self.operators.operator_indices
+        return [operator.operator_index for operator in self.operators]
+
+    def to_cairo(self) -> OperatorKeysCairoSerialized:
+        return [PubkeyUtils.to_hex_str(key) for key in self.keys]
+
     @property
     def total_operators(self):
         return len(self.operators)
@@ -89,8 +110,8 @@ class LidoOperatorList:
 
 class OperatorKeyJsonableSerializer:
     @classmethod
-    def _hex_str_to_bytes(cls, value: HexStr, length: int, endianness: ByteEndianness = 'big', signed: bool = False):
-        return IntUtils.from_hex_str(value).to_bytes(length, endianness, signed=signed)
+    def _hex_str_to_bytes(cls, value: HexStr) -> bytes:
+        return bytes.fromhex(value[2:] if value.startswith('0x') else value)
 
     @classmethod
     def serialize(self, operator_key: OperatorKeyAdapter):
@@ -98,7 +119,7 @@ class OperatorKeyJsonableSerializer:
             "index": operator_key.index,
             "operator_index": operator_key.operator_index,
             "key": operator_key.key_hex,
-            "depositSignature": IntUtils.to_hex_str(operator_key.deposit_signature),
+            "depositSignature": "0x" + operator_key.deposit_signature.hex(),
             "used": operator_key.used,
         }
 
@@ -107,49 +128,329 @@ class OperatorKeyJsonableSerializer:
         operator_key = OperatorKey(
             index=json_dict["index"],
             operator_index=json_dict["operator_index"],
-            key=cls._hex_str_to_bytes(json_dict["key"], 80),
-            depositSignature=cls._hex_str_to_bytes(json_dict["depositSignature"], 80),
+            key=PubkeyUtils.from_hex_str(json_dict["key"]),
+            depositSignature=cls._hex_str_to_bytes(json_dict["depositSignature"]),
             used=json_dict["used"],
         )
         return OperatorKeyAdapter(operator_key)
 
+class OperatorKeyTable(Sequence[OperatorKeyAdapter]):
+    """
+    Read-only fixed-record table of operator keys, backed by an in-memory buffer or an mmap-ed file.
+
+    Layout: header (magic, version, record count), followed by records of
+    `key (48 bytes) | operator_index (u32) | index (u32) | used (u8)`. Deposit signatures are not read by the
+    oracle, so they are kept in an optional side file of 96-byte records, in the same order as the keys.
+    Items are materialized into OperatorKeyAdapter on access; `keys` and `operator_indices` read the columns directly.
+    """
+    LOGGER = logging.getLogger(__name__ + ".OperatorKeyTable")
+    MAGIC = b"LKEY"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHI")
+    RECORD = struct.Struct(f"<{PUBKEY_LENGTH}sIIB")
+
+    def __init__(self, buffer: Buffer, signatures: Optional[Buffer] = None):
+        magic, version, count = self.HEADER.unpack_from(buffer, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Not an operator key table (magic={magic}, version={version})")
+        if len(buffer) < self.HEADER.size + count * self.RECORD.size:
+            raise ValueError(f"Operator key table is truncated - expected {count} records")
+        if signatures is not None and len(signatures) < count * SIGNATURE_LENGTH:
+            raise ValueError(f"Signature file is truncated - expected {count} signatures")
+        self._buffer = buffer
+        self._records = memoryview(buffer)[self.HEADER.size:self.HEADER.size + count * self.RECORD.size]
+        self._signatures = signatures
+        self._count = count
+
+    @classmethod
+    def encode(cls, keys: Sequence[OperatorKeyAdapter]) -> bytes:
+        records = bytearray(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(keys)))
+        for key in keys:
+            records += cls.RECORD.pack(key.key, key.operator_index, key.index, key.used)
+        return bytes(records)
+
+    @classmethod
+    def encode_signatures(cls, keys: Sequence[OperatorKeyAdapter]) -> bytes:
+        return b"".join(key.deposit_signature for key in keys)
+
+    @classmethod
+    def from_keys(cls, keys: Sequence[OperatorKeyAdapter], with_signatures: bool = False) -> 'OperatorKeyTable':
+        return cls(cls.encode(keys), cls.encode_signatures(keys) if with_signatures else None)
+
+    @classmethod
+    def write(cls, path: str, keys: Sequence[OperatorKeyAdapter], signatures_path: Optional[str] = None) -> None:
+        # Files are replaced rather than truncated in place - tables opened earlier might still be mapped
+        if signatures_path is not None:
+            with atomic_write(signatures_path) as signatures_file:
+                signatures_file.write(cls.encode_signatures(keys))
+        with atomic_write(path) as table_file:
+            table_file.write(cls.encode(keys))
+
+    @classmethod
+    def open(cls, path: str, signatures_path: Optional[str] = None) -> 'OperatorKeyTable':
+        buffer = cls._map(path)
+        signatures = cls._map(signatures_path) if signatures_path is not None and os.path.exists(signatures_path) \
+            else None
+        table = cls(buffer, signatures)
+        cls.LOGGER.debug(f"Opened {len(table)} operator keys from {path}")
+        return table
+
+    @classmethod
+    def _map(cls, path: str) -> Buffer:
+        with open(path, "rb") as mapped_file:
+            if os.fstat(mapped_file.fileno()).st_size == 0:
+                # empty files can't be mmap-ed - only happens for an empty signature file
+                return b""
+            return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._records.release()
+        for buffer in (self._buffer, self._signatures):
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def has_signatures(self) -> bool:
+        return self._signatures is not None
+
+    @property
+    def keys(self) -> List[Pubkey]:
+        return [PubkeyUtils.from_bytes(key) for key, _, _, _ in self.RECORD.iter_unpack(self._records)]
+
+    @property
+    def operator_indices(self) -> List[int]:
+        return [operator_index for _, operator_index, _, _ in self.RECORD.iter_unpack(self._records)]
+
+    def _signature(self, index: int) -> Optional[bytes]:
+        if self._signatures is None:
+            return None
+        return bytes(self._signatures[index * SIGNATURE_LENGTH:(index + 1) * SIGNATURE_LENGTH])
+
+    def _adapter(self, index: int) -> OperatorKeyAdapter:
+        key, operator_index, key_index, used = self.RECORD.unpack_from(self._records, index * self.RECORD.size)
+        return OperatorKeyAdapter(OperatorKey(
+            index=key_index, operator_index=operator_index, key=key,
+            depositSignature=self._signature(index), used=bool(used)
+        ))
+
+    @overload
+    def __getitem__(self, index: int) -> OperatorKeyAdapter: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[OperatorKeyAdapter]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._adapter(position) for position in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("operator key index out of range")
+        return self._adapter(index)
+
+    def __iter__(self) -> Iterator[OperatorKeyAdapter]:
+        return (self._adapter(index) for index in range(self._count))
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return f"OperatorKeyTable(keys={self._count}, signatures={self.has_signatures})"
+
+
+KeyIndexes = List[Tuple[int, int]]
+
+
 class LidoWrapper:
-    def __init__(self, w3: Web3):
-        self._lido_api = Lido(w3)
+    """
+    Reads Lido operators and keys at a block `confirmations` below the chain head - see `pinned_block`
+    """
+    LOGGER = logging.getLogger(__name__ + ".LidoWrapper")
+
+    def __init__(self, w3: Web3, confirmations: int = config.WEB3_RPC_CACHE_CONFIRMATIONS):
+        self._w3 = w3
+        self._confirmations = confirmations
+        self._lido_api = Lido(
+            w3,
+            MULTICALL_MAX_BUNCH=config.LIDO_MULTICALL_MAX_BUNCH,
+            MULTICALL_MAX_WORKERS=config.LIDO_MULTICALL_MAX_WORKERS,
+        )
+
+    @contextmanager
+    def pinned_block(self) -> Iterator[int]:
+        """
+        Pins calls made within that do not specify a block - lido_sdk's calls and multicalls never do - to the block
+        `confirmations` below the head: all the reads see the same state, and RPCCacheMiddleware can cache them.
+        Nested pins keep the outer block
+        """
+        eth = self._w3.eth
+        if isinstance(eth.default_block, int):
+            yield eth.default_block
+            return
+        previous, block = eth.default_block, max(eth.block_number - self._confirmations, 0)
+        self.LOGGER.debug(f"Reading Lido contracts at block {block}")
+        eth.default_block = block
+        try:
+            yield block
+        finally:
+            eth.default_block = previous
+
+    def get_operators(self) -> List[Operator]:
+        with self.pinned_block():
+            operator_indexes = self._lido_api.get_operators_indexes()
+            return self._lido_api.get_operators_data(operator_indexes)
 
     def get_operator_keys(self) -> List[OperatorKeyAdapter]:
-        operator_indexes = self._lido_api.get_operators_indexes()
-        operators_data = self._lido_api.get_operators_data(operator_indexes)
-        operator_keys = self._lido_api.get_operators_keys(operators_data)
+        with self.pinned_block():
+            operators_data = self.get_operators()
+            operator_keys = self._lido_api.get_operators_keys(operators_data)
+        return [
+            OperatorKeyAdapter(operator_key)
+            for operator_key in operator_keys
+        ]
+
+    def get_keys_by_indexes(self, key_indexes: KeyIndexes) -> List[OperatorKeyAdapter]:
+        """
+        :param key_indexes: (operator_index, key_index) pairs
+        """
+        with self.pinned_block():
+            operator_keys = get_keys_by_indexes(self._w3, key_indexes)
         return [
             OperatorKeyAdapter(operator_key)
             for operator_key in operator_keys
         ]
 
 
+class IncrementalKeySync:
+    """
+    Brings a previously fetched list of operator keys up to date with the on-chain operator keys.
+
+    Per operator, used keys form a prefix of the key list and never change, while unused keys can be removed (which
+    moves the last key into the removed slot) and added in any order - so a key count does not tell whether they
+    changed. Cached keys that were already used are kept, and all the others are refetched.
+    """
+    LOGGER = logging.getLogger(__name__ + ".IncrementalKeySync")
+
+    @classmethod
+    def missing_key_indexes(
+            cls, cached: Dict[int, List[OperatorKeyAdapter]], operators: List[Operator]
+    ) -> Tuple[Dict[int, List[OperatorKeyAdapter]], KeyIndexes]:
+        """
+        :return: cached keys that are still valid, per operator, and (operator_index, key_index) of keys to fetch
+        """
+        kept, to_fetch = {}, []
+        for operator in operators:
+            operator_index = operator["index"]
+            total_keys, used_keys = operator["totalSigningKeys"], operator["usedSigningKeys"]
+            operator_keys = cached.get(operator_index, [])
+            keep_count = sum(1 for _ in takewhile(lambda key: key.used, operator_keys[:used_keys]))
+            kept[operator_index] = operator_keys[:keep_count]
+            to_fetch.extend((operator_index, key_index) for key_index in range(keep_count, total_keys))
+        return kept, to_fetch
+
+    @classmethod
+    def sync(
+            cls, cached_keys: List[OperatorKeyAdapter], operators: List[Operator],
+            fetch: Callable[[KeyIndexes], List[OperatorKeyAdapter]]
+    ) -> Tuple[List[OperatorKeyAdapter], bool]:
+        """
+        :return: up-to-date keys, and whether they differ from cached_keys
+        """
+        cached = defaultdict(list)
+        for key in cached_keys:
+            cached[key.operator_index].append(key)
+        for operator_keys in cached.values():
+            operator_keys.sort(key=lambda key: key.index)
+
+        kept, to_fetch = cls.missing_key_indexes(cached, operators)
+        cls.LOGGER.info(f"Fetching {len(to_fetch)} unused or new operator keys")
+        for key in fetch(to_fetch) if to_fetch else []:
+            kept[key.operator_index].append(key)
+
+        synced = [
+            key
+            for operator in operators
+            for key in kept[operator["index"]]
+        ]
+        return synced, [cls._identity(key) for key in synced] != [cls._identity(key) for key in cached_keys]
+
+    @classmethod
+    def _identity(cls, key: OperatorKeyAdapter) -> Tuple[int, int, bytes, bool]:
+        return key.operator_index, key.index, key.key, key.used
+
+
 class CachedLidoWrapper(LidoWrapper):
+    """
+    Keeps operator keys in a binary OperatorKeyTable under the Lido cache folder and syncs it incrementally.
+    Caches written by the previous, json-based, version are picked up and converted on first run.
+    """
     LOGGER = logging.getLogger(__name__ + ".CachedLidoWrapper")
-    def __init__(self, w3: Web3):
+    CACHE_KEY = 'lido_validators'
+    TABLE_EXTENSION = "keys"
+    SIGNATURES_EXTENSION = "sigs"
+
+    def __init__(
+            self, w3: Web3, storage_folder: str = config.LIDO_CACHE_LOCATION,
+            store_signatures: bool = config.LIDO_CACHE_SIGNATURES
+    ):
         super(CachedLidoWrapper, self).__init__(w3)
+        self._table_path = os.path.join(storage_folder, f"{self.CACHE_KEY}.{self.TABLE_EXTENSION}")
+        self._signatures_path = os.path.join(storage_folder, f"{self.CACHE_KEY}.{self.SIGNATURES_EXTENSION}")
+        self._store_signatures = store_signatures
+        self._metrics = CACHE_METRICS.namespace('lido')
         self._validator_cache: TypedJsonDiskCache[OperatorKeyAdapter] = TypedJsonDiskCache(
-            config.LIDO_CACHE_LOCATION,
+            storage_folder,
             OperatorKeyJsonableSerializer.deserialize,
-            OperatorKeyJsonableSerializer.serialize
+            OperatorKeyJsonableSerializer.serialize,
+            metrics=self._metrics
         )
 
-    def get_operator_keys(self) -> List[OperatorKeyAdapter]:
+    def _table_size(self) -> int:
+        paths = [self._table_path, self._signatures_path]
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+    def _read_cached(self) -> List[OperatorKeyAdapter]:
+        if os.path.exists(self._table_path):
+            start = time.perf_counter() if self._metrics is not None else None
+            with OperatorKeyTable.open(self._table_path, self._signatures_path) as table:
+                keys = list(table)
+            if self._metrics is not None:
+                self._metrics.hit(self._table_size())
+                self._metrics.decoded(time.perf_counter() - start)
+            return keys
+        return list(self._validator_cache.read_model(self.CACHE_KEY))
+
+    def _save(self, keys: List[OperatorKeyAdapter]) -> OperatorKeyTable:
+        self.LOGGER.debug(f"Saving {len(keys)} validators into key table")
+        start = time.perf_counter() if self._metrics is not None else None
+        with_signatures = self._store_signatures and all(key.deposit_signature is not None for key in keys)
+        OperatorKeyTable.write(self._table_path, keys, self._signatures_path if with_signatures else None)
+        if not with_signatures and os.path.exists(self._signatures_path):
+            os.remove(self._signatures_path)
+        if self._metrics is not None:
+            self._metrics.written(self._table_size(), time.perf_counter() - start)
+        return OperatorKeyTable.open(self._table_path, self._signatures_path)
+
+    def get_operator_keys(self) -> Sequence[OperatorKeyAdapter]:
         self.LOGGER.info("Fetching Lido validators")
-        cache_key = ['lido_validators']
-        cached = list(self._validator_cache.read_model(*cache_key))
-        if cached:
-            self.LOGGER.debug("Found validators in json disk cache")
-            return cached
-
-        self.LOGGER.debug("Json disk cache is empty")
-        read_from_api = super(CachedLidoWrapper, self).get_operator_keys()
-        self.LOGGER.debug(f"Saving {len(read_from_api)} validators into json disk cache")
-        self._validator_cache.save_models(read_from_api, *cache_key)
-        return read_from_api
+        # one process syncs the keys at a time - others wait and then only refetch the unused keys
+        with file_lock(self._table_path), self.pinned_block():
+            cached = self._read_cached()
+            if cached:
+                self.LOGGER.debug(f"Found {len(cached)} validators in disk cache - syncing unused and new keys")
+                synced, changed = IncrementalKeySync.sync(cached, self.get_operators(), self.get_keys_by_indexes)
+                if changed or not os.path.exists(self._table_path):
+                    return self._save(synced)
+                return OperatorKeyTable.open(self._table_path, self._signatures_path)
+
+            self.LOGGER.debug("Disk cache is empty")
+            return self._save(super(CachedLidoWrapper, self).get_operator_keys())
 
 def main():
     w3 = get_web3_connection(config.WEB3_API)
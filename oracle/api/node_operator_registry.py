@@ -0,0 +1,197 @@
+import logging
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+from eth_typing import ChecksumAddress
+from web3 import Web3
+
+import config
+from disk_cache.cache import JsonDiskCache
+from disk_cache.metrics import CACHE_METRICS
+from keccak_utils import KeccakHash, keccak2
+from utils import IntUtils
+
+MTR_LEAF_ADDED_ABI = {
+    "anonymous": False,
+    "inputs": [
+        {"indexed": False, "internalType": "uint256", "name": "index", "type": "uint256"},
+        {"indexed": False, "internalType": "bytes32", "name": "value", "type": "bytes32"},
+    ],
+    "name": "MTRLeafAdded",
+    "type": "event",
+}
+
+
+@dataclass
+class MTRLeafAdded:
+    block_number: int
+    log_index: int
+    index: int
+    value: bytes
+
+    @classmethod
+    def parse(cls, log) -> 'MTRLeafAdded':
+        return cls(
+            block_number=log["blockNumber"], log_index=log["logIndex"],
+            index=log["args"]["index"], value=bytes(log["args"]["value"])
+        )
+
+
+def _zero_hashes(depth: int) -> List[KeccakHash]:
+    zero_hashes = [b'\x00' * 32]
+    for _ in range(depth - 1):
+        zero_hashes.append(keccak2(zero_hashes[-1], zero_hashes[-1]))
+    return zero_hashes
+
+
+class KeysTreeBranch:
+    """
+    Same branch-based progressive merkle tree as NodeOperatorRegistry.add_to_merkle_tree - only the branch
+    (one node per height) and the leaf count are stored, so adding a leaf and computing the root are O(TREE_DEPTH)
+    """
+    TREE_DEPTH = 32
+    ZERO_HASHES = _zero_hashes(TREE_DEPTH)
+
+    def __init__(self, branch: Optional[List[KeccakHash]] = None, leaf_count: int = 0):
+        self.branch = branch if branch is not None else [b'\x00' * 32] * self.TREE_DEPTH
+        self.leaf_count = leaf_count
+
+    def add_leaf(self, value: bytes):
+        assert len(value) == 32, "Values should be 32 byte long"
+        self.leaf_count += 1
+        node, size = value, self.leaf_count
+        for height in range(self.TREE_DEPTH):
+            if size & 1 == 1:
+                self.branch[height] = node
+                return
+            node = keccak2(self.branch[height], node)
+            size //= 2
+        raise AssertionError("Keys tree is full")
+
+    def root(self) -> KeccakHash:
+        node, size = b'\x00' * 32, self.leaf_count
+        for height in range(self.TREE_DEPTH):
+            if size & 1 == 1:
+                node = keccak2(self.branch[height], node)
+            else:
+                node = keccak2(node, self.ZERO_HASHES[height])
+            size //= 2
+        return node
+
+    def root_hex(self):
+        return IntUtils.hex_str_from_bytes(self.root(), 'big', False)
+
+    def to_dict(self):
+        return {"branch": ["0x" + node.hex() for node in self.branch], "leaf_count": self.leaf_count}
+
+    @classmethod
+    def from_dict(cls, raw: Dict) -> 'KeysTreeBranch':
+        if not raw:
+            return cls()
+        return cls([bytes.fromhex(node[2:]) for node in raw["branch"]], int(raw["leaf_count"]))
+
+
+LogFetcher = Callable[[int, int], Iterable[MTRLeafAdded]]
+
+
+class NodeOperatorRegistryMirror:
+    """
+    Replays NodeOperatorRegistry MTRLeafAdded events into a local KeysTreeBranch, so `get_keys_root()` can be
+    reproduced without recomputing the tree from all the keys. Each `sync` only reads logs from blocks after the last
+    synced one, and by default only up to `confirmations` blocks below the head - the cursor only moves forward, so
+    a reorg of already applied blocks could not be undone.
+
+    The contract emits both leaves of a key with the index of the key's first leaf - it is checked against the local
+    leaf count to detect missed events.
+    """
+    LOGGER = logging.getLogger(__name__ + ".NodeOperatorRegistryMirror")
+    BLOCK_RANGE = 10_000
+
+    def __init__(
+            self, fetch_logs: LogFetcher, block_number: Callable[[], int],
+            tree: Optional[KeysTreeBranch] = None, next_block: int = 0,
+            confirmations: int = config.WEB3_RPC_CACHE_CONFIRMATIONS
+    ):
+        self._fetch_logs = fetch_logs
+        self._block_number = block_number
+        self._confirmations = confirmations
+        self.tree = tree if tree is not None else KeysTreeBranch()
+        self.next_block = next_block
+
+    @classmethod
+    def for_contract(cls, w3: Web3, address: ChecksumAddress, **kwargs) -> 'NodeOperatorRegistryMirror':
+        contract = w3.eth.contract(address=address, abi=[MTR_LEAF_ADDED_ABI])
+
+        def fetch_logs(from_block: int, to_block: int) -> Iterable[MTRLeafAdded]:
+            logs = contract.events.MTRLeafAdded.getLogs(fromBlock=from_block, toBlock=to_block)
+            return (MTRLeafAdded.parse(log) for log in logs)
+
+        return cls(fetch_logs, lambda: w3.eth.block_number, **kwargs)
+
+    def _apply(self, event: MTRLeafAdded):
+        expected_index = self.tree.leaf_count - self.tree.leaf_count % 2
+        if event.index != expected_index:
+            raise ValueError(
+                f"Unexpected MTRLeafAdded index {event.index} at block {event.block_number}, "
+                f"expected {expected_index} - events were missed"
+            )
+        self.tree.add_leaf(event.value)
+
+    def sync(self, to_block: Optional[int] = None) -> int:
+        """
+        Applies events up to to_block (inclusive, latest confirmed block by default). Returns the number of leaves added
+        """
+        to_block = to_block if to_block is not None else self._block_number() - self._confirmations
+        leaves_before = self.tree.leaf_count
+        for from_block in range(self.next_block, to_block + 1, self.BLOCK_RANGE):
+            range_end = min(from_block + self.BLOCK_RANGE - 1, to_block)
+            events = sorted(self._fetch_logs(from_block, range_end), key=lambda e: (e.block_number, e.log_index))
+            checkpoint = KeysTreeBranch(list(self.tree.branch), self.tree.leaf_count)
+            try:
+                for event in events:
+                    self._apply(event)
+            except ValueError:
+                self.tree = checkpoint
+                raise
+            self.next_block = range_end + 1
+
+        added = self.tree.leaf_count - leaves_before
+        self.LOGGER.debug(f"Synced keys tree up to block {to_block}: {added} new leaves, {self.tree.leaf_count} total")
+        return added
+
+    def get_keys_root(self) -> KeccakHash:
+        return self.tree.root()
+
+    def to_dict(self):
+        return {"tree": self.tree.to_dict(), "next_block": self.next_block}
+
+
+class CachedNodeOperatorRegistryMirror(NodeOperatorRegistryMirror):
+    """
+    NodeOperatorRegistryMirror that persists the branch and the block cursor after each sync
+    """
+    LOGGER = logging.getLogger(__name__ + ".CachedNodeOperatorRegistryMirror")
+
+    def __init__(
+            self, fetch_logs: LogFetcher, block_number: Callable[[], int], cache_key: str,
+            storage_folder: str = config.WEB3_CACHE_LOCATION, confirmations: int = config.WEB3_RPC_CACHE_CONFIRMATIONS
+    ):
+        self._cache = JsonDiskCache(storage_folder, metrics=CACHE_METRICS.namespace('web3'))
+        self._cache_key = ['node_operator_registry', cache_key]
+        raw = self._cache.read_cache(*self._cache_key)
+        super(CachedNodeOperatorRegistryMirror, self).__init__(
+            fetch_logs, block_number, KeysTreeBranch.from_dict(raw.get("tree")), int(raw.get("next_block", 0)),
+            confirmations
+        )
+
+    @classmethod
+    def for_contract(cls, w3: Web3, address: ChecksumAddress, **kwargs) -> 'CachedNodeOperatorRegistryMirror':
+        return super(CachedNodeOperatorRegistryMirror, cls).for_contract(w3, address, cache_key=address, **kwargs)
+
+    def sync(self, to_block: Optional[int] = None) -> int:
+        next_block = self.next_block
+        added = super(CachedNodeOperatorRegistryMirror, self).sync(to_block)
+        if self.next_block != next_block:
+            self._cache.save_cache(self.to_dict(), *self._cache_key)
+        return added
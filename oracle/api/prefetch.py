@@ -0,0 +1,91 @@
+import logging
+import threading
+
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+
+
+class BackgroundPrefetcher:
+    """
+    Warms caches for data expected to be needed soon, one request at a time in a background thread.
+
+    At most `max_pending` requests wait in the queue - a new request pushes out the oldest one, as the newest is
+    the most likely to be needed next. `cancel` drops pending requests and sets the cancellation event passed to
+    the running one - `warm` is expected to check it between its steps (e.g. before saving a fetched response).
+    Errors are logged and otherwise ignored: a failed prefetch only means the data is fetched when it is needed.
+    """
+    LOGGER = logging.getLogger(__name__ + ".BackgroundPrefetcher")
+
+    def __init__(self, warm: Callable[[str, threading.Event], None], max_pending: int = 1, name: str = "prefetch"):
+        self._warm = warm
+        self._name = name
+        self._pending: Deque[Tuple[str, threading.Event]] = deque(maxlen=max_pending)
+        self._running: Optional[Tuple[str, threading.Event]] = None
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, key: str):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Prefetcher is closed")
+            if (self._running is not None and self._running[0] == key) or any(k == key for k, _ in self._pending):
+                return
+            if len(self._pending) == self._pending.maxlen:
+                dropped, cancelled = self._pending[0]
+                cancelled.set()
+                self.LOGGER.debug(f"Dropping prefetch of {dropped} in favour of {key}")
+            self._pending.append((key, threading.Event()))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+
+    def cancel(self):
+        with self._condition:
+            for _, cancelled in self._pending:
+                cancelled.set()
+            self._pending.clear()
+            if self._running is not None:
+                self._running[1].set()
+            self._condition.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until there is no pending or running prefetch. Returns False on timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and self._running is None, timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        self.cancel()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def _next(self) -> Optional[Tuple[str, threading.Event]]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending or self._closed)
+            if not self._pending:
+                return None
+            self._running = self._pending.popleft()
+            return self._running
+
+    def _run(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            key, cancelled = task
+            try:
+                self.LOGGER.info(f"Prefetching {key}")
+                self._warm(key, cancelled)
+            except Exception:
+                self.LOGGER.exception(f"Prefetching {key} failed")
+            finally:
+                with self._condition:
+                    self._running = None
+                    self._condition.notify_all()
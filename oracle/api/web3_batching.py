@@ -0,0 +1,99 @@
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from eth_utils import to_bytes, to_text
+from web3 import HTTPProvider
+from web3._utils.encoding import FriendlyJsonSerde
+from web3._utils.request import make_post_request
+from web3.types import RPCEndpoint, RPCResponse
+
+
+class _PendingRequest:
+    def __init__(self, request_id: int, method: RPCEndpoint, params: Any):
+        self.request_id = request_id
+        self.method = method
+        self.params = params
+        self.response: Optional[RPCResponse] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+    def to_rpc_dict(self):
+        return {"jsonrpc": "2.0", "method": self.method, "params": self.params or [], "id": self.request_id}
+
+    def result(self) -> RPCResponse:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class BatchingHTTPProvider(HTTPProvider):
+    """
+    HTTPProvider that coalesces concurrent `eth_call`s into JSON-RPC batch requests.
+
+    The first thread to make a call waits up to `linger` seconds for other threads to join (or until `batch_size`
+    calls are queued), then sends everything queued so far as batches of up to `batch_size` calls,
+    up to `parallel_batches` of them at a time. Other methods go through the regular single-request path.
+    Readers that fan out calls over threads (e.g. lido_sdk multicall workers) get batched transparently.
+    """
+    logger = logging.getLogger(__name__ + ".BatchingHTTPProvider")
+    BATCHED_METHODS = {RPCEndpoint("eth_call")}
+
+    def __init__(
+            self, endpoint_uri: str, batch_size: int = 50, parallel_batches: int = 4, linger: float = 0.005,
+            **kwargs
+    ):
+        super(BatchingHTTPProvider, self).__init__(endpoint_uri, **kwargs)
+        self._batch_size = batch_size
+        self._linger = linger
+        self._executor = ThreadPoolExecutor(max_workers=parallel_batches, thread_name_prefix="web3-batch")
+        self._condition = threading.Condition()
+        self._pending: List[_PendingRequest] = []
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method not in self.BATCHED_METHODS:
+            return super(BatchingHTTPProvider, self).make_request(method, params)
+
+        request = _PendingRequest(next(self.request_counter), method, params)
+        with self._condition:
+            self._pending.append(request)
+            is_leader = len(self._pending) == 1
+            if len(self._pending) >= self._batch_size:
+                self._condition.notify_all()
+
+        if is_leader:
+            self._flush()
+        return request.result()
+
+    def _flush(self):
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._pending) >= self._batch_size, timeout=self._linger)
+            pending, self._pending = self._pending, []
+
+        for start in range(0, len(pending), self._batch_size):
+            self._executor.submit(self._send_batch, pending[start:start + self._batch_size])
+
+    def _send_batch(self, batch: List[_PendingRequest]):
+        self.logger.debug(f"Sending batch of {len(batch)} requests to {self.endpoint_uri}")
+        try:
+            request_data = to_bytes(text=FriendlyJsonSerde().json_encode([request.to_rpc_dict() for request in batch]))
+            raw_response = make_post_request(self.endpoint_uri, request_data, **self.get_request_kwargs())
+            responses = FriendlyJsonSerde().json_decode(to_text(raw_response))
+            if not isinstance(responses, list):
+                # Some nodes answer the whole batch with a single error object
+                raise ValueError(responses.get("error", responses))
+            by_id = {response.get("id"): response for response in responses}
+            for request in batch:
+                request.response = by_id.get(request.request_id) or {
+                    "jsonrpc": "2.0", "id": request.request_id,
+                    "error": {"code": -32603, "message": "Response missing from the batch"}
+                }
+        except Exception as exc:
+            for request in batch:
+                request.error = exc
+        finally:
+            for request in batch:
+                request.done.set()
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from web3 import Web3
+from web3.types import RPCEndpoint, RPCResponse
+
+from disk_cache.files import file_lock
+from disk_cache.metrics import CacheMetrics
+
+BlockPin = Tuple[Optional[int], Optional[str]]
+
+
+class RPCResponseStore:
+    """
+    Append-only log of immutable JSON-RPC results, one `<key>\\t<json>` line per response. Only keys and offsets are
+    kept in memory - results are read from the log on demand, with the `memory_entries` most recently used ones
+    kept decoded.
+    Several processes can append to the same log: appends are serialized with a file lock, and keys appended by
+    others are picked up on the next miss.
+    """
+    LOGGER = logging.getLogger(__name__ + ".RPCResponseStore")
+
+    def __init__(self, path: str, memory_entries: int = 10000, metrics: Optional[CacheMetrics] = None):
+        self._path = path
+        self._memory_entries = memory_entries
+        self._metrics = metrics
+        self._offsets: Dict[str, int] = {}
+        self._scanned = 0
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._scan()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _scan(self):
+        """
+        Indexes lines appended since the last scan - a trailing line without a newline is still being written
+        """
+        try:
+            log = open(self._path, "rb")
+        except FileNotFoundError:
+            return
+        with log:
+            log.seek(self._scanned)
+            offset = self._scanned
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break
+                key, separator, _ = line.partition(b"\t")
+                if separator:
+                    self._offsets[key.decode()] = offset
+                offset += len(line)
+            self._scanned = offset
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                if self._metrics is not None:
+                    self._metrics.memory_hit()
+                return self._memory[key]
+            if key not in self._offsets:
+                self._scan()
+            offset = self._offsets.get(key)
+            if offset is None:
+                if self._metrics is not None:
+                    self._metrics.miss()
+                return None
+
+            start = time.perf_counter() if self._metrics is not None else None
+            with open(self._path, "rb") as log:
+                log.seek(offset)
+                line = log.readline()
+            result = json.loads(line.partition(b"\t")[2])
+            if self._metrics is not None:
+                self._metrics.hit(len(line))
+                self._metrics.decoded(time.perf_counter() - start)
+            self._remember(key, result)
+            return result
+
+    def put(self, key: str, result: Any):
+        line = key.encode() + b"\t" + json.dumps(result, separators=(",", ":")).encode() + b"\n"
+        start = time.perf_counter() if self._metrics is not None else None
+        with self._lock, file_lock(self._path):
+            self._scan()
+            if key in self._offsets:
+                return
+            with open(self._path, "ab") as log:
+                if log.tell() > self._scanned:
+                    # a writer died in the middle of a line - drop the partial line
+                    log.truncate(self._scanned)
+                log.write(line)
+            self._offsets[key] = self._scanned
+            self._scanned += len(line)
+            self._remember(key, result)
+        if self._metrics is not None:
+            self._metrics.written(len(line), time.perf_counter() - start)
+
+    def _remember(self, key: str, result: Any):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+
+class RPCCacheMiddleware:
+    """
+    web3 middleware answering calls pinned to a block from an RPCResponseStore.
+
+    A call is pinned if its block identifier is a block hash, or a block number at least `confirmations` blocks
+    below the chain head - results of more recent blocks could still be reorged. The head is looked up with
+    `eth_blockNumber` at most every `head_ttl` seconds, and taken from `eth_blockNumber` responses passing through.
+    `latest`, `pending` and other tags always go to the node, as do calls that failed or returned nothing.
+    Responses are stored per chain id and genesis block, so nodes of several networks - and restarted local dev
+    chains, which keep their chain id - can share the storage folder.
+
+    Has to be the innermost middleware - it stores raw responses, before web3 formats them:
+    `w3.middleware_onion.inject(RPCCacheMiddleware(folder), layer=0)`
+    """
+    LOGGER = logging.getLogger(__name__ + ".RPCCacheMiddleware")
+    # method -> position of the block identifier in params
+    BLOCK_PARAMS: Dict[str, int] = {
+        "eth_call": 1,
+        "eth_getBalance": 1,
+        "eth_getCode": 1,
+        "eth_getTransactionCount": 1,
+        "eth_getStorageAt": 2,
+        "eth_getBlockByNumber": 0,
+        "eth_getBlockByHash": 0,
+    }
+    BLOCK_HASH_LENGTH = 66
+
+    def __init__(
+            self, storage_folder: str, confirmations: int = 64, head_ttl: float = 12.0, memory_entries: int = 10000,
+            metrics: Optional[CacheMetrics] = None, clock: Callable[[], float] = time.monotonic
+    ):
+        self._storage_folder = storage_folder
+        self._confirmations = confirmations
+        self._head_ttl = head_ttl
+        self._memory_entries = memory_entries
+        self._metrics = metrics
+        self._clock = clock
+        self._store: Optional[RPCResponseStore] = None
+        self._head: Optional[int] = None
+        self._head_checked = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3):
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            if method == "eth_blockNumber":
+                response = make_request(method, params)
+                if "error" not in response:
+                    self._observe_head(int(response["result"], 16))
+                return response
+
+            pin = self._block_pin(method, params)
+            if pin is None or not self._is_final(pin, make_request):
+                return make_request(method, params)
+
+            store = self._get_store(make_request)
+            key = self.cache_key(method, params)
+            result = store.get(key)
+            if result is not None:
+                return {"jsonrpc": "2.0", "id": None, "result": result}
+
+            response = make_request(method, params)
+            if "error" not in response and response.get("result") is not None:
+                store.put(key, response["result"])
+            return response
+        return middleware
+
+    @classmethod
+    def cache_key(cls, method: str, params: Any) -> str:
+        serialized = json.dumps([method, params], sort_keys=True, separators=(",", ":"), default=repr)
+        return hashlib.blake2b(serialized.encode(), digest_size=20).hexdigest()
+
+    @classmethod
+    def _parse_block(cls, block: Any) -> Optional[BlockPin]:
+        if isinstance(block, dict):
+            # EIP-1898 block parameter
+            if "blockHash" in block:
+                return None, block["blockHash"]
+            return cls._parse_block(block.get("blockNumber"))
+        if isinstance(block, int) and not isinstance(block, bool):
+            return block, None
+        if not isinstance(block, str):
+            return None
+        if block == "earliest":
+            return 0, None
+        if not block.startswith("0x"):
+            return None
+        if len(block) == cls.BLOCK_HASH_LENGTH:
+            return None, block
+        return int(block, 16), None
+
+    @classmethod
+    def _block_pin(cls, method: str, params: Any) -> Optional[BlockPin]:
+        if method == "eth_getLogs":
+            log_filter = params[0] if params else {}
+            if "blockHash" in log_filter:
+                return None, log_filter["blockHash"]
+            from_block = cls._parse_block(log_filter.get("fromBlock", "latest"))
+            to_block = cls._parse_block(log_filter.get("toBlock", "latest"))
+            return to_block if from_block is not None else None
+
+        position = cls.BLOCK_PARAMS.get(method)
+        if position is None or len(params) <= position:
+            return None
+        return cls._parse_block(params[position])
+
+    def _is_final(self, pin: BlockPin, make_request: Callable[[RPCEndpoint, Any], RPCResponse]) -> bool:
+        number, block_hash = pin
+        if block_hash is not None:
+            return True
+        with self._lock:
+            head, head_checked = self._head, self._head_checked
+        if head is not None and (number <= head - self._confirmations or self._clock() - head_checked < self._head_ttl):
+            return number <= head - self._confirmations
+        # requested without holding the lock - calls of other threads do not wait for it
+        response = make_request(RPCEndpoint("eth_blockNumber"), [])
+        return number <= self._observe_head(int(response["result"], 16)) - self._confirmations
+
+    def _observe_head(self, head: int) -> int:
+        with self._lock:
+            if self._head is None or head >= self._head:
+                self._head, self._head_checked = head, self._clock()
+            return self._head
+
+    def _get_store(self, make_request: Callable[[RPCEndpoint, Any], RPCResponse]) -> RPCResponseStore:
+        with self._lock:
+            if self._store is None:
+                chain_id = int(make_request(RPCEndpoint("eth_chainId"), [])["result"], 16)
+                genesis = make_request(RPCEndpoint("eth_getBlockByNumber"), ["0x0", False])["result"]["hash"]
+                path = os.path.join(self._storage_folder, f"rpc_responses.{chain_id}.{genesis[2:18]}.log")
+                self.LOGGER.debug(f"Caching immutable RPC responses in {path}")
+                self._store = RPCResponseStore(path, self._memory_entries, self._metrics)
+            return self._store
@@ -1,16 +1,28 @@
 from starkware.cairo.bootloaders.generate_fact import get_program_output
-from typing import List, TypeVar, Generic, Callable, Dict, Any
+from typing import IO, List, TypeVar, Generic, Callable, Dict, Any, Optional, Sequence, Tuple
 
 import tempfile
 
+import hashlib
 import logging
 import json
+import os
+import re
 import time
 
 from starkware.cairo.bootloaders.hash_program import compute_program_hash_chain
+from starkware.cairo.lang.compiler.program import Program
+from starkware.cairo.lang.vm.cairo_pie import CairoPie
+from starkware.cairo.lang.vm.cairo_runner import CairoRunner
+from starkware.cairo.lang.vm.memory_dict import MemoryDict
+from starkware.cairo.lang.vm.security import verify_secure_runner
+from starkware.cairo.lang.version import __version__ as CAIRO_LANG_VERSION
 from starkware.cairo.sharp.sharp_client import init_client
 
 import config
+from disk_cache.cache import JsonDiskCache
+from disk_cache.files import atomic_write
+from disk_cache.metrics import CACHE_METRICS
 from json_protocol import CustomJsonEncoder
 
 T = TypeVar('T')
@@ -19,60 +31,367 @@ JobId = str
 FactId = str
 
 
+class CompiledProgramCache:
+    """
+    Compiled Cairo programs and their hashes on disk, keyed by a digest of the program's sources - the program file
+    and every module it imports from `cairo_path`, recursively - plus the compiler version and location.
+    Modules not found on `cairo_path` (e.g. `starkware.cairo.common`) ship with the compiler, so its version
+    covers them. Concurrent processes compile a missing program only once.
+    """
+    LOGGER = logging.getLogger(__name__ + ".CompiledProgramCache")
+    IMPORT = re.compile(r"^\s*from\s+([\w.]+)\s+import\b", re.MULTILINE)
+    NAMESPACE = 'programs'
+
+    def __init__(self, storage_folder: str, compiler_version: str = CAIRO_LANG_VERSION):
+        self._cache = JsonDiskCache(storage_folder, compression={}, metrics=CACHE_METRICS.namespace('cairo'))
+        self._compiler_version = compiler_version
+
+    @classmethod
+    def source_files(cls, program_path: str, cairo_path: Sequence[str]) -> Dict[str, str]:
+        """
+        Module name -> path of the program and every module reachable from it through `cairo_path`
+        """
+        found = {'__main__': program_path}
+        queue = [program_path]
+        while queue:
+            with open(queue.pop()) as source_file:
+                source = source_file.read()
+            for module in cls.IMPORT.findall(source):
+                if module in found:
+                    continue
+                relative_path = os.path.join(*module.split(".")) + ".cairo"
+                for folder in cairo_path:
+                    path = os.path.join(folder, relative_path)
+                    if os.path.isfile(path):
+                        found[module] = path
+                        queue.append(path)
+                        break
+        return found
+
+    def source_digest(self, program_path: str, cairo_path: Sequence[str], compiler: str = "") -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{self._compiler_version}\0{compiler}\0".encode())
+        for module, path in sorted(self.source_files(program_path, cairo_path).items()):
+            with open(path, "rb") as source_file:
+                content = source_file.read()
+            digest.update(f"{module}\0{len(content)}\0".encode())
+            digest.update(content)
+        return digest.hexdigest()
+
+    def _load(self, digest: str) -> Optional[Tuple[Program, int]]:
+        cached = self._cache.read_cache(self.NAMESPACE, digest)
+        if not cached:
+            return None
+        return Program.load(data=cached["program"]), int(cached["program_hash"], 16)
+
+    def load_or_compile(
+            self, program_path: str, cairo_path: Sequence[str], compile: Callable[[], Program], compiler: str = ""
+    ) -> Tuple[Program, int]:
+        """
+        Compiled program and its hash - `compile` is only called if the sources, or the compiler, changed
+        """
+        digest = self.source_digest(program_path, cairo_path, compiler)
+        loaded = self._load(digest)
+        if loaded is not None:
+            self.LOGGER.debug(f"Loaded compiled {program_path} from cache ({digest})")
+            return loaded
+
+        with self._cache.write_lock(self.NAMESPACE, digest):
+            loaded = self._load(digest)
+            if loaded is not None:
+                return loaded
+            program = compile()
+            program_hash = compute_program_hash_chain(program)
+            self._cache.save_cache(
+                {"program": program.dump(), "program_hash": hex(program_hash)}, self.NAMESPACE, digest
+            )
+            return program, program_hash
+
+
+class _HashWriter:
+    def __init__(self, digest):
+        self._digest = digest
+
+    def write(self, value: str):
+        self._digest.update(value.encode())
+
+
+class CairoRunCache:
+    """
+    Results of previous Cairo runs, keyed by a digest of the program hash and the program input - the output, and
+    the SHARP job and fact once submitted, are kept in a json record, and the CairoPie as a zip next to it, written
+    first, so a record always has its PIE. Only the `max_runs` most recently used runs are kept.
+    """
+    LOGGER = logging.getLogger(__name__ + ".CairoRunCache")
+    NAMESPACE = 'runs'
+    PIE_EXTENSION = ".pie.zip"
+
+    def __init__(self, storage_folder: str, max_runs: int = 8):
+        self._folder = os.path.join(storage_folder, self.NAMESPACE)
+        self._cache = JsonDiskCache(storage_folder, compression={}, metrics=CACHE_METRICS.namespace('cairo'))
+        self._max_runs = max_runs
+
+    @classmethod
+    def input_digest(cls, program_hash: int, write_input: Callable[[IO[str]], None]) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{program_hash:#x}\0".encode())
+        write_input(_HashWriter(digest))
+        return digest.hexdigest()
+
+    def _pie_path(self, digest: str) -> str:
+        return os.path.join(self._folder, digest + self.PIE_EXTENSION)
+
+    def load(self, digest: str) -> Optional[Dict[str, Any]]:
+        """
+        Record of the run - `output`, and `job_id` and `fact` if it was submitted
+        """
+        record = self._cache.read_cache(self.NAMESPACE, digest)
+        if not record:
+            return None
+        try:
+            os.utime(self._pie_path(digest))
+        except FileNotFoundError:
+            return None
+        return record
+
+    def load_pie(self, digest: str) -> Optional[CairoPie]:
+        try:
+            with open(self._pie_path(digest), "rb") as pie_file:
+                return CairoPie.from_file(pie_file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, digest: str, output: List[int], cairo_pie: CairoPie):
+        with self._cache.write_lock(self.NAMESPACE, digest):
+            with atomic_write(self._pie_path(digest)) as pie_file:
+                cairo_pie.to_file(pie_file)
+            self._cache.save_cache({"output": output}, self.NAMESPACE, digest)
+        self._prune()
+
+    def update(self, digest: str, **fields):
+        with self._cache.write_lock(self.NAMESPACE, digest):
+            record = self._cache.read_cache(self.NAMESPACE, digest)
+            if record:
+                self._cache.save_cache({**record, **fields}, self.NAMESPACE, digest)
+
+    def _prune(self):
+        pies = [name for name in os.listdir(self._folder) if name.endswith(self.PIE_EXTENSION)]
+        if len(pies) <= self._max_runs:
+            return
+        pies.sort(key=lambda name: os.path.getmtime(os.path.join(self._folder, name)), reverse=True)
+        for name in pies[self._max_runs:]:
+            digest = name[:-len(self.PIE_EXTENSION)]
+            self.LOGGER.debug(f"Removing run {digest}")
+            with self._cache.write_lock(self.NAMESPACE, digest):
+                self._cache.clear_cache(self.NAMESPACE, digest)
+                try:
+                    os.remove(self._pie_path(digest))
+                except FileNotFoundError:
+                    pass
+
+
+class InProcessCairoRunner:
+    """
+    Runs compiled programs with the cairo-lang runner in this process - same steps as
+    `cairo-run --layout=<layout> --cairo_pie_output=...`, without starting a process, re-loading the program and
+    passing the program, input and PIE through files. Hints get `program_input` as is.
+    """
+    LOGGER = logging.getLogger(__name__ + ".InProcessCairoRunner")
+
+    def __init__(self, layout: str = "all"):
+        self._layout = layout
+
+    def run(self, program: Program, program_input: Dict[str, Any]) -> CairoPie:
+        runner = CairoRunner(program=program, layout=self._layout, memory=MemoryDict(), proof_mode=False)
+        runner.initialize_segments()
+        end = runner.initialize_main_entrypoint()
+        runner.initialize_vm(hint_locals={"program_input": program_input})
+        runner.run_until_pc(end)
+        runner.original_steps = runner.vm.current_step
+        runner.end_run(disable_trace_padding=False)
+        runner.read_return_values()
+        verify_secure_runner(runner)
+        self.LOGGER.debug(f"Program finished in {runner.vm.current_step} steps")
+        return runner.get_cairo_pie()
+
+
+class _TeeWriter:
+    def __init__(self, *targets: IO[str]):
+        self._targets = targets
+
+    def write(self, value: str):
+        for target in self._targets:
+            target.write(value)
+
+
 class CairoInterface(Generic[T]):
+    """
+    Program input is streamed into the input file (and the `store_input` copy, in the same pass) as compact json -
+    by `input_writer` if given, otherwise by encoding the output of `serializer` chunk by chunk.
+    With `config.CAIRO_INPUT_PRETTY`, input is written indented, with sorted keys, for debugging.
+
+    With a `runner` (by default, if `config.CAIRO_RUNNER` is 'in_process'), the program is run in this process on the
+    `serializer` output directly, and input is only written for `store_input`.
+
+    With a `run_cache` (by default, if `config.CAIRO_RUN_CACHE` is set), runs are memoized by a digest of the
+    program hash and the compact program input - an unchanged input reuses the previous output and PIE, and the job
+    of the previous submission instead of submitting again, unless that job failed. A PIE pruned meanwhile is a miss,
+    and the program is run again.
+    """
     LOGGER = logging.getLogger(__name__ + ".CairoInterface")
+    FAILED_JOB_STATUSES = ("FAILED", "INVALID")
 
     def __init__(
             self,
             bin_dir: str, node_rpc_url: str, program_path: str, serializer: Callable[[T], Dict[str, Any]],
-            cairo_path: str = None
+            cairo_path: str = None, program_cache: Optional[CompiledProgramCache] = None,
+            input_writer: Optional[Callable[[T, IO[str]], None]] = None,
+            runner: Optional[InProcessCairoRunner] = None, run_cache: Optional[CairoRunCache] = None
     ):
         self.LOGGER.info(f"Initializing Cairo client")
         self._serializer = serializer
+        self._input_writer = input_writer
         self._client = init_client(bin_dir=bin_dir, node_rpc_url=node_rpc_url)
         self._program = None
+        self._program_hash = None
         self._cairo_path = cairo_path if cairo_path else config.CAIRO_CODE_LOCATION
         self._program_path = program_path
         self._cairo_pie = None
+        self._run_digest = None
+        self._run_record = None
+        self._run_payload = None
+        if program_cache is None and config.CAIRO_PROGRAM_CACHE:
+            program_cache = CompiledProgramCache(config.CAIRO_CACHE_LOCATION)
+        self._program_cache = program_cache
+        if runner is None and config.CAIRO_RUNNER == 'in_process':
+            runner = InProcessCairoRunner()
+        self._runner = runner
+        if run_cache is None and config.CAIRO_RUN_CACHE:
+            run_cache = CairoRunCache(config.CAIRO_CACHE_LOCATION, config.CAIRO_RUN_CACHE_RUNS)
+        self._run_cache = run_cache
+
+    def _compile(self) -> Program:
+        compile_flags = [f'--cairo_path={self._cairo_path}']
+        self.LOGGER.info(f"Compiling Cairo program: {self._program_path}")
+        return self._client.compile_cairo(source_code_path=self._program_path, flags=compile_flags)
 
     @property
     def program(self):
         if self._program is None:
-            compile_flags = [f'--cairo_path={self._cairo_path}']
-            self.LOGGER.info(f"Compiling Cairo program: {self._program_path}")
-            self._program = self._client.compile_cairo(source_code_path=self._program_path, flags=compile_flags)
+            if self._program_cache is None:
+                self._program = self._compile()
+            else:
+                self._program, self._program_hash = self._program_cache.load_or_compile(
+                    self._program_path, self._cairo_path.split(":"), self._compile,
+                    compiler=self._client.cairo_compiler_path
+                )
         return self._program
 
     @property
     def program_hash(self):
-        return compute_program_hash_chain(self.program)
+        if self._program_hash is None:
+            self._program_hash = compute_program_hash_chain(self.program)
+        return self._program_hash
+
+    def _write_compact(self, payload: T, out: IO[str]):
+        if self._input_writer is not None:
+            self._input_writer(payload, out)
+        else:
+            json.dump(self._serializer(payload), out, separators=(",", ":"), cls=CustomJsonEncoder)
+
+    def write_input(self, payload: T, out: IO[str]):
+        if config.CAIRO_INPUT_PRETTY:
+            json.dump(self._serializer(payload), out, indent=4, sort_keys=True, cls=CustomJsonEncoder)
+        else:
+            self._write_compact(payload, out)
+
+    def _store_input(self, payload: T, store_input: str):
+        self.LOGGER.debug(f"Storing input at {store_input}")
+        with open(store_input, 'w') as target_file:
+            self.write_input(payload, target_file)
 
     def run(self, payload: T, store_input: str = None) -> List[int]:
-        self.LOGGER.info("Serializing payload to json")
-        payload = self._serializer(payload)
-        program_input_serialized = json.dumps(payload, indent=4, sort_keys=True, cls=CustomJsonEncoder)
+        digest = self._run_digest = self._run_record = self._run_payload = self._cairo_pie = None
+        if self._run_cache is not None:
+            digest = self._run_cache.input_digest(self.program_hash, lambda out: self._write_compact(payload, out))
+            record = self._run_cache.load(digest)
+            if record is not None:
+                self.LOGGER.info(f"Program input unchanged - reusing the previous run ({digest})")
+                if store_input:
+                    self._store_input(payload, store_input)
+                # the PIE is only loaded if it is needed - to submit it, or to compute a fact not recorded yet
+                self._run_digest, self._run_record, self._run_payload = digest, record, payload
+                return record["output"]
+        return self._execute(payload, store_input, digest)
 
+    def _execute(self, payload: T, store_input: Optional[str], digest: Optional[str]) -> List[int]:
+        if self._runner is not None:
+            self._cairo_pie = self._run_in_process(payload, store_input)
+        else:
+            self._cairo_pie = self._run_subprocess(payload, store_input)
+        self.LOGGER.debug(f"Cairo program run successfully - reading output")
+        output = get_program_output(self._cairo_pie)
+        if digest is not None:
+            self._run_cache.save(digest, output, self._cairo_pie)
+            self._run_digest, self._run_record = digest, {"output": output}
+        return output
+
+    def _run_in_process(self, payload: T, store_input: Optional[str]) -> CairoPie:
         if store_input:
-            self.LOGGER.debug(f"Storing input at {store_input}")
-            with open(store_input, 'w') as target_file:
-                target_file.write(program_input_serialized)
+            self._store_input(payload, store_input)
+        program = self.program
+        self.LOGGER.info("Running Cairo program in-process")
+        return self._runner.run(program, self._serializer(payload))
 
+    def _run_subprocess(self, payload: T, store_input: Optional[str]) -> CairoPie:
         with tempfile.NamedTemporaryFile(mode="w") as program_input_file:
-            program_input_file.write(program_input_serialized)
+            self.LOGGER.info("Writing program input")
+            if store_input:
+                self.LOGGER.debug(f"Storing input at {store_input}")
+                with open(store_input, 'w') as target_file:
+                    self.write_input(payload, _TeeWriter(program_input_file, target_file))
+            else:
+                self.write_input(payload, program_input_file)
             program_input_file.flush()
-            self._cairo_pie = self._client.run_program(self.program, program_input_file.name)
-            self.LOGGER.debug(f"Cairo program run successfully - reading output")
-            return get_program_output(self._cairo_pie)
+            return self._client.run_program(self.program, program_input_file.name)
+
+    @property
+    def cairo_pie(self) -> CairoPie:
+        if self._cairo_pie is None and self._run_digest is not None:
+            self._cairo_pie = self._run_cache.load_pie(self._run_digest)
+            if self._cairo_pie is None:
+                self.LOGGER.info(f"PIE of the previous run {self._run_digest} was removed - running again")
+                self._execute(self._run_payload, None, self._run_digest)
+        assert self._cairo_pie is not None, "Program should be run before its PIE is used"
+        return self._cairo_pie
+
+    def _record_run(self, **fields):
+        if self._run_record is not None:
+            self._run_record.update(fields)
+            self._run_cache.update(self._run_digest, **fields)
 
     def submit(self) -> JobId:
-        assert self._cairo_pie is not None, "Program should be run before get_fact can be called"
-        job_id = self._client.submit_cairo_pie(self._cairo_pie)
+        record = self._run_record or {}
+        if record.get("job_id") is not None:
+            if record.get("fact") is not None and self._client.fact_registered(record["fact"]):
+                self.LOGGER.info(f"Fact {record['fact']} is already registered - reusing job id {record['job_id']}")
+                return record["job_id"]
+            status = self._client.get_job_status(record["job_id"])
+            if not status.startswith(self.FAILED_JOB_STATUSES):
+                self.LOGGER.info(f"Job {record['job_id']} of the previous run is {status} - reusing it")
+                return record["job_id"]
+            self.LOGGER.info(f"Job {record['job_id']} of the previous run is {status} - submitting again")
+        job_id = self._client.submit_cairo_pie(self.cairo_pie)
         self.LOGGER.info("Submitted job id: %s", job_id)
+        self._record_run(job_id=job_id)
         return job_id
 
     def get_fact(self) -> FactId:
-        assert self._cairo_pie is not None, "Program should be run before get_fact can be called"
-        return self._client.get_fact(self._cairo_pie)
+        fact = self._run_record.get("fact") if self._run_record is not None else None
+        if fact is None:
+            fact = self._client.get_fact(self.cairo_pie)
+            self._record_run(fact=fact)
+        return fact
 
     def wait_until_fact_registered_and_valid(self, job_id: JobId, fact_id: FactId, timeout: int = 300):
         self.LOGGER.info(f"Waiting for the fact {fact_id} to be registered on-chain...")
@@ -7,6 +7,18 @@ PROJECT_ROOT = os.path.dirname(__file__)
 CONFIG_LOCATION = os.path.join(PROJECT_ROOT, 'config.json')
 CAIRO_CODE_LOCATION = os.path.join(PROJECT_ROOT, 'cairo')
 INTEGRATION_TESTS = os.path.join(PROJECT_ROOT, 'integration_test')
+# compiled Cairo programs - next to the sources rather than in the working directory, so that main.py and the
+# integration tests share it
+CAIRO_CACHE_LOCATION = os.path.join(PROJECT_ROOT, 'cache', 'cairo')
+CAIRO_PROGRAM_CACHE = True
+# write Cairo program input indented, with sorted keys - readable, but several times larger
+CAIRO_INPUT_PRETTY = False
+# 'in_process' - run programs with the cairo-lang runner in the oracle process
+# 'subprocess' - run programs with cairo-run, through files
+CAIRO_RUNNER = 'in_process'
+# reuse output and PIE of the last CAIRO_RUN_CACHE_RUNS runs if program and input did not change
+CAIRO_RUN_CACHE = True
+CAIRO_RUN_CACHE_RUNS = 8
 
 with open(CONFIG_LOCATION) as json_file:
     raw_config = json.load(json_file)
@@ -69,6 +81,43 @@ WEB3_CACHE_LOCATION = "./cache/web3"
 LIDO_CACHE_LOCATION = "./cache/lido"
 ETH2_CACHE_LOCATION = "./cache/eth2"
 USE_CACHE = True
+# compression of json cache entries by namespace (first part of the cache key) - 'gzip', 'lzma' or absent for plain json
+CACHE_COMPRESSION = {
+    'validators': 'gzip',
+}
+# json cache lists longer than this are split into shards by namespace, shards are loaded by CACHE_LOAD_WORKERS processes
+CACHE_SHARD_SIZE = {
+    'validators': 50000,
+}
+CACHE_LOAD_WORKERS = os.cpu_count() or 1
+# beacon state cache eviction - total size budget (least recently used entries go first) and TTL per namespace
+ETH2_CACHE_MAX_BYTES = 20 * 2**30
+CACHE_TTL = {
+    'validators': 7 * 24 * 3600,
+}
+# in-process cache of decoded beacon states, bytes (estimated size of the decoded validators)
+ETH2_CACHE_MEMORY_BYTES = 2 * 2**30
+# cache hit/miss counters, bytes and decode timings per namespace (eth2, lido, web3) - see disk_cache.metrics.
+# Reported every CACHE_METRICS_INTERVAL seconds to the log, or as json into CACHE_METRICS_FILE if set
+CACHE_METRICS_ENABLED = False
+CACHE_METRICS_INTERVAL = 600
+CACHE_METRICS_FILE = None
+# 'columnar' - binary fixed-width columns, see disk_cache.columnar; 'json' - plain json files;
+# 'snapshots' - base snapshot + per-state deltas, see disk_cache.snapshots - for keeping long history of states
+ETH2_CACHE_FORMAT = 'columnar'
+# deposit signatures are not used by the oracle - only keep them in the Lido key cache if needed for debugging
+LIDO_CACHE_SIGNATURES = False
+
+# eth_call batching - see api.web3_batching.BatchingHTTPProvider. WEB3_BATCH_SIZE = 1 disables batching
+WEB3_BATCH_SIZE = 50
+WEB3_PARALLEL_BATCHES = 4
+# persistent cache of responses to calls pinned to a block hash or a block number at least
+# WEB3_RPC_CACHE_CONFIRMATIONS blocks deep, see api.web3_cache.RPCCacheMiddleware
+WEB3_RPC_CACHE = True
+WEB3_RPC_CACHE_CONFIRMATIONS = 64
+# lido_sdk multicall - calls per Multicall.aggregate and concurrent aggregate calls
+LIDO_MULTICALL_MAX_BUNCH = 275
+LIDO_MULTICALL_MAX_WORKERS = 6
 
 class CairoApps:
     MERKLE_TREE = os.path.join(CAIRO_CODE_LOCATION, 'merkle_tree.cairo')
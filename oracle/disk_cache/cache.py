@@ -1,76 +1,423 @@
 from __future__ import annotations
 
+import gzip
 import json
+import lzma
+import multiprocessing
 import os
 import logging
+import time
 
-from typing import Union, Type, Generic, Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import IO, Any, Iterator, List, Union, Type, Generic, Callable, Iterable, Dict, Optional, Literal
 
-from json_protocol import CustomJsonEncoder, CustomJsonDecoder, JsonObject, JsonObjectOrList, T
+import config
+from disk_cache.files import atomic_write, file_lock
+from disk_cache.index import CacheIndex
+from disk_cache.memory import FileStamp, MemoryTier
+from disk_cache.metrics import CacheMetrics
+
+from json_protocol import CustomJsonEncoder, JsonArrayStream, JsonObject, JsonObjectOrList, T
+
+
+Compression = Literal['gzip', 'lzma']
+
+
+def _decode_shard(path: str, decoder: Type[json.JSONDecoder], parser: Optional[Callable[[Any], Any]]) -> List[Any]:
+    """
+    Loads a single shard - runs in a worker process, so arguments are pickled: parser has to be a module-level
+    function or a method of a module-level class
+    """
+    with JsonDiskCache.open_for_read(path) as shard_file:
+        values = json.load(shard_file, cls=decoder)
+    return [parser(value) for value in values] if parser is not None else values
 
 
 class JsonDiskCache:
+    """
+    Json files under storage_folder, one per key. Entries can be stored compressed - compression is chosen
+    per namespace (the first key part), and existing entries are read in whatever format they were written in.
+
+    Several processes can share a storage folder: writes go to a temporary file that is renamed over the entry, so
+    readers never need to lock, and writers of the same entry are serialized by `write_lock`.
+    With an `index`, entry sizes and access times are tracked for TTL and size-based eviction. With `metrics`, hits,
+    misses, bytes and timings are counted.
+
+    Lists longer than the namespace's `shard_size` are split into index-range shards, listed in order by a
+    `<entry>.shards.json` manifest. Shard files of each write have a fresh name, and the manifest is replaced after
+    all of them are written, so readers always see a complete set. Shards are decoded in parallel by up to
+    `load_workers` processes.
+    """
     FILE_EXTENSION = "json"
+    SHARDS_EXTENSION = ".shards.json"
     LOGGER = logging.getLogger(__name__ + ".JsonDiskCache")
+    COMPRESSION_EXTENSIONS: Dict[Optional[Compression], str] = {None: "", 'gzip': ".gz", 'lzma': ".xz"}
+    OPENERS = {None: open, 'gzip': gzip.open, 'lzma': lzma.open}
+    MAGIC_BYTES = {b"\x1f\x8b": 'gzip', b"\xfd7zXZ\x00": 'lzma'}
 
     def __init__(
             self, storage_folder: str,
             encoder: Type[json.JSONEncoder] = CustomJsonEncoder,
-            decoder: Type[json.JSONDecoder] = CustomJsonDecoder
+            decoder: Type[json.JSONDecoder] = json.JSONDecoder,
+            compression: Optional[Dict[str, Compression]] = None,
+            index: Optional[CacheIndex] = None,
+            shard_size: Optional[Dict[str, int]] = None,
+            load_workers: Optional[int] = None,
+            metrics: Optional[CacheMetrics] = None
     ):
         self._storage_folder = storage_folder
         self._encoder = encoder
         self._decoder = decoder
+        self._compression = compression if compression is not None else config.CACHE_COMPRESSION
+        self._index = index
+        self._shard_size = shard_size if shard_size is not None else config.CACHE_SHARD_SIZE
+        self._load_workers = load_workers if load_workers is not None else config.CACHE_LOAD_WORKERS
+        self._metrics = metrics
+
+    def _make_path(self, *parts: str, compression: Optional[Compression] = None):
+        return os.path.join(self._storage_folder, *parts) + ".json" + self.COMPRESSION_EXTENSIONS[compression]
+
+    def write_lock(self, *parts: str):
+        """
+        Exclusive lock over the entry, across processes - e.g. to fetch and save a missing entry only once
+        """
+        return file_lock(os.path.join(self._storage_folder, *parts))
+
+    def _compression_for(self, *parts: str) -> Optional[Compression]:
+        return self._compression.get(parts[0]) if parts else None
+
+    def _existing_path(self, *parts: str) -> Optional[str]:
+        preferred = self._compression_for(*parts)
+        candidates = [preferred] + [option for option in self.COMPRESSION_EXTENSIONS if option != preferred]
+        for compression in candidates:
+            path = self._make_path(*parts, compression=compression)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _manifest_path(self, *parts: str) -> str:
+        return os.path.join(self._storage_folder, *parts) + self.SHARDS_EXTENSION
+
+    def _read_manifest(self, *parts: str) -> Optional[Dict]:
+        try:
+            with open(self._manifest_path(*parts)) as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return None
+
+    def _shard_paths(self, manifest: Dict, *parts: str) -> List[str]:
+        folder = os.path.dirname(os.path.join(self._storage_folder, *parts))
+        return [os.path.join(folder, shard["file"]) for shard in manifest["shards"]]
+
+    def _stamp_path(self, *parts: str) -> Optional[str]:
+        """
+        File replaced on every write of the entry - the manifest for sharded entries
+        """
+        if os.path.exists(self._manifest_path(*parts)):
+            return self._manifest_path(*parts)
+        return self._existing_path(*parts)
+
+    @classmethod
+    def _detect_compression(cls, path: str) -> Optional[Compression]:
+        with open(path, "rb") as raw_file:
+            head = raw_file.read(6)
+        for magic, compression in cls.MAGIC_BYTES.items():
+            if head.startswith(magic):
+                return compression
+        return None
+
+    @classmethod
+    def open_for_read(cls, path: str) -> IO[str]:
+        return cls.OPENERS[cls._detect_compression(path)](path, "rt")
+
+    def pin(self, *parts: str):
+        """
+        Excludes the entry from eviction - no-op without an index
+        """
+        if self._index is not None:
+            self._index.pin(parts)
+
+    def unpin(self, *parts: str):
+        if self._index is not None:
+            self._index.unpin(parts)
 
-    def _make_path(self, *parts: str):
-        return os.path.join(self._storage_folder, *parts) + ".json"
+    def _record_miss(self, parts) -> None:
+        self.LOGGER.debug(f"Cache miss - {parts}")
+        if self._metrics is not None:
+            self._metrics.miss()
+
+    def _read(self, read: Callable[[IO[str]], T], *parts: str) -> Optional[T]:
+        if self._index is not None and self._index.expire(parts):
+            self.LOGGER.debug(f"Cache entry expired - {parts}")
+            self._record_miss(parts)
+            return None
+        # entry can be replaced or converted to another format between looking it up and opening it - retry once
+        for _ in range(2):
+            target_path = self._existing_path(*parts)
+            if target_path is None:
+                break
+            try:
+                start = time.perf_counter() if self._metrics is not None else None
+                with self.open_for_read(target_path) as json_file:
+                    self.LOGGER.debug(f"Cache hit - {parts}")
+                    value = read(json_file)
+                    if self._metrics is not None:
+                        self._metrics.hit(os.fstat(json_file.fileno()).st_size)
+                        self._metrics.decoded(time.perf_counter() - start)
+                if self._index is not None:
+                    self._index.touch(parts)
+                return value
+            except FileNotFoundError:
+                continue
+        self._record_miss(parts)
+        return None
+
+    def iter_cache(self, *parts: str) -> Iterator[Any]:
+        """
+        Streams elements of a cached json array - the file is read and decoded incrementally,
+        so memory use does not grow with the size of the entry
+        """
+        if self._index is not None and self._index.expire(parts):
+            self.LOGGER.debug(f"Cache entry expired - {parts}")
+            self._record_miss(parts)
+            return
+        shard_files = self._open_shards(*parts)
+        if shard_files is None:
+            shard_files = self._open_entry(*parts)
+        if shard_files is None:
+            self._record_miss(parts)
+            return
+
+        self.LOGGER.debug(f"Cache hit - {parts} ({len(shard_files)} files)")
+        if self._index is not None:
+            self._index.touch(parts)
+        if self._metrics is not None:
+            self._metrics.hit(sum(os.fstat(shard_file.fileno()).st_size for shard_file in shard_files))
+        try:
+            values = (
+                value for shard_file in shard_files for value in JsonArrayStream(shard_file, self._decoder())
+            )
+            yield from (self._metrics.timed(values) if self._metrics is not None else values)
+        finally:
+            for shard_file in shard_files:
+                shard_file.close()
+
+    def _open_entry(self, *parts: str) -> Optional[List[IO[str]]]:
+        for _ in range(2):
+            target_path = self._existing_path(*parts)
+            if target_path is None:
+                return None
+            try:
+                return [self.open_for_read(target_path)]
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _open_shards(self, *parts: str) -> Optional[List[IO[str]]]:
+        """
+        Opens all shards of the entry up front - a concurrent write removes the previous shards, but files that are
+        already open remain readable. None if the entry is not sharded
+        """
+        for _ in range(2):
+            manifest = self._read_manifest(*parts)
+            if manifest is None:
+                return None
+            shard_files = []
+            try:
+                for path in self._shard_paths(manifest, *parts):
+                    shard_files.append(self.open_for_read(path))
+                return shard_files
+            except FileNotFoundError:
+                for shard_file in shard_files:
+                    shard_file.close()
+        return None
+
+    def load_shards(self, *parts: str, parser: Optional[Callable[[Any], Any]] = None) -> Optional[List[Any]]:
+        """
+        Loads all elements of a sharded entry, decoding (and parsing, with `parser`) shards in parallel worker
+        processes. None if the entry is not sharded
+        """
+        if self._index is not None and self._index.expire(parts):
+            self.LOGGER.debug(f"Cache entry expired - {parts}")
+            self._record_miss(parts)
+            return None
+        # shards are only removed after the manifest is replaced - a missing shard means the entry was rewritten
+        # while loading, so the new version is loaded instead
+        for _ in range(2):
+            manifest = self._read_manifest(*parts)
+            if manifest is None:
+                return None
+            paths = self._shard_paths(manifest, *parts)
+            workers = min(self._load_workers, len(paths))
+            self.LOGGER.debug(f"Cache hit - {parts} ({len(paths)} shards, {workers} workers)")
+            start = time.perf_counter() if self._metrics is not None else None
+            try:
+                if workers <= 1:
+                    chunks = [_decode_shard(path, self._decoder, parser) for path in paths]
+                else:
+                    # the oracle runs background threads (prefetching, event stream, RPC batches) - forking a
+                    # multi-threaded process can deadlock on locks they hold, so workers start from a fork server
+                    context = multiprocessing.get_context("forkserver")
+                    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+                        chunks = list(executor.map(_decode_shard, paths, repeat(self._decoder), repeat(parser)))
+            except FileNotFoundError:
+                continue
+            if self._index is not None:
+                self._index.touch(parts)
+            values = [value for chunk in chunks for value in chunk]
+            if self._metrics is not None:
+                self._metrics.hit(sum(os.path.getsize(path) for path in paths))
+                self._metrics.decoded(time.perf_counter() - start)
+            return values
+        return None
 
     def read_cache(self, *parts: str) -> JsonObject:
-        raw_value = self.read_cache_raw(*parts)
-        return json.loads(raw_value)
+        if self._read_manifest(*parts) is not None:
+            return list(self.iter_cache(*parts))
+        value = self._read(lambda json_file: json.load(json_file, cls=self._decoder), *parts)
+        return value if value is not None else {}
 
     def read_cache_raw(self, *parts: str) -> Union[str, bytes, bytearray]:
-        target_path = self._make_path(*parts)
-        if not os.path.exists(target_path):
-            self.LOGGER.debug(f"Cache miss - {parts}")
-            return "{}"
-
-        self.LOGGER.debug(f"Cache hit - {parts}")
-        with open(target_path, "r") as json_file:
-            return json_file.read()
+        if self._read_manifest(*parts) is not None:
+            return json.dumps(list(self.iter_cache(*parts)), cls=self._encoder)
+        value = self._read(lambda json_file: json_file.read(), *parts)
+        return value if value is not None else "{}"
 
     def save_cache(self, value: JsonObjectOrList, *parts: str) -> None:
         # serialized = json.dumps(value, indent=4, sort_keys=True, cls=self._encoder)
         return self.save_cache_raw(value, *parts)
 
     def save_cache_raw(self, value: str, *parts: str) -> None:
-        target_path = self._make_path(*parts)
-        if not os.path.exists(os.path.dirname(target_path)):
-            os.makedirs(os.path.dirname(target_path))
+        compression = self._compression_for(*parts)
+        shard_size = self._shard_size.get(parts[0]) if parts else None
+        if isinstance(value, list) and shard_size is not None and len(value) > shard_size:
+            return self._save_shards(value, shard_size, compression, *parts)
+
+        target_path = self._make_path(*parts, compression=compression)
+        start = time.perf_counter() if self._metrics is not None else None
+        with self.write_lock(*parts):
+            # json.dump writes chunk by chunk, so the serialized value is streamed through the compressor
+            with atomic_write(target_path, "wt", self.OPENERS[compression]) as json_file:
+                json.dump(value, json_file, indent=4, sort_keys=True, cls=self._encoder)
+            self._remove_other_formats(compression, *parts)
+            self._remove_shards(*parts)
+            if self._index is not None:
+                self._index.record_write(parts, target_path)
+            if self._metrics is not None:
+                self._metrics.written(os.path.getsize(target_path), time.perf_counter() - start)
+
+    def _save_shards(self, value: List, shard_size: int, compression: Optional[Compression], *parts: str) -> None:
+        entry_path = os.path.join(self._storage_folder, *parts)
+        generation = os.urandom(4).hex()
+        shards, paths = [], []
+        start = time.perf_counter() if self._metrics is not None else None
+        with self.write_lock(*parts):
+            for number, offset in enumerate(range(0, len(value), shard_size)):
+                chunk = value[offset:offset + shard_size]
+                path = f"{entry_path}.{generation}.{number:05d}.json{self.COMPRESSION_EXTENSIONS[compression]}"
+                with atomic_write(path, "wt", self.OPENERS[compression]) as shard_file:
+                    json.dump(chunk, shard_file, sort_keys=True, cls=self._encoder)
+                shards.append({"file": os.path.basename(path), "start": offset, "count": len(chunk)})
+                paths.append(path)
 
-        with open(target_path, "w") as json_file:
-            return json.dump(value, json_file, indent=4, sort_keys=True, cls=self._encoder)
+            previous = self._read_manifest(*parts)
+            with atomic_write(self._manifest_path(*parts), "w") as manifest_file:
+                json.dump({"total": len(value), "shards": shards}, manifest_file, indent=4)
+            if previous is not None:
+                self._remove_files(self._shard_paths(previous, *parts))
+            self._remove_files(self._make_path(*parts, compression=option) for option in self.COMPRESSION_EXTENSIONS)
+            if self._index is not None:
+                self._index.record_write(parts, self._manifest_path(*parts), *paths)
+            if self._metrics is not None:
+                self._metrics.written(sum(os.path.getsize(path) for path in paths), time.perf_counter() - start)
+
+    @classmethod
+    def _remove_files(cls, paths: Iterable[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _remove_shards(self, *parts: str) -> None:
+        manifest = self._read_manifest(*parts)
+        if manifest is not None:
+            self._remove_files([self._manifest_path(*parts)] + self._shard_paths(manifest, *parts))
+
+    def _remove_other_formats(self, compression: Optional[Compression], *parts: str) -> None:
+        for other in self.COMPRESSION_EXTENSIONS:
+            other_path = self._make_path(*parts, compression=other)
+            if other != compression and os.path.exists(other_path):
+                os.remove(other_path)
 
     def clear_cache(self, *parts: str) -> None:
-        path = self._make_path(*parts)
-        os.remove(path)
+        with self.write_lock(*parts):
+            path = self._existing_path(*parts)
+            if path is not None:
+                os.remove(path)
+            self._remove_shards(*parts)
+            if self._index is not None:
+                self._index.forget(parts)
 
 
 class TypedJsonDiskCache(JsonDiskCache, Generic[T]):
+    """
+    JsonDiskCache of lists of models. With a `memory` tier, decoded models are kept in memory and repeated reads of
+    an unchanged file skip reading and parsing it.
+    Sharded entries are parsed into models in the worker processes - `parser` has to be picklable then.
+    """
     def __init__(
             self, storage_folder: str, parser: Callable[[JsonObject], T], serializer: Callable[[T], JsonObject],
             encoder: Type[json.JSONEncoder] = CustomJsonEncoder,
-            decoder: Type[json.JSONDecoder] = CustomJsonDecoder
+            decoder: Type[json.JSONDecoder] = json.JSONDecoder,
+            compression: Optional[Dict[str, Compression]] = None,
+            index: Optional[CacheIndex] = None,
+            memory: Optional[MemoryTier] = None,
+            shard_size: Optional[Dict[str, int]] = None,
+            load_workers: Optional[int] = None,
+            metrics: Optional[CacheMetrics] = None
     ):
         self._parser = parser
         self._serializer = serializer
-        super(TypedJsonDiskCache, self).__init__(storage_folder, encoder, decoder)
+        self._memory = memory
+        super(TypedJsonDiskCache, self).__init__(
+            storage_folder, encoder, decoder, compression, index, shard_size, load_workers, metrics
+        )
+
+    def _load_models(self, *parts: str) -> Iterable[T]:
+        models = self.load_shards(*parts, parser=self._parser)
+        if models is not None:
+            return models
+        return (self._parser(record) for record in self.iter_cache(*parts))
 
     def read_model(self, *parts: str) -> Iterable[T]:
-        raw = self.read_cache(*parts)
-        return (
-            self._parser(record) for record in raw
-        )
+        if self._memory is None:
+            return iter(self._load_models(*parts))
+
+        memory_key = (self._storage_folder,) + parts
+        if self._index is not None and self._index.expire(parts):
+            self._memory.invalidate(memory_key)
+            self._record_miss(parts)
+            return iter(())
+        target_path = self._stamp_path(*parts)
+        stamp = FileStamp.of(target_path) if target_path is not None else None
+        if stamp is None:
+            self._record_miss(parts)
+            return iter(())
+
+        models = self._memory.get(memory_key, stamp)
+        if models is not None:
+            self.LOGGER.debug(f"Memory cache hit - {parts}")
+            if self._index is not None:
+                self._index.touch(parts)
+            if self._metrics is not None:
+                self._metrics.memory_hit()
+            return iter(models)
+
+        models = tuple(self._load_models(*parts))
+        self._memory.put(memory_key, stamp, models)
+        return iter(models)
 
     def _serialize_model(self, model: T) -> JsonObject:
 
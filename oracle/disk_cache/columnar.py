@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+from dataclasses import dataclass
+from typing import Callable, Generic, Iterable, Iterator, List, Literal, Optional, Sequence, Tuple
+
+from disk_cache.files import atomic_write, file_lock
+from disk_cache.index import CacheIndex
+from disk_cache.memory import FileStamp, MemoryTier
+from disk_cache.metrics import CacheMetrics
+from json_protocol import T
+
+ColumnKind = Literal['bytes', 'uint64']
+Row = Tuple
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    kind: ColumnKind
+    width: int = 8
+
+    @classmethod
+    def fixed_bytes(cls, name: str, width: int) -> 'Column':
+        return cls(name, 'bytes', width)
+
+    @classmethod
+    def uint64(cls, name: str) -> 'Column':
+        return cls(name, 'uint64', 8)
+
+    def encode(self, values: Sequence) -> bytes:
+        if self.kind == 'uint64':
+            try:
+                return struct.pack(f"<{len(values)}Q", *values)
+            except struct.error as error:
+                raise ValueError(f"Column {self.name}: values must be non-negative integers below 2**64") from error
+        for value in values:
+            if len(value) != self.width:
+                raise ValueError(f"Column {self.name}: expected {self.width} bytes, got {len(value)}")
+        return b"".join(values)
+
+    def decode(self, data: memoryview, rows: int) -> Iterator:
+        if self.kind == 'uint64':
+            if sys.byteorder == 'little':
+                return iter(data.cast('Q'))
+            return (value for value, in struct.iter_unpack("<Q", data))
+        return (bytes(data[row * self.width:(row + 1) * self.width]) for row in range(rows))
+
+
+class ColumnarTable:
+    """
+    Fixed-width columns stored one after another, after a versioned header:
+    `magic | version | column count | row count | crc32 of column data`, followed by column descriptors
+    (`name | kind | width`). Column data is laid out at 8-byte aligned offsets.
+    """
+    MAGIC = b"OCOL"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHQI")
+    COLUMN = struct.Struct("<16sBH")
+    KIND_CODES = {'bytes': 0, 'uint64': 1}
+    ALIGNMENT = 8
+
+    def __init__(self, buffer, verify: bool = True):
+        magic, version, column_count, rows, checksum = self.HEADER.unpack_from(buffer, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"Not a columnar cache file (magic={magic})")
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported columnar cache version {version}")
+
+        kinds = {code: kind for kind, code in self.KIND_CODES.items()}
+        self.columns: List[Column] = []
+        for position in range(column_count):
+            name, kind_code, width = self.COLUMN.unpack_from(buffer, self.HEADER.size + position * self.COLUMN.size)
+            self.columns.append(Column(name.rstrip(b"\x00").decode(), kinds[kind_code], width))
+
+        data_offset = self._align(self.HEADER.size + column_count * self.COLUMN.size)
+        data = memoryview(buffer)[data_offset:]
+        if len(data) < sum(column.width * rows for column in self.columns):
+            raise ValueError("Columnar cache file is truncated")
+        if verify and zlib.crc32(data) != checksum:
+            raise ValueError("Columnar cache file checksum mismatch")
+
+        self._buffer = buffer
+        self.rows = rows
+        self._data = {}
+        offset = 0
+        for column in self.columns:
+            self._data[column.name] = data[offset:offset + column.width * rows]
+            offset = self._align(offset + column.width * rows)
+
+    @classmethod
+    def _align(cls, offset: int) -> int:
+        return -(-offset // cls.ALIGNMENT) * cls.ALIGNMENT
+
+    @classmethod
+    def encode(cls, columns: Sequence[Column], rows: Sequence[Row]) -> bytes:
+        data = bytearray()
+        for position, column in enumerate(columns):
+            data += column.encode([row[position] for row in rows])
+            data += b"\x00" * (cls._align(len(data)) - len(data))
+
+        header = bytearray(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(columns), len(rows), zlib.crc32(data)))
+        for column in columns:
+            header += cls.COLUMN.pack(column.name.encode(), cls.KIND_CODES[column.kind], column.width)
+        header += b"\x00" * (cls._align(len(header)) - len(header))
+        return bytes(header + data)
+
+    def column(self, name: str) -> memoryview:
+        """
+        Raw column data - uint64 columns can be `.cast('Q')` on little-endian platforms
+        """
+        return self._data[name]
+
+    def iter_rows(self) -> Iterator[Row]:
+        return zip(*(column.decode(self._data[column.name], self.rows) for column in self.columns))
+
+    def __len__(self):
+        return self.rows
+
+
+class TypedColumnarDiskCache(Generic[T]):
+    """
+    Drop-in alternative to TypedJsonDiskCache for flat models with fixed-width fields. Models are converted to
+    rows (tuples in `columns` order) and stored as a ColumnarTable - loading is an mmap plus a checksum pass,
+    rather than parsing json.
+    """
+    FILE_EXTENSION = "cols"
+    LOGGER = logging.getLogger(__name__ + ".TypedColumnarDiskCache")
+
+    def __init__(
+            self, storage_folder: str, columns: Sequence[Column],
+            parser: Callable[[Row], T], serializer: Callable[[T], Row], verify: bool = True,
+            index: Optional[CacheIndex] = None, memory: Optional[MemoryTier] = None,
+            metrics: Optional[CacheMetrics] = None
+    ):
+        self._storage_folder = storage_folder
+        self._index = index
+        self._memory = memory
+        self._metrics = metrics
+        self._columns = list(columns)
+        self._parser = parser
+        self._serializer = serializer
+        self._verify = verify
+
+    def _make_path(self, *parts: str):
+        return os.path.join(self._storage_folder, *parts) + "." + self.FILE_EXTENSION
+
+    def write_lock(self, *parts: str):
+        return file_lock(os.path.join(self._storage_folder, *parts))
+
+    def pin(self, *parts: str):
+        if self._index is not None:
+            self._index.pin(parts)
+
+    def unpin(self, *parts: str):
+        if self._index is not None:
+            self._index.unpin(parts)
+
+    def _record_miss(self, parts) -> None:
+        self.LOGGER.debug(f"Cache miss - {parts}")
+        if self._metrics is not None:
+            self._metrics.miss()
+
+    def read_table(self, *parts: str) -> Optional[ColumnarTable]:
+        if self._index is not None and self._index.expire(parts):
+            self.LOGGER.debug(f"Cache entry expired - {parts}")
+            self._record_miss(parts)
+            return None
+        try:
+            with open(self._make_path(*parts), "rb") as table_file:
+                buffer = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            self._record_miss(parts)
+            return None
+
+        self.LOGGER.debug(f"Cache hit - {parts}")
+        if self._index is not None:
+            self._index.touch(parts)
+        if self._metrics is not None:
+            self._metrics.hit(len(buffer))
+        table = ColumnarTable(buffer, self._verify)
+        if [column.name for column in table.columns] != [column.name for column in self._columns]:
+            raise ValueError(f"Columnar cache {parts} has columns {table.columns}, expected {self._columns}")
+        return table
+
+    def read_model(self, *parts: str) -> Iterable[T]:
+        start = time.perf_counter() if self._metrics is not None else None
+        if self._memory is None:
+            table = self.read_table(*parts)
+            if table is None:
+                return iter(())
+            models = (self._parser(row) for row in table.iter_rows())
+            return self._metrics.timed(models) if self._metrics is not None else models
+
+        memory_key = (self._storage_folder,) + parts
+        if self._index is not None and self._index.expire(parts):
+            self._memory.invalidate(memory_key)
+            self._record_miss(parts)
+            return iter(())
+        stamp = FileStamp.of(self._make_path(*parts))
+        models = self._memory.get(memory_key, stamp) if stamp is not None else None
+        if models is not None:
+            self.LOGGER.debug(f"Memory cache hit - {parts}")
+            if self._index is not None:
+                self._index.touch(parts)
+            if self._metrics is not None:
+                self._metrics.memory_hit()
+            return iter(models)
+
+        table = self.read_table(*parts)
+        if table is None:
+            return iter(())
+        models = tuple(self._parser(row) for row in table.iter_rows())
+        if self._metrics is not None:
+            self._metrics.decoded(time.perf_counter() - start)
+        self._memory.put(memory_key, stamp, models)
+        return iter(models)
+
+    def save_model(self, model: T, *parts: str):
+        self.save_models([model], *parts)
+
+    def save_models(self, models: Iterable[T], *parts: str):
+        start = time.perf_counter() if self._metrics is not None else None
+        content = ColumnarTable.encode(self._columns, [self._serializer(model) for model in models])
+        # atomic_write replaces the file rather than truncating it - previous versions might still be mapped
+        with self.write_lock(*parts):
+            with atomic_write(self._make_path(*parts)) as table_file:
+                table_file.write(content)
+            if self._index is not None:
+                self._index.record_write(parts, self._make_path(*parts))
+        if self._metrics is not None:
+            self._metrics.written(len(content), time.perf_counter() - start)
+
+    def clear_cache(self, *parts: str) -> None:
+        with self.write_lock(*parts):
+            os.remove(self._make_path(*parts))
+            if self._index is not None:
+                self._index.forget(parts)
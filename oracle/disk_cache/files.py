@@ -0,0 +1,80 @@
+import os
+import tempfile
+import threading
+
+from contextlib import contextmanager
+from typing import Callable, IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows, locking becomes per-process only
+    fcntl = None
+
+# Advisory file locks are held by an open file, not by a thread - this tracks locks held by the current thread,
+# so that nested `file_lock` calls for the same path do not deadlock
+_held_locks = threading.local()
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+
+
+def _process_lock(path: str) -> threading.Lock:
+    with _process_locks_guard:
+        return _process_locks.setdefault(path, threading.Lock())
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive advisory lock on `path + ".lock"`, shared by all processes using the same cache folder.
+    Re-entrant within a thread.
+    """
+    lock_path = os.path.abspath(path) + ".lock"
+    held = getattr(_held_locks, "paths", None)
+    if held is None:
+        held = _held_locks.paths = set()
+    if lock_path in held:
+        yield
+        return
+
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with _process_lock(lock_path), open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        held.add(lock_path)
+        try:
+            yield
+        finally:
+            held.discard(lock_path)
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb", opener: Callable[..., IO] = open) -> Iterator[IO]:
+    """
+    Writes into a temporary file next to `path` and renames it over `path` once done. Readers see either
+    the old or the new content, never a partially written file - and files already opened (or mmap-ed) keep
+    the old content.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        os.chmod(temp_path, 0o644)
+        with opener(temp_path, mode) as target_file:
+            yield target_file
+        _fsync(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
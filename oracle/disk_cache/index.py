@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import time
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from disk_cache.files import atomic_write, file_lock
+from disk_cache.metrics import CacheMetrics
+
+EntryKey = Sequence[str]
+
+
+class CacheIndex:
+    """
+    Tracks size, write and access time of cache entries in a small json file at the root of the cache folder,
+    and evicts entries:
+    * entries older than the TTL of their namespace (first key part) are treated as missing and removed;
+    * once the total size of the entries exceeds `max_bytes`, least recently accessed entries are removed.
+    Pinned entries are never evicted. Files written without an index (e.g. before it was enabled) are not tracked.
+    """
+    LOGGER = logging.getLogger(__name__ + ".CacheIndex")
+    INDEX_FILE = ".cache_index.json"
+    # access times are only persisted if they moved by more than this - keeps reads from rewriting the index each time
+    ACCESS_RESOLUTION = 60.0
+
+    def __init__(
+            self, storage_folder: str, max_bytes: Optional[int] = None, ttl: Optional[Dict[str, float]] = None,
+            clock: Callable[[], float] = time.time, metrics: Optional[CacheMetrics] = None
+    ):
+        self._storage_folder = storage_folder
+        self._index_path = os.path.join(storage_folder, self.INDEX_FILE)
+        self._max_bytes = max_bytes
+        self._ttl = ttl if ttl is not None else {}
+        self._clock = clock
+        self._metrics = metrics
+
+    @classmethod
+    def _key(cls, parts: EntryKey) -> str:
+        return "/".join(parts)
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self._index_path) as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return {}
+
+    @contextmanager
+    def _update(self) -> Iterator[Dict[str, Dict]]:
+        with file_lock(self._index_path):
+            entries = self._load()
+            yield entries
+            with atomic_write(self._index_path, "w") as index_file:
+                json.dump(entries, index_file, indent=4, sort_keys=True)
+
+    def _is_expired(self, parts: EntryKey, entry: Dict) -> bool:
+        ttl = self._ttl.get(parts[0]) if parts else None
+        return ttl is not None and not entry.get("pinned", False) and entry["written"] + ttl < self._clock()
+
+    def _remove_files(self, key: str, entry: Dict):
+        self.LOGGER.debug(f"Evicting {key} ({entry['size']} bytes)")
+        if self._metrics is not None:
+            self._metrics.evicted(entry["size"])
+        for path in entry["files"]:
+            try:
+                os.remove(os.path.join(self._storage_folder, path))
+            except FileNotFoundError:
+                pass
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self._load().values())
+
+    def entries(self) -> Dict[str, Dict]:
+        return self._load()
+
+    def expire(self, parts: EntryKey) -> bool:
+        """
+        Removes the entry if its TTL has passed. Returns True if it was removed
+        """
+        entry = self._load().get(self._key(parts))
+        if entry is None or not self._is_expired(parts, entry):
+            return False
+        with self._update() as entries:
+            entry = entries.get(self._key(parts))
+            if entry is None or not self._is_expired(parts, entry):
+                return False
+            self._remove_files(self._key(parts), entries.pop(self._key(parts)))
+        return True
+
+    def touch(self, parts: EntryKey):
+        entry = self._load().get(self._key(parts))
+        if entry is None or self._clock() - entry["accessed"] < self.ACCESS_RESOLUTION:
+            return
+        with self._update() as entries:
+            if self._key(parts) in entries:
+                entries[self._key(parts)]["accessed"] = self._clock()
+
+    def record_write(self, parts: EntryKey, *paths: str):
+        """
+        Records entry written at `paths` (several for sharded entries), then evicts entries over the budget
+        """
+        size = sum(os.path.getsize(path) for path in paths)
+        now = self._clock()
+        with self._update() as entries:
+            previous = entries.get(self._key(parts), {})
+            entries[self._key(parts)] = {
+                "files": [os.path.relpath(path, self._storage_folder) for path in paths],
+                "size": size,
+                "written": now,
+                "accessed": now,
+                "pinned": previous.get("pinned", False),
+            }
+            self._evict(entries, protected=self._key(parts))
+
+    def forget(self, parts: EntryKey):
+        with self._update() as entries:
+            entries.pop(self._key(parts), None)
+
+    def pin(self, parts: EntryKey):
+        self._set_pinned(parts, True)
+
+    def unpin(self, parts: EntryKey):
+        self._set_pinned(parts, False)
+
+    def _set_pinned(self, parts: EntryKey, pinned: bool):
+        with self._update() as entries:
+            entry = entries.get(self._key(parts))
+            if entry is not None:
+                entry["pinned"] = pinned
+            elif pinned:
+                # entry is not written yet - keep the pin, so that it is protected as soon as it is
+                now = self._clock()
+                entries[self._key(parts)] = {"files": [], "size": 0, "written": now, "accessed": now, "pinned": True}
+
+    def evict(self) -> List[str]:
+        with self._update() as entries:
+            return self._evict(entries)
+
+    def _evict(self, entries: Dict[str, Dict], protected: Optional[str] = None) -> List[str]:
+        evicted = [key for key, entry in entries.items() if self._is_expired(key.split("/"), entry)]
+
+        if self._max_bytes is not None:
+            total = sum(entry["size"] for key, entry in entries.items() if key not in evicted)
+            candidates = sorted(
+                (entry["accessed"], key) for key, entry in entries.items()
+                if key not in evicted and key != protected and not entry.get("pinned", False)
+            )
+            for _, key in candidates:
+                if total <= self._max_bytes:
+                    break
+                evicted.append(key)
+                total -= entries[key]["size"]
+            if total > self._max_bytes:
+                self.LOGGER.warning(f"Cache {self._storage_folder} is over budget - remaining entries are pinned or just written")
+
+        for key in evicted:
+            self._remove_files(key, entries.pop(key))
+        return evicted
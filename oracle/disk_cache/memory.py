@@ -0,0 +1,96 @@
+import logging
+import os
+import sys
+import threading
+
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional, Sequence, Tuple
+
+
+class FileStamp(NamedTuple):
+    """
+    Identifies a version of a cache file - atomic writes replace the file, so the inode changes even if
+    the new version is written within the mtime resolution
+    """
+    path: str
+    inode: int
+    mtime_ns: int
+    size: int
+
+    @classmethod
+    def of(cls, path: str) -> Optional['FileStamp']:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return cls(path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class MemoryTier:
+    """
+    Bounded in-process LRU of decoded cache entries, in front of a disk cache. Entries are weighted by their
+    estimated size in memory and are only served while the file stamp matches.
+    Values are shared between readers - they must not be modified.
+    """
+    LOGGER = logging.getLogger(__name__ + ".MemoryTier")
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[FileStamp, Any, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, stamp: Optional[FileStamp]) -> Optional[Any]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                return None
+            cached_stamp, value, _ = cached
+            if cached_stamp != stamp:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    @classmethod
+    def estimate_size(cls, models: Sequence[Any]) -> int:
+        """
+        Models in a cache entry are uniform - size of the first one (with its attribute values) times the count
+        """
+        if not models:
+            return sys.getsizeof(models)
+        sample = models[0]
+        sample_size = sys.getsizeof(sample)
+        if hasattr(sample, "__dict__"):
+            attributes = vars(sample)
+            sample_size += sys.getsizeof(attributes) + sum(sys.getsizeof(value) for value in attributes.values())
+        return sys.getsizeof(models) + sample_size * len(models)
+
+    def put(self, key: Hashable, stamp: FileStamp, value: Sequence[Any], size: Optional[int] = None):
+        size = size if size is not None else self.estimate_size(value)
+        if size > self._max_bytes:
+            self.LOGGER.debug(f"{key} ({size} bytes) does not fit into the memory tier")
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (stamp, value, size)
+            self._total_bytes += size
+            while self._total_bytes > self._max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: Hashable):
+        cached = self._entries.pop(key, None)
+        if cached is not None:
+            self._total_bytes -= cached[2]
@@ -0,0 +1,184 @@
+import bisect
+import json
+import logging
+import threading
+import time
+
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
+
+import config
+from disk_cache.files import atomic_write
+
+V = TypeVar('V')
+
+
+class Histogram:
+    """
+    Counts of observed values in fixed buckets, plus their count, sum and maximum
+    """
+    BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+    def __init__(self):
+        self._buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self._buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def snapshot(self) -> Dict:
+        labels = [f"<={bound}" for bound in self.BOUNDS] + ["+inf"]
+        return {
+            "count": self.count, "sum": self.total, "max": self.max,
+            "buckets": dict(zip(labels, self._buckets)),
+        }
+
+
+class CacheMetrics:
+    """
+    Counters and timings of the caches of one namespace:
+    * hits, memory_hits (served from a MemoryTier without touching the disk), misses;
+    * bytes_read, bytes_written - sizes of cache files read and written;
+    * evictions, evicted_bytes - entries removed by CacheIndex (TTL and size budget);
+    * decode_seconds - time to read and decode an entry. Streamed entries are timed until fully consumed, so
+      this includes the time the consumer spends between elements;
+    * write_seconds - time to encode and write an entry.
+    """
+    COUNTERS = ("hits", "memory_hits", "misses", "bytes_read", "bytes_written", "evictions", "evicted_bytes")
+    TIMINGS = ("decode_seconds", "write_seconds")
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+        self._timings = {timing: Histogram() for timing in self.TIMINGS}
+
+    def _add(self, counter: str, value: int = 1):
+        with self._lock:
+            self._counters[counter] += value
+
+    def hit(self, bytes_read: int = 0):
+        with self._lock:
+            self._counters["hits"] += 1
+            self._counters["bytes_read"] += bytes_read
+
+    def memory_hit(self):
+        self._add("memory_hits")
+
+    def miss(self):
+        self._add("misses")
+
+    def decoded(self, seconds: float):
+        with self._lock:
+            self._timings["decode_seconds"].observe(seconds)
+
+    def written(self, bytes_written: int, seconds: float):
+        with self._lock:
+            self._counters["bytes_written"] += bytes_written
+            self._timings["write_seconds"].observe(seconds)
+
+    def evicted(self, size: int):
+        with self._lock:
+            self._counters["evictions"] += 1
+            self._counters["evicted_bytes"] += size
+
+    def timed(self, values: Iterable[V]) -> Iterator[V]:
+        """
+        Passes values through, recording decode time once they are exhausted
+        """
+        start = time.perf_counter()
+        yield from values
+        self.decoded(time.perf_counter() - start)
+
+    @property
+    def hit_ratio(self) -> Optional[float]:
+        hits = self._counters["hits"] + self._counters["memory_hits"]
+        lookups = hits + self._counters["misses"]
+        return hits / lookups if lookups else None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "hit_ratio": self.hit_ratio,
+                **{timing: histogram.snapshot() for timing, histogram in self._timings.items()},
+            }
+
+
+class CacheMetricsRegistry:
+    """
+    CacheMetrics by namespace. While disabled, `namespace` returns None - caches then skip all bookkeeping,
+    including reading the clock
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._namespaces: Dict[str, CacheMetrics] = {}
+        self._lock = threading.Lock()
+
+    def namespace(self, name: str) -> Optional[CacheMetrics]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            if name not in self._namespaces:
+                self._namespaces[name] = CacheMetrics(name)
+            return self._namespaces[name]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            namespaces: List[CacheMetrics] = list(self._namespaces.values())
+        return {metrics.namespace: metrics.snapshot() for metrics in namespaces}
+
+    def reset(self):
+        with self._lock:
+            self._namespaces.clear()
+
+
+class CacheMetricsReporter:
+    """
+    Periodically logs a summary of the registry, or dumps its full snapshot as json into `path`
+    """
+    LOGGER = logging.getLogger(__name__ + ".CacheMetricsReporter")
+
+    def __init__(self, registry: CacheMetricsRegistry, interval: float, path: Optional[str] = None):
+        self._registry = registry
+        self._interval = interval
+        self._path = path
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'CacheMetricsReporter':
+        self._thread = threading.Thread(target=self._run, name="cache-metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.report()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self.report()
+
+    def report(self):
+        snapshot = self._registry.snapshot()
+        if self._path is not None:
+            with atomic_write(self._path, "w") as metrics_file:
+                json.dump(snapshot, metrics_file, indent=4, sort_keys=True)
+            return
+        for namespace, metrics in sorted(snapshot.items()):
+            decode = metrics["decode_seconds"]
+            self.LOGGER.info(
+                f"Cache {namespace}: hits={metrics['hits']} memory_hits={metrics['memory_hits']} "
+                f"misses={metrics['misses']} hit_ratio={metrics['hit_ratio']} read={metrics['bytes_read']}B "
+                f"written={metrics['bytes_written']}B decode={decode['sum']:.3f}s/{decode['count']} "
+                f"evictions={metrics['evictions']}"
+            )
+
+
+CACHE_METRICS = CacheMetricsRegistry(enabled=config.CACHE_METRICS_ENABLED)
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Sequence, Set, Tuple
+
+from disk_cache.columnar import Column, ColumnarTable, Row
+from disk_cache.files import atomic_write, file_lock
+from disk_cache.metrics import CacheMetrics
+from json_protocol import T
+
+
+class SnapshotStore(Generic[T]):
+    """
+    Stores snapshots of an append-only list of rows (e.g. validators - new ones are only appended, existing ones
+    only change their balance) as a base snapshot plus, per snapshot, a delta against that base.
+
+    A delta is stored per column: for each column that changed, either the positions and new values of the changed
+    rows, or the whole column if most of it changed - plus the appended rows in full. So a snapshot where only
+    balances changed costs a position and a balance per changed row, and any snapshot is reconstructed from the
+    base and a single delta. Once a delta grows over `rebase_ratio` of the base size, the snapshot is stored in
+    full and becomes the base for the following ones.
+    Bases and deltas are content-addressed ColumnarTable files; `manifest.json` maps snapshot keys to them.
+    Retention follows CacheIndex: snapshots older than their namespace's `ttl` are not served, and on each save
+    expired snapshots - then the oldest ones, while objects take more than `max_bytes` - are dropped, unless pinned.
+    Objects no longer referenced (e.g. superseded bases) are removed along with them, or by `clear_cache` - a read
+    racing with that is retried, and then treated as a miss.
+
+    Implements the read_model/save_models interface of the other typed disk caches.
+    """
+    LOGGER = logging.getLogger(__name__ + ".SnapshotStore")
+    MANIFEST = "manifest.json"
+    OBJECTS = "objects"
+    POSITION = Column.uint64('_position')
+
+    def __init__(
+            self, storage_folder: str, columns: Sequence[Column],
+            parser: Callable[[Row], T], serializer: Callable[[T], Row], rebase_ratio: float = 0.25,
+            max_bytes: Optional[int] = None, ttl: Optional[Dict[str, float]] = None,
+            clock: Callable[[], float] = time.time, metrics: Optional[CacheMetrics] = None
+    ):
+        self._storage_folder = storage_folder
+        self._columns = list(columns)
+        self._parser = parser
+        self._serializer = serializer
+        self._rebase_ratio = rebase_ratio
+        self._max_bytes = max_bytes
+        self._ttl = ttl if ttl is not None else {}
+        self._clock = clock
+        self._metrics = metrics
+        self._manifest_path = os.path.join(storage_folder, self.MANIFEST)
+
+    @classmethod
+    def _key(cls, parts: Sequence[str]) -> str:
+        return "/".join(parts)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._storage_folder, self.OBJECTS, digest + ".cols")
+
+    def _load_manifest(self) -> Dict:
+        try:
+            with open(self._manifest_path) as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {"snapshots": {}, "base": None, "pinned": []}
+
+    def _save_manifest(self, manifest: Dict):
+        with atomic_write(self._manifest_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+
+    def _write_object(self, content: bytes) -> str:
+        digest = hashlib.blake2b(content, digest_size=20).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            start = time.perf_counter() if self._metrics is not None else None
+            with atomic_write(path) as object_file:
+                object_file.write(content)
+            if self._metrics is not None:
+                self._metrics.written(len(content), time.perf_counter() - start)
+        return digest
+
+    def _read_object(self, digest: str) -> ColumnarTable:
+        # objects are always decoded in full, so they are read rather than mapped - nothing is left open
+        with open(self._object_path(digest), "rb") as object_file:
+            return ColumnarTable(object_file.read())
+
+    @classmethod
+    def _entry_objects(cls, entry: Dict) -> List[str]:
+        delta = entry["delta"]
+        if delta is None:
+            return [entry["base"]]
+        appended = [delta["appended"]] if delta["appended"] is not None else []
+        return [entry["base"]] + list(delta["changed"].values()) + appended
+
+    def write_lock(self, *parts: str):
+        return file_lock(self._manifest_path)
+
+    def pin(self, *parts: str):
+        """
+        Protects the snapshot from retention - also before it is saved
+        """
+        self._set_pinned(parts, True)
+
+    def unpin(self, *parts: str):
+        self._set_pinned(parts, False)
+
+    def _set_pinned(self, parts: Sequence[str], pinned: bool):
+        with self.write_lock():
+            manifest = self._load_manifest()
+            keys = set(manifest["pinned"])
+            if pinned:
+                keys.add(self._key(parts))
+            else:
+                keys.discard(self._key(parts))
+            manifest["pinned"] = sorted(keys)
+            self._save_manifest(manifest)
+
+    def _is_expired(self, key: str, entry: Dict, manifest: Dict) -> bool:
+        ttl = self._ttl.get(key.split("/")[0])
+        return ttl is not None and key not in manifest["pinned"] and entry["written"] + ttl < self._clock()
+
+    def keys(self) -> List[str]:
+        return sorted(self._load_manifest()["snapshots"])
+
+    def read_rows(self, *parts: str) -> Optional[List[Row]]:
+        for attempt in range(2):
+            manifest = self._load_manifest()
+            entry = manifest["snapshots"].get(self._key(parts))
+            if entry is None or self._is_expired(self._key(parts), entry, manifest):
+                break
+            start = time.perf_counter() if self._metrics is not None else None
+            try:
+                rows = self._read_entry(entry)
+                size = sum(os.path.getsize(self._object_path(digest)) for digest in self._entry_objects(entry))
+            except FileNotFoundError:
+                # the snapshot was cleared, and its objects collected, after the manifest was read
+                self.LOGGER.debug(f"Snapshot objects of {parts} removed while reading")
+                continue
+            self.LOGGER.debug(f"Snapshot hit - {parts}")
+            if self._metrics is not None:
+                self._metrics.hit(size)
+                self._metrics.decoded(time.perf_counter() - start)
+            return rows
+
+        self.LOGGER.debug(f"Snapshot miss - {parts}")
+        if self._metrics is not None:
+            self._metrics.miss()
+        return None
+
+    def _read_entry(self, entry: Dict) -> List[Row]:
+        rows = list(self._read_object(entry["base"]).iter_rows())
+        delta = entry["delta"]
+        if delta is not None:
+            names = [column.name for column in self._columns]
+            for name, digest in delta["changed"].items():
+                index = names.index(name)
+                table = self._read_object(digest)
+                if table.columns[0].name == self.POSITION.name:
+                    for position, value in table.iter_rows():
+                        row = rows[position]
+                        rows[position] = row[:index] + (value,) + row[index + 1:]
+                else:
+                    rows = [row[:index] + (value,) + row[index + 1:] for row, (value,) in zip(rows, table.iter_rows())]
+            if delta["appended"] is not None:
+                rows.extend(self._read_object(delta["appended"]).iter_rows())
+        return rows
+
+    def read_model(self, *parts: str) -> Iterable[T]:
+        rows = self.read_rows(*parts)
+        return (self._parser(row) for row in rows) if rows is not None else iter(())
+
+    def save_models(self, models: Iterable[T], *parts: str):
+        rows = [self._serializer(model) for model in models]
+        with self.write_lock():
+            manifest = self._load_manifest()
+            base_digest = manifest["base"]
+            delta = self._delta(base_digest, rows) if base_digest is not None else None
+            delta_size = sum(len(content) for content in self._delta_objects(delta)) if delta is not None else 0
+
+            if delta is None or delta_size > self._rebase_ratio * os.path.getsize(self._object_path(base_digest)):
+                base_digest = self._write_object(ColumnarTable.encode(self._columns, rows))
+                manifest["base"] = base_digest
+                entry = {"base": base_digest, "delta": None}
+                self.LOGGER.debug(f"Stored {parts} as a new base snapshot of {len(rows)} rows")
+            else:
+                changed, appended = delta
+                entry = {"base": base_digest, "delta": {
+                    "changed": {name: self._write_object(content) for name, content in changed.items()},
+                    "appended": self._write_object(appended) if appended is not None else None,
+                }}
+                self.LOGGER.debug(f"Stored {parts} as a delta of {delta_size} bytes, changed columns {list(changed)}")
+
+            entry["written"] = self._clock()
+            manifest["snapshots"][self._key(parts)] = entry
+            self._apply_retention(manifest, protected=self._key(parts))
+            self._save_manifest(manifest)
+            self._collect_garbage(manifest)
+
+    def save_model(self, model: T, *parts: str):
+        self.save_models([model], *parts)
+
+    @classmethod
+    def _delta_objects(cls, delta: Tuple[Dict[str, bytes], Optional[bytes]]) -> List[bytes]:
+        changed, appended = delta
+        return list(changed.values()) + ([appended] if appended is not None else [])
+
+    def _delta(self, base_digest: str, rows: List[Row]) -> Optional[Tuple[Dict[str, bytes], Optional[bytes]]]:
+        """
+        Encoded changes of each changed column, and the appended rows - None if rows are not an extension of the base.
+        A column is stored as positions and values of the changed rows, or in full if that is smaller
+        """
+        base = self._read_object(base_digest)
+        base_rows = len(base)
+        if len(rows) < base_rows:
+            return None
+        changed = {}
+        for index, column in enumerate(self._columns):
+            base_values = column.decode(base.column(column.name), base_rows)
+            positions = [
+                position for position, (row, value) in enumerate(zip(rows, base_values)) if row[index] != value
+            ]
+            if not positions:
+                continue
+            if len(positions) * (self.POSITION.width + column.width) < base_rows * column.width:
+                changed[column.name] = ColumnarTable.encode(
+                    [self.POSITION, column], [(position, rows[position][index]) for position in positions]
+                )
+            else:
+                changed[column.name] = ColumnarTable.encode([column], [(row[index],) for row in rows[:base_rows]])
+        appended = ColumnarTable.encode(self._columns, rows[base_rows:]) if len(rows) > base_rows else None
+        return changed, appended
+
+    def clear_cache(self, *parts: str):
+        with self.write_lock():
+            manifest = self._load_manifest()
+            manifest["snapshots"].pop(self._key(parts), None)
+            self._save_manifest(manifest)
+            self._collect_garbage(manifest)
+
+    def _referenced(self, manifest: Dict) -> Set[str]:
+        referenced = {manifest["base"]} if manifest["base"] is not None else set()
+        for entry in manifest["snapshots"].values():
+            referenced.update(self._entry_objects(entry))
+        return referenced
+
+    def _apply_retention(self, manifest: Dict, protected: str):
+        """
+        Drops expired snapshots, then the oldest ones while referenced objects take more than `max_bytes`
+        """
+        snapshots = manifest["snapshots"]
+        for key, entry in list(snapshots.items()):
+            if key != protected and self._is_expired(key, entry, manifest):
+                self.LOGGER.debug(f"Dropping expired snapshot {key}")
+                del snapshots[key]
+        if self._max_bytes is None:
+            return
+        candidates = sorted(
+            (key for key in snapshots if key != protected and key not in manifest["pinned"]),
+            key=lambda key: snapshots[key]["written"]
+        )
+        sizes = {digest: os.path.getsize(self._object_path(digest)) for digest in self._referenced(manifest)}
+        while candidates and sum(sizes[digest] for digest in self._referenced(manifest)) > self._max_bytes:
+            key = candidates.pop(0)
+            self.LOGGER.debug(f"Dropping snapshot {key} over the size budget")
+            del snapshots[key]
+
+    def _collect_garbage(self, manifest: Dict):
+        referenced = self._referenced(manifest)
+        objects_folder = os.path.join(self._storage_folder, self.OBJECTS)
+        for file_name in os.listdir(objects_folder):
+            digest, extension = os.path.splitext(file_name)
+            if extension == ".cols" and digest not in referenced:
+                path = os.path.join(objects_folder, file_name)
+                if self._metrics is not None:
+                    self._metrics.evicted(os.path.getsize(path))
+                os.remove(path)
@@ -7,14 +7,13 @@ import logging
 import enum
 import random
 import sys
-from eth_typing import HexStr
 from lido_sdk.methods.typing import OperatorKey
 from typing import TypeVar, Set, Iterator
 
 from api.eth_api import BeaconState, Validator
 from api.lido_api import LidoOperatorList, OperatorKeyAdapter
 from model import ProverPayload
-from utils import IntUtils
+from utils import PubkeyUtils
 
 T = TypeVar('T')
 
@@ -118,9 +117,9 @@ def stub() -> (BeaconState, LidoOperatorList):
     key3 = 0x3
     beacon_state=BeaconState(
         [
-            Validator(HexStr(f"{key1:#096x}"), Decimal(1000)),
-            Validator(HexStr(f"{key2:#096x}"), Decimal(2000)),
-            Validator(HexStr(f"{key3:#096x}"), Decimal(4000)),
+            Validator(PubkeyUtils.from_hex_str(f"{key1:#096x}"), Decimal(1000)),
+            Validator(PubkeyUtils.from_hex_str(f"{key2:#096x}"), Decimal(2000)),
+            Validator(PubkeyUtils.from_hex_str(f"{key3:#096x}"), Decimal(4000)),
         ]
     )
     lido_operators=LidoOperatorList(
@@ -154,7 +153,7 @@ def generate(
 
     validators = []
     for (key, balance) in zip(unique_addresses, balances):
-        validator = Validator(IntUtils.to_hex_str(key), Decimal(balance))
+        validator = Validator(PubkeyUtils.from_int(key), Decimal(balance))
         validators.append(validator)
     beacon_state = BeaconState(validators)
 
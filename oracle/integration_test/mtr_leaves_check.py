@@ -8,6 +8,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 import config
 from api.eth_api import BeaconState, Validator
 from integration_test.testutils import CairoTestHelper, ExampleRunnerHelper, get_arg_parser
+from utils import PubkeyUtils
 
 
 class CairoHelper(CairoTestHelper[HexStr]):
@@ -31,27 +32,27 @@ class ExampleRunner(ExampleRunnerHelper[BeaconState, HexStr]):
         return [
             (f"validators_0", BeaconState([])),
             (f"validators_1", BeaconState([
-                Validator(HexStr(f"{key1:#096x}"), Decimal(10000000)),
+                Validator(PubkeyUtils.from_hex_str(f"{key1:#096x}"), Decimal(10000000)),
             ])),
             (f"validators_2", BeaconState(
                 [
-                    Validator(HexStr(f"{key1:#096x}"), Decimal(1000)),
-                    Validator(HexStr(f"{key2:#096x}"), Decimal(2000)),
+                    Validator(PubkeyUtils.from_hex_str(f"{key1:#096x}"), Decimal(1000)),
+                    Validator(PubkeyUtils.from_hex_str(f"{key2:#096x}"), Decimal(2000)),
                 ]
             )),
             (f"validators_3", BeaconState(
                 [
-                    Validator(HexStr(f"{key1:#096x}"), Decimal(1000)),
-                    Validator(HexStr(f"{key2:#096x}"), Decimal(2000)),
-                    Validator(HexStr(f"{key3:#096x}"), Decimal(20000)),
+                    Validator(PubkeyUtils.from_hex_str(f"{key1:#096x}"), Decimal(1000)),
+                    Validator(PubkeyUtils.from_hex_str(f"{key2:#096x}"), Decimal(2000)),
+                    Validator(PubkeyUtils.from_hex_str(f"{key3:#096x}"), Decimal(20000)),
                 ]
             )),
             (f"real_hashes_4", BeaconState(
                 [
-                    Validator(HexStr("0x953805708367b0b5f6710d41608ccdd0d5a67938e10e68dd010890d4bfefdcde874370423b0af0d0a053b7b98ae2d6ed"), Decimal(1000)),
-                    Validator(HexStr("0x814dc0f55ac3fb02431668adf6f8fa1c37fb9baa5b87f5be519a373205933dfe742f3df566cba3a35b5be1940e1dffd5"), Decimal(2000)),
-                    Validator(HexStr("0x88d1ac7f33780fd328bee60957b2325cfa41b3719614b662616d4525e5b478b3a81d490671526936e3ea412428c84451"), Decimal(3000)),
-                    Validator(HexStr("0xa53dd1acc6091fbff3efd43ff520c82ca4b56fe2ba9ee8ca119fd6a4646b6759b15f2cafeb1bbf14f5a0cb2c66cdfe47"), Decimal(3000)),
+                    Validator(PubkeyUtils.from_hex_str("0x953805708367b0b5f6710d41608ccdd0d5a67938e10e68dd010890d4bfefdcde874370423b0af0d0a053b7b98ae2d6ed"), Decimal(1000)),
+                    Validator(PubkeyUtils.from_hex_str("0x814dc0f55ac3fb02431668adf6f8fa1c37fb9baa5b87f5be519a373205933dfe742f3df566cba3a35b5be1940e1dffd5"), Decimal(2000)),
+                    Validator(PubkeyUtils.from_hex_str("0x88d1ac7f33780fd328bee60957b2325cfa41b3719614b662616d4525e5b478b3a81d490671526936e3ea412428c84451"), Decimal(3000)),
+                    Validator(PubkeyUtils.from_hex_str("0xa53dd1acc6091fbff3efd43ff520c82ca4b56fe2ba9ee8ca119fd6a4646b6759b15f2cafeb1bbf14f5a0cb2c66cdfe47"), Decimal(3000)),
                 ]
             )),
 
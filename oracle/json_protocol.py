@@ -5,9 +5,9 @@ import json
 from decimal import Decimal
 from datetime import datetime, date
 
-from typing import Union, List, Dict, Generic, Any, TypeVar
+from typing import IO, Callable, Iterator, Union, List, Dict, Generic, Any, Optional, Type, TypeVar
 
-from utils import DateFormatter
+from utils import DateFormatter, Pubkey, PubkeyUtils
 
 T = TypeVar('T')
 
@@ -54,34 +54,143 @@ class DateTimeJsonProtocol(JsonProtocolInterface[datelike]):
         return DateFormatter.parse_datetime_iso8601(raw_string)
 
 
-class CustomJsonDecoder(json.JSONDecoder):
-    PROTOCOLS: List[JsonProtocolInterface[Any]] = [DateTimeJsonProtocol(), DecimalJsonProtocol()]
+class IntJsonProtocol(JsonProtocolInterface[int]):
+    def encode(self, object: int):
+        return object
 
-    def __init__(self):
-        super(CustomJsonDecoder, self).__init__(object_hook=self._parse)
+    def decode(self, raw_string: Union[str, int]) -> int:
+        return int(raw_string)
 
-    def _parse(self, input: Dict[str, Any]):
-        return {
-            key: self.apply_protocols(key, value)
-            for key, value in input.items()
-        }
 
-    def apply_protocols(self, key, value):
-        for custom_protocol in self.PROTOCOLS:
-            try:
-                return custom_protocol.decode(value)
-            except:
-                pass
-        return value
+class StrJsonProtocol(JsonProtocolInterface[str]):
+    def encode(self, object: str):
+        return object
+
+    def decode(self, raw_string: str) -> str:
+        return raw_string
+
+
+class HexBytesJsonProtocol(JsonProtocolInterface[bytes]):
+    def encode(self, object: bytes):
+        return "0x" + object.hex()
+
+    def decode(self, raw_string: str) -> bytes:
+        return bytes.fromhex(raw_string[2:] if raw_string.startswith("0x") else raw_string)
+
+
+class PubkeyJsonProtocol(JsonProtocolInterface[Pubkey]):
+    """
+    Same as `PubkeyUtils` - short hex strings are left-padded, so decoded pubkeys are always PUBKEY_LENGTH long
+    """
+    def encode(self, object: Pubkey):
+        return PubkeyUtils.to_hex_str(object)
+
+    def decode(self, raw_string: str) -> Pubkey:
+        return PubkeyUtils.from_hex_str(raw_string)
+
+
+class JsonSchema(Generic[T]):
+    """
+    Declares json field types of a model - fields are encoded and decoded by their declared protocol directly,
+    other values are never probed or converted.
+    Models are constructed as `factory(**fields)`, encoded fields are read with `getattr`.
+    """
+    def __init__(self, factory: Callable[..., T], fields: Dict[str, JsonProtocolInterface[Any]]):
+        self._factory = factory
+        self._fields = list(fields.items())
+
+    def encode(self, model: T) -> JsonObject:
+        return {name: protocol.encode(getattr(model, name)) for name, protocol in self._fields}
+
+    def decode(self, raw: JsonObject) -> T:
+        return self._factory(**{name: protocol.decode(raw[name]) for name, protocol in self._fields})
 
 
 class CustomJsonEncoder(json.JSONEncoder):
-    PROTOCOLS: List[JsonProtocolInterface[Any]] = [DateTimeJsonProtocol(), DecimalJsonProtocol()]
+    """
+    Encodes non-json values by type - subclasses are looked up by their closest registered base
+    """
+    PROTOCOLS: Dict[Type, JsonProtocolInterface[Any]] = {
+        datetime: DateTimeJsonProtocol(), date: DateTimeJsonProtocol(), Decimal: DecimalJsonProtocol()
+    }
 
     def default(self, obj: any):
-        for custom_protocol in self.PROTOCOLS:
+        for obj_type in type(obj).__mro__:
+            protocol = self.PROTOCOLS.get(obj_type)
+            if protocol is not None:
+                return protocol.encode(obj)
+        return super().default(obj)
+
+
+class JsonArrayStream:
+    """
+    Decodes a top-level json array from a text stream one element at a time - memory use is bounded by the largest
+    element plus `chunk_size`, rather than by the whole document
+    """
+    WHITESPACE = " \t\n\r"
+    DELIMITERS = WHITESPACE + ",]"
+
+    def __init__(self, stream: IO[str], decoder: Optional[json.JSONDecoder] = None, chunk_size: int = 64 * 1024):
+        self._stream = stream
+        self._decoder = decoder if decoder is not None else json.JSONDecoder()
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+
+    def _read_more(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def _next_token(self) -> str:
+        """
+        Skips whitespace, returns the next character without consuming it ("" at the end of the stream)
+        """
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in self.WHITESPACE:
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read_more():
+                return ""
+
+    def _expect(self, expected: str):
+        token = self._next_token()
+        if token not in expected:
+            raise json.JSONDecodeError(f"Expected one of {expected!r}", self._buffer, self._position)
+        self._position += 1
+        return token
+
+    def _decode_value(self) -> Any:
+        self._next_token()
+        while True:
             try:
-                return custom_protocol.encode(obj)
-            except ValueError:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._read_more():
+                    raise
+                continue
+            # a number cut in the middle still decodes ("12" out of "12.5") - the value is only complete if it is
+            # followed by a delimiter
+            if (end == len(self._buffer) or self._buffer[end] not in self.DELIMITERS) and self._read_more():
                 continue
-        return super().default(obj)
\ No newline at end of file
+            self._position = end
+            return value
+
+    def __iter__(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._next_token() == "]":
+            self._position += 1
+            return
+        while True:
+            yield self._decode_value()
+            if self._expect(",]") == "]":
+                return
+
@@ -1,7 +1,7 @@
 import enum
 import argparse
 import logging
-from typing import List, Callable, Tuple
+from typing import List, Callable, Optional, Tuple
 
 from eth_typing import HexStr
 from tap import Tap
@@ -10,13 +10,16 @@ import config
 import generate_input
 
 from api.eth_api import get_web3_connection, CachedBeaconAPIWrapper, BeaconState, BeaconAPIWrapper
+from api.beacon_events import BeaconEventStream
 from api.lido_api import CachedLidoWrapper, LidoOperatorList, LidoWrapper
 from web3.beacon import Beacon
 
 from cairo import CairoInterface
+from disk_cache.metrics import CACHE_METRICS, CacheMetricsReporter
 from generate_input import RangeMode
 from model import ProverPayload
-from oracle import Oracle, StubTLVContract, ProverPayloadSource
+from oracle import Oracle, StubTLVContract, ProverPayloadSource, FinalityTrigger
+from validator_index import CachedValidatorIndexMap, ValidatorIndexMap
 
 DESTINATION_FOLDER = "."
 
@@ -70,6 +73,7 @@ class ArgumentParser(Tap):
 
     store_input_copy: str
     submit: bool
+    watch: bool
 
     def configure(self):
         self.add_argument(
@@ -118,6 +122,12 @@ class ArgumentParser(Tap):
             default=False,
             help="Submit program to SHARP"
         )
+        self.add_argument(
+            "--watch",
+            action='store_true',
+            default=False,
+            help="Keep running and start an oracle cycle on each new finalized epoch. Only for live source"
+        )
 
         # debug arguments
         self.add_argument(
@@ -143,13 +153,14 @@ class StaticProverPayloadSource(ProverPayloadSource):
     def get_prover_payload(self):
         return ProverPayload(
             beacon_state=self.beacon_state,
-            lido_operator_keys=[operator.key for operator in self.lido_operator_list.operators]
+            lido_operator_keys=self.lido_operator_list.keys,
+            lido_operator_indices=self.lido_operator_list.operator_indices
         )
 
-class BlockchainProverPayloadSource:
+class BlockchainProverPayloadSource(ProverPayloadSource):
     LOGGER = logging.getLogger(__name__ + ".BlockchainProverPayloadSource")
     def __init__(self, web3_enpoint, eth2_endpoint, use_cache=True):
-        web3 = get_web3_connection(web3_enpoint)
+        web3 = get_web3_connection(web3_enpoint, rpc_cache=use_cache and config.WEB3_RPC_CACHE)
         beacon = Beacon(eth2_endpoint)
 
         if use_cache:
@@ -158,15 +169,41 @@ class BlockchainProverPayloadSource:
 
             self.LOGGER.debug("Using read-through cache for beacon state")
             beacon_api = CachedBeaconAPIWrapper(beacon, config.ETH2_CACHE_LOCATION)
+
+            self.LOGGER.debug("Using persisted validator index map")
+            validator_index = CachedValidatorIndexMap(config.LIDO_CACHE_LOCATION)
         else:
             lido_api = LidoWrapper(web3)
             beacon_api = BeaconAPIWrapper(beacon)
+            validator_index = ValidatorIndexMap()
 
         self._lido_api = lido_api
         self._beacon_api = beacon_api
+        self._validator_index = validator_index
+
+        self._state_id = 'head'
+        self._beacon_state = None
+        self._lido_operators_list = None
 
+    def refresh(self, state_id: str = 'head'):
+        # Finalized states are kept out of cache eviction until the next cycle - 'head' changes every slot anyway
+        if state_id != 'head':
+            self._beacon_api.pin(state_id)
+        if self._state_id != 'head' and self._state_id != state_id:
+            self._beacon_api.unpin(self._state_id)
+        self._state_id = state_id
         self._beacon_state = None
         self._lido_operators_list = None
+
+    def prefetch(self, state_id: str):
+        self._beacon_api.prefetch(state_id)
+
+    def cancel_prefetch(self):
+        self._beacon_api.cancel_prefetch()
+
+    def close(self, timeout: Optional[float] = None):
+        self._beacon_api.close(timeout)
+
     @property
     def lido_operator_list(self) -> LidoOperatorList:
         if self._lido_operators_list is None:
@@ -180,7 +217,7 @@ class BlockchainProverPayloadSource:
     def beacon_state(self) -> BeaconState:
         if self._beacon_state is None:
             self.LOGGER.info("Fetching beacon state")
-            all_eth_validators = self._beacon_api.validators()
+            all_eth_validators = self._beacon_api.validators(self._state_id)
             self._beacon_state = BeaconState(all_eth_validators)
         return self._beacon_state
 
@@ -189,7 +226,9 @@ class BlockchainProverPayloadSource:
         lido_operators = self.lido_operator_list
         return ProverPayload(
             beacon_state=beacon_state,
-            lido_operator_keys=[operator.key for operator in lido_operators.operators]
+            lido_operator_keys=lido_operators.keys,
+            validator_index=self._validator_index,
+            lido_operator_indices=lido_operators.operator_indices
         )
 
 
@@ -211,8 +250,24 @@ def main():
     cairo_interface = CairoInterface(
         args.bin_dir, args.node_rpc_url, config.CairoApps.TLV_PROVER,
         serializer=lambda payload: payload.to_cairo(),
+        input_writer=lambda payload, out: payload.write_cairo(out),
     )
 
+    if args.watch:
+        assert args.source == DataSource.LIVE, "--watch is only supported for live source"
+        LOGGER.info("Watching for new finalized epochs")
+        oracle = Oracle(prover_payload_source, cairo_interface, StubTLVContract(), dry_run=not args.submit)
+        reporter = None
+        if CACHE_METRICS.enabled:
+            reporter = CacheMetricsReporter(CACHE_METRICS, config.CACHE_METRICS_INTERVAL, config.CACHE_METRICS_FILE)
+            reporter.start()
+        try:
+            FinalityTrigger(oracle, prover_payload_source, BeaconEventStream(config.ETH2_API)).run()
+        finally:
+            if reporter is not None:
+                reporter.stop()
+        return
+
     prover_payload = prover_payload_source.get_prover_payload()
     LOGGER.info("Prover payload %s", prover_payload)
 
@@ -236,7 +291,14 @@ def main():
         str(prover_payload.lido_tlv),
         str(parsed_output.total_value_locked)
     )
+    for operator_tvl in prover_payload.lido_tlv_by_operator().values():
+        LOGGER.info(
+            f"Operator {operator_tvl.operator_index}: TVL={operator_tvl.total_value_locked}, "
+            f"validators={operator_tvl.validators}, missing keys={operator_tvl.missing_keys}"
+        )
     print("MTRs and TLV matched - success")
+    if CACHE_METRICS.enabled:
+        CacheMetricsReporter(CACHE_METRICS, config.CACHE_METRICS_INTERVAL, config.CACHE_METRICS_FILE).report()
 
 
 if __name__ == "__main__":
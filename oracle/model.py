@@ -1,12 +1,12 @@
 from dataclasses import dataclass
 
-from typing import List, TypedDict
+from typing import IO, List, TypedDict, Optional, Dict
 import logging
-from eth_typing import HexStr
 
 from api.eth_api import BeaconState, BeaconStateCairoSerialized
 from api.lido_api import LidoOperatorList, OperatorKeysCairoSerialized
-from utils import IntUtils
+from utils import IntUtils, Pubkey, PubkeyUtils
+from validator_index import ValidatorIndexMap
 
 DESTINATION_FOLDER = "."
 
@@ -21,33 +21,91 @@ class ProverPayloadSerialized(TypedDict):
     # total_value_locked: int
 
 
+@dataclass
+class OperatorTVL:
+    operator_index: Optional[int]
+    total_value_locked: int = 0
+    validators: int = 0
+    missing_keys: int = 0
+
+
 class ProverPayload:
     LOGGER = logging.getLogger(__name__ + ".ProverPayload")
 
-    def __init__(self, beacon_state: BeaconState, lido_operator_keys: List[HexStr]):
+    def __init__(
+            self, beacon_state: BeaconState, lido_operator_keys: List[Pubkey],
+            validator_index: Optional[ValidatorIndexMap] = None,
+            lido_operator_indices: Optional[List[int]] = None
+    ):
+        """
+        :param lido_operator_indices: operator_index of each of lido_operator_keys, if known
+        """
+        assert lido_operator_indices is None or len(lido_operator_indices) == len(lido_operator_keys), \
+            "Operator indices should be provided for every key"
         self.beacon_state = beacon_state
         self.lido_operator_keys = lido_operator_keys
+        self.lido_operator_indices = lido_operator_indices
+        self.validator_index = validator_index if validator_index is not None else ValidatorIndexMap()
+
+    @property
+    def lido_validator_indices(self) -> List[int]:
+        self.validator_index.update(self.beacon_state, self.lido_operator_keys)
+        return self.validator_index.indices_for(self.beacon_state, self.lido_operator_keys)
 
     @property
     def lido_operators_in_eth(self):
-        validators = [
-            self.beacon_state.find_validator(key)
-            for key in self.lido_operator_keys
-        ]
         return [
-            validator for validator in validators if validator is not None
+            self.beacon_state.validators[index]
+            for index in self.lido_validator_indices
         ]
 
+    def lido_tlv_by_operator(self) -> Dict[Optional[int], OperatorTVL]:
+        """
+        Totals, validator counts and missing (not on beacon chain) key counts per operator_index, in a single
+        pass over the keys. Keys are attributed to `None` operator if operator indices are not known.
+        """
+        self.validator_index.update(self.beacon_state, self.lido_operator_keys)
+        operator_indices = self.lido_operator_indices or [None] * len(self.lido_operator_keys)
+        balances = self.beacon_state.balances
+        index_of = self.validator_index.index_of
+        result: Dict[Optional[int], OperatorTVL] = {}
+        for key, operator_index in zip(self.lido_operator_keys, operator_indices):
+            operator_tvl = result.get(operator_index)
+            if operator_tvl is None:
+                operator_tvl = result[operator_index] = OperatorTVL(operator_index)
+            validator_index = index_of(self.beacon_state, key)
+            if validator_index is None:
+                operator_tvl.missing_keys += 1
+            else:
+                operator_tvl.validators += 1
+                operator_tvl.total_value_locked += balances[validator_index]
+        return result
+
     @property
     def lido_tlv(self) -> int:
-        return sum(validator.balance for validator in self.lido_operators_in_eth)
+        return sum(operator_tvl.total_value_locked for operator_tvl in self.lido_tlv_by_operator().values())
 
     def to_cairo(self) -> ProverPayloadSerialized:
         return ProverPayloadSerialized(
             beacon_state=self.beacon_state.to_cairo(),
-            validator_keys=self.lido_operator_keys,
+            validator_keys=[PubkeyUtils.to_hex_str(key) for key in self.lido_operator_keys],
         )
 
+    def write_cairo(self, out: IO[str]):
+        """
+        Streams `to_cairo` as compact json with sorted keys, without building the intermediate dicts
+        """
+        out.write('{"beacon_state":')
+        self.beacon_state.write_cairo(out)
+        out.write(',"validator_keys":[')
+        keys = self.lido_operator_keys
+        chunk = BeaconState.CAIRO_CHUNK
+        for start in range(0, len(keys), chunk):
+            if start:
+                out.write(",")
+            out.write(",".join(f'"0x{key.hex()}"' for key in keys[start:start + chunk]))
+        out.write("]}")
+
     def __repr__(self):
         return self.__str__()
 
@@ -1,6 +1,9 @@
 import logging
+import queue
+import threading
 from typing import Optional
 
+from api.beacon_events import BeaconEvent, BeaconEventStream
 from cairo import JobId, FactId
 from model import ProverPayload, ProverOutput
 
@@ -25,6 +28,27 @@ class ProverPayloadSource:
     def get_prover_payload(self) -> ProverPayload:
         raise NotImplementedError("Must be implemented in descendent class")
 
+    def refresh(self, state_id: str = 'head'):
+        """
+        Drops data fetched for the previous oracle cycle, next payload is built for the given beacon state
+        """
+        pass
+
+    def prefetch(self, state_id: str):
+        """
+        Starts fetching data for a beacon state expected to be used by a future cycle
+        """
+        pass
+
+    def cancel_prefetch(self):
+        pass
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Stops background work, waiting up to `timeout` seconds for it to finish
+        """
+        pass
+
 
 class Oracle:
     LOGGER = logging.getLogger(__name__ + ".Oracle")
@@ -93,3 +117,120 @@ class Oracle:
             return
 
         self._contract.update_tvl(prover_output)
+
+
+class FinalityTrigger:
+    """
+    Runs an oracle cycle as soon as the beacon node reports a new finalized epoch.
+
+    Events are read in a background thread; bursts of `finalized_checkpoint` events (e.g. after a node resyncs)
+    are debounced - the cycle starts once no newer checkpoint arrived for `debounce` seconds, and runs against
+    the latest one. `head` events are only tracked for logging.
+
+    While a cycle is running, the state at the start of the next epoch - the next expected checkpoint - is
+    prefetched, so the following cycle starts with warm data.
+    """
+    LOGGER = logging.getLogger(__name__ + ".FinalityTrigger")
+    FINALIZED_CHECKPOINT = 'finalized_checkpoint'
+    HEAD = 'head'
+    POLL_INTERVAL = 1.0
+    SLOTS_PER_EPOCH = 32
+    CLOSE_TIMEOUT = 10.0
+
+    def __init__(
+            self, oracle: Oracle, payload_source: ProverPayloadSource, event_stream: BeaconEventStream,
+            debounce: float = 2.0
+    ):
+        self._oracle = oracle
+        self._payload_source = payload_source
+        self._event_stream = event_stream
+        self._debounce = debounce
+        self._events: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._last_epoch = -1
+        self._head_slot = None
+        self._reader: Optional[threading.Thread] = None
+
+    @property
+    def last_epoch(self) -> int:
+        return self._last_epoch
+
+    def run(self, max_cycles: Optional[int] = None):
+        self._reader = threading.Thread(target=self._read_events, name="beacon-events", daemon=True)
+        self._reader.start()
+        cycles = 0
+        try:
+            while not self._stopped.is_set() and (max_cycles is None or cycles < max_cycles):
+                checkpoint = self._next_checkpoint()
+                if checkpoint is None:
+                    break
+                self._run_cycle(checkpoint)
+                cycles += 1
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopped.set()
+        self._event_stream.stop()
+        self._payload_source.close(self.CLOSE_TIMEOUT)
+
+    def _read_events(self):
+        try:
+            for event in self._event_stream.events():
+                if self._stopped.is_set():
+                    return
+                self._events.put(event)
+        except Exception:
+            self.LOGGER.exception("Reading beacon events failed")
+
+    def _is_new_checkpoint(self, event: BeaconEvent) -> bool:
+        if event.event == self.HEAD:
+            self._head_slot = event.data.get("slot")
+            return False
+        if event.event != self.FINALIZED_CHECKPOINT:
+            return False
+        try:
+            epoch, state_root = int(event.data["epoch"]), event.data["state"]
+        except (KeyError, TypeError, ValueError):
+            self.LOGGER.warning(f"Skipping malformed {self.FINALIZED_CHECKPOINT} event {event.data}")
+            return False
+        if not isinstance(state_root, str) or not state_root.startswith("0x"):
+            self.LOGGER.warning(f"Skipping {self.FINALIZED_CHECKPOINT} event with invalid state root {state_root!r}")
+            return False
+        return epoch > self._last_epoch
+
+    def _get_event(self, timeout: float) -> Optional[BeaconEvent]:
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            if not self._reader.is_alive() and not self._stopped.is_set():
+                raise RuntimeError("Beacon event reader stopped unexpectedly")
+            return None
+
+    def _next_checkpoint(self) -> Optional[BeaconEvent]:
+        checkpoint = None
+        while checkpoint is None:
+            if self._stopped.is_set():
+                return None
+            event = self._get_event(self.POLL_INTERVAL)
+            if event is not None and self._is_new_checkpoint(event):
+                checkpoint = event
+
+        while True:
+            event = self._get_event(self._debounce)
+            if event is None or self._stopped.is_set():
+                return checkpoint
+            if self._is_new_checkpoint(event) and int(event.data["epoch"]) > int(checkpoint.data["epoch"]):
+                checkpoint = event
+
+    def _run_cycle(self, checkpoint: BeaconEvent):
+        epoch, state_root = int(checkpoint.data["epoch"]), checkpoint.data["state"]
+        self.LOGGER.info(f"New finalized epoch {epoch} (state {state_root}, head slot {self._head_slot})")
+        self._last_epoch = epoch
+        self._payload_source.refresh(state_root)
+        # the next checkpoint, by slot - resolved to the state root its event will report
+        self._payload_source.prefetch(str((epoch + 1) * self.SLOTS_PER_EPOCH))
+        try:
+            self._oracle.run_oracle()
+        except Exception:
+            self.LOGGER.exception(f"Oracle cycle for epoch {epoch} failed")
@@ -0,0 +1,144 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from api.beacon_events import BeaconEvent, BeaconEventStream
+from oracle import FinalityTrigger, ProverPayloadSource
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _checkpoint(epoch: int) -> str:
+    return _sse("finalized_checkpoint", {"block": f"0xb{epoch}", "state": f"0xs{epoch}", "epoch": str(epoch)})
+
+
+class StandInBeaconNode:
+    """
+    Local stand-in for the beacon node events endpoint - sends the scripted events, then keeps connection open
+    """
+    def __init__(self, events):
+        self.requested_paths = []
+        self._closed = threading.Event()
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                node.requested_paths.append(self.path)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                self.wfile.write(": keep-alive\n\n".encode())
+                for event in events:
+                    self.wfile.write(event.encode())
+                    self.wfile.flush()
+                node._closed.wait(5)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._closed.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubOracle:
+    def __init__(self):
+        self.runs = 0
+
+    def run_oracle(self):
+        self.runs += 1
+
+
+class RecordingPayloadSource(ProverPayloadSource):
+    def __init__(self):
+        self.states = []
+        self.prefetched = []
+
+    def refresh(self, state_id: str = 'head'):
+        self.states.append(state_id)
+
+    def prefetch(self, state_id: str):
+        self.prefetched.append(state_id)
+
+
+class TestBeaconEventStream(unittest.TestCase):
+    def test_parse_lines(self):
+        lines = [
+            ": comment", "event: head", 'data: {"slot":', 'data: "10"}', "", "event: empty", "",
+            "event: head", 'data: {"slot', "",
+        ]
+        self.assertEqual(
+            list(BeaconEventStream.parse_lines(lines)),
+            [BeaconEvent("head", {"slot": "10"})]
+        )
+
+    def test_reads_events(self):
+        with StandInBeaconNode([_sse("head", {"slot": "1"}), _checkpoint(1)]) as node:
+            stream = BeaconEventStream(node.url)
+            events = stream.events()
+            received = [next(events), next(events)]
+            stream.stop()
+
+        self.assertEqual(received, [BeaconEvent("head", {"slot": "1"}), BeaconEvent("finalized_checkpoint", {
+            "block": "0xb1", "state": "0xs1", "epoch": "1"
+        })])
+        self.assertEqual(node.requested_paths, ["/eth/v1/events?topics=head%2Cfinalized_checkpoint"])
+
+
+class FailingEventStream:
+    def events(self):
+        raise ValueError("broken stream")
+        yield
+
+    def stop(self):
+        pass
+
+
+class TestFinalityTrigger(unittest.TestCase):
+    def test_fails_when_reader_dies(self):
+        trigger = FinalityTrigger(StubOracle(), RecordingPayloadSource(), FailingEventStream())
+        with self.assertRaises(RuntimeError):
+            trigger.run(max_cycles=1)
+
+    def test_debounces_checkpoints(self):
+        events = [_sse("head", {"slot": "64"}), _checkpoint(1), _checkpoint(3), _checkpoint(2)]
+        with StandInBeaconNode(events) as node:
+            oracle, payload_source = StubOracle(), RecordingPayloadSource()
+            trigger = FinalityTrigger(oracle, payload_source, BeaconEventStream(node.url), debounce=0.5)
+            trigger.run(max_cycles=1)
+
+        self.assertEqual(oracle.runs, 1)
+        self.assertEqual(payload_source.states, ["0xs3"])
+        self.assertEqual(payload_source.prefetched, [str(4 * FinalityTrigger.SLOTS_PER_EPOCH)])
+        self.assertEqual(trigger.last_epoch, 3)
+
+    def test_skips_malformed_checkpoints(self):
+        events = [
+            _sse("finalized_checkpoint", {"block": "0xb5", "epoch": "5"}),
+            _sse("finalized_checkpoint", {"block": "0xb6", "state": "0xs6", "epoch": "six"}),
+            _sse("finalized_checkpoint", {"block": "0xb7", "state": None, "epoch": "7"}),
+            _checkpoint(2),
+        ]
+        with StandInBeaconNode(events) as node:
+            oracle, payload_source = StubOracle(), RecordingPayloadSource()
+            trigger = FinalityTrigger(oracle, payload_source, BeaconEventStream(node.url), debounce=0.5)
+            trigger.run(max_cycles=1)
+
+        self.assertEqual(payload_source.states, ["0xs2"])
+        self.assertEqual(trigger.last_epoch, 2)
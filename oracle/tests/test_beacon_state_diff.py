@@ -0,0 +1,52 @@
+import json
+import unittest
+from decimal import Decimal
+
+from api.eth_api import BeaconState, BeaconStateDiff, Validator
+from json_protocol import CustomJsonEncoder
+from utils import PubkeyUtils
+
+
+def _beacon_state(*balances: int) -> BeaconState:
+    return BeaconState([
+        Validator(PubkeyUtils.from_int(index + 1), Decimal(balance))
+        for index, balance in enumerate(balances)
+    ])
+
+
+class TestBeaconStateDiff(unittest.TestCase):
+    def test_compute(self):
+        diff = BeaconStateDiff.compute(_beacon_state(10, 20, 30), _beacon_state(10, 25, 28, 40))
+        self.assertEqual(diff.base_validators, 3)
+        self.assertEqual(diff.total_validators, 4)
+        self.assertEqual(diff.changed_indices, [1, 2])
+        self.assertEqual(diff.balance_deltas, [5, -2])
+        self.assertEqual([validator.balance_int for validator in diff.new_validators], [40])
+
+    def test_empty(self):
+        diff = BeaconStateDiff.compute(_beacon_state(10, 20), _beacon_state(10, 20))
+        self.assertTrue(diff.is_empty)
+
+    def test_apply(self):
+        old, new = _beacon_state(10, 20, 30), _beacon_state(10, 25, 28, 40)
+        applied = BeaconStateDiff.compute(old, new).apply(old)
+        self.assertEqual(applied.validators, new.validators)
+
+    def test_apply_to_wrong_base(self):
+        diff = BeaconStateDiff.compute(_beacon_state(10, 20), _beacon_state(10, 20, 30))
+        with self.assertRaises(AssertionError):
+            diff.apply(_beacon_state(10))
+
+    def test_balance_delta(self):
+        old, new = _beacon_state(10, 20, 30), _beacon_state(10, 25, 28, 40)
+        diff = BeaconStateDiff.compute(old, new)
+        indices = [0, 2, 3, 7]
+        expected = sum(new.gather_balances([0, 2, 3])) - sum(old.gather_balances([0, 2]))
+        self.assertEqual(diff.balance_delta(indices), expected)
+
+    def test_roundtrip(self):
+        old, new = _beacon_state(10, 20, 30), _beacon_state(10, 25, 28, 40)
+        diff = BeaconStateDiff.compute(old, new)
+        serialized = json.loads(json.dumps(diff.to_dict(), cls=CustomJsonEncoder))
+        restored = BeaconStateDiff.from_dict(serialized)
+        self.assertEqual(restored.apply(old).validators, new.validators)
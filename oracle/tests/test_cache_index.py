@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from disk_cache.cache import JsonDiskCache
+from disk_cache.index import CacheIndex
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _payload(size: int):
+    return {"data": "x" * size}
+
+
+class TestCacheIndex(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = self._folder.name
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def _cache(self, max_bytes=None, ttl=None):
+        index = CacheIndex(self.folder, max_bytes, ttl, clock=self.clock)
+        return JsonDiskCache(self.folder, compression={}, index=index), index
+
+    def test_lru_eviction(self):
+        cache, index = self._cache(max_bytes=2500)
+        for name in ["a", "b"]:
+            cache.save_cache(_payload(1000), "validators", name)
+            self.clock.now += CacheIndex.ACCESS_RESOLUTION + 1
+        cache.read_cache("validators", "a")
+
+        cache.save_cache(_payload(1000), "validators", "c")
+        self.assertEqual(sorted(index.entries()), ["validators/a", "validators/c"])
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "validators", "b.json")))
+        self.assertLessEqual(index.total_bytes, 2500)
+
+    def test_ttl(self):
+        cache, index = self._cache(ttl={"validators": 100})
+        cache.save_cache(_payload(10), "validators", "a")
+        cache.save_cache(_payload(10), "other", "a")
+        self.clock.now += 101
+
+        self.assertEqual(cache.read_cache("validators", "a"), {})
+        self.assertEqual(cache.read_cache("other", "a"), _payload(10))
+        self.assertEqual(sorted(index.entries()), ["other/a"])
+
+    def test_pinned_entries_are_kept(self):
+        cache, index = self._cache(max_bytes=1500, ttl={"validators": 100})
+        cache.pin("validators", "finalized")
+        cache.save_cache(_payload(1000), "validators", "finalized")
+        self.clock.now += 101
+        cache.save_cache(_payload(1000), "validators", "head")
+
+        self.assertEqual(cache.read_cache("validators", "finalized"), _payload(1000))
+        self.assertEqual(sorted(index.entries()), ["validators/finalized", "validators/head"])
+
+        cache.unpin("validators", "finalized")
+        self.assertEqual(index.evict(), ["validators/finalized"])
+        self.assertEqual(cache.read_cache("validators", "finalized"), {})
@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+from api.eth_api import Validator
+from disk_cache.cache import JsonDiskCache
+from disk_cache.columnar import TypedColumnarDiskCache
+from disk_cache.index import CacheIndex
+from disk_cache.memory import MemoryTier
+from disk_cache.metrics import CacheMetricsRegistry, CacheMetricsReporter, Histogram
+from utils import PubkeyUtils
+
+VALIDATORS = [Validator(PubkeyUtils.from_int(key), Decimal(32 * 10**9)) for key in range(10)]
+
+
+class TestCacheMetrics(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.folder = self._folder.name
+        self.registry = CacheMetricsRegistry(enabled=True)
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def test_disabled_registry_hands_out_nothing(self):
+        registry = CacheMetricsRegistry(enabled=False)
+        self.assertIsNone(registry.namespace('eth2'))
+        self.assertEqual(registry.snapshot(), {})
+
+    def test_counts_json_cache_reads_and_writes(self):
+        metrics = self.registry.namespace('lido')
+        cache = JsonDiskCache(self.folder, compression={}, metrics=metrics)
+        cache.read_cache('entry')
+        cache.save_cache([{"value": 1}], 'entry')
+        cache.read_cache('entry')
+        list(cache.iter_cache('entry'))
+
+        snapshot = self.registry.snapshot()['lido']
+        size = os.path.getsize(os.path.join(self.folder, 'entry.json'))
+        self.assertEqual((snapshot['hits'], snapshot['misses']), (2, 1))
+        self.assertEqual(snapshot['bytes_read'], 2 * size)
+        self.assertEqual(snapshot['bytes_written'], size)
+        self.assertAlmostEqual(snapshot['hit_ratio'], 2 / 3)
+        self.assertEqual(snapshot['decode_seconds']['count'], 2)
+        self.assertEqual(snapshot['write_seconds']['count'], 1)
+
+    def test_times_sharded_writes(self):
+        metrics = self.registry.namespace('lido')
+        cache = JsonDiskCache(self.folder, compression={}, shard_size={'entry': 10}, metrics=metrics)
+        cache.save_cache([{"value": value} for value in range(1000)], 'entry')
+
+        write_seconds = metrics.snapshot()['write_seconds']
+        self.assertEqual(write_seconds['count'], 1)
+        self.assertTrue(0 <= write_seconds['max'] < 60)
+
+    def test_counts_memory_hits_and_evictions(self):
+        metrics = self.registry.namespace('eth2')
+        index = CacheIndex(self.folder, max_bytes=1, metrics=metrics)
+        cache = TypedColumnarDiskCache(
+            self.folder, Validator.COLUMNS, Validator.from_row, Validator.to_row,
+            index=index, memory=MemoryTier(2**20), metrics=metrics
+        )
+        cache.save_models(VALIDATORS, 'validators', 'a')
+        self.assertEqual(list(cache.read_model('validators', 'a')), VALIDATORS)
+        self.assertEqual(list(cache.read_model('validators', 'a')), VALIDATORS)
+        cache.save_models(VALIDATORS, 'validators', 'b')
+
+        snapshot = metrics.snapshot()
+        self.assertEqual((snapshot['hits'], snapshot['memory_hits'], snapshot['misses']), (1, 1, 0))
+        self.assertEqual(snapshot['evictions'], 1)
+        self.assertEqual(snapshot['evicted_bytes'], snapshot['bytes_written'] // 2)
+
+    def test_histogram_buckets(self):
+        histogram = Histogram()
+        for value in [0.0005, 0.002, 0.002, 100]:
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 4)
+        self.assertEqual(snapshot['max'], 100)
+        self.assertEqual(snapshot['buckets']['<=0.001'], 1)
+        self.assertEqual(snapshot['buckets']['<=0.005'], 2)
+        self.assertEqual(snapshot['buckets']['+inf'], 1)
+
+    def test_reporter_dumps_snapshot(self):
+        self.registry.namespace('web3').miss()
+        path = os.path.join(self.folder, 'metrics.json')
+        CacheMetricsReporter(self.registry, interval=60, path=path).start().stop()
+
+        with open(path) as metrics_file:
+            self.assertEqual(json.load(metrics_file)['web3']['misses'], 1)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from starkware.cairo.bootloaders.hash_program import compute_program_hash_chain
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo_files
+
+from cairo import CompiledProgramCache
+
+PROGRAM = """
+%builtins output
+from starkware.cairo.common.serialize import serialize_word
+from lib.constants import get_answer
+
+func main{output_ptr: felt*}() {
+    let answer = get_answer();
+    serialize_word(answer);
+    return ();
+}
+"""
+
+CONSTANTS = """
+func get_answer() -> felt {
+    return %s;
+}
+"""
+
+
+class TestCompiledProgramCache(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.sources = os.path.join(self._folder.name, "src")
+        os.makedirs(os.path.join(self.sources, "lib"))
+        self.program_path = self._write("main.cairo", PROGRAM)
+        self._write(os.path.join("lib", "constants.cairo"), CONSTANTS % 42)
+        self.cache = CompiledProgramCache(os.path.join(self._folder.name, "cache"))
+        self.compiled = 0
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def _write(self, name: str, content: str) -> str:
+        path = os.path.join(self.sources, name)
+        with open(path, "w") as source_file:
+            source_file.write(content)
+        return path
+
+    def _compile(self):
+        self.compiled += 1
+        return compile_cairo_files([self.program_path], DEFAULT_PRIME, cairo_path=[self.sources])
+
+    def _load(self, cache=None):
+        return (cache or self.cache).load_or_compile(self.program_path, [self.sources], self._compile)
+
+    def test_finds_sources_on_cairo_path(self):
+        self.assertEqual(
+            CompiledProgramCache.source_files(self.program_path, [self.sources]),
+            {"__main__": self.program_path, "lib.constants": os.path.join(self.sources, "lib", "constants.cairo")}
+        )
+
+    def test_compiles_once(self):
+        program, program_hash = self._load()
+        cached_program, cached_hash = self._load()
+
+        self.assertEqual(self.compiled, 1)
+        self.assertEqual(cached_hash, program_hash)
+        self.assertEqual(compute_program_hash_chain(cached_program), program_hash)
+        self.assertEqual(cached_program.data, program.data)
+
+    def test_recompiles_when_imported_module_or_compiler_changes(self):
+        _, program_hash = self._load()
+        self._write(os.path.join("lib", "constants.cairo"), CONSTANTS % 43)
+        _, changed_hash = self._load()
+        self._load(CompiledProgramCache(os.path.join(self._folder.name, "cache"), compiler_version="0.0.0"))
+
+        self.assertEqual(self.compiled, 3)
+        self.assertNotEqual(changed_hash, program_hash)
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from starkware.cairo.bootloaders.hash_program import compute_program_hash_chain
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+
+from cairo import CairoInterface, CairoRunCache, InProcessCairoRunner
+from tests.test_cairo_runner import PROGRAM
+
+
+class CountingRunner(InProcessCairoRunner):
+    def __init__(self):
+        super().__init__()
+        self.runs = 0
+
+    def run(self, program, program_input):
+        self.runs += 1
+        return super().run(program, program_input)
+
+
+class TestCairoRunCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        program = compile_cairo(PROGRAM, DEFAULT_PRIME)
+        cls.program_cache = mock.Mock()
+        cls.program_cache.load_or_compile.return_value = program, compute_program_hash_chain(program)
+
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.runner = CountingRunner()
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def _interface(self, max_runs: int = 8) -> CairoInterface:
+        return CairoInterface(
+            "", "", "program.cairo", serializer=lambda values: {"values": values},
+            program_cache=self.program_cache, runner=self.runner,
+            run_cache=CairoRunCache(self._folder.name, max_runs=max_runs)
+        )
+
+    def test_reuses_output_and_pie_of_unchanged_input(self):
+        interface = self._interface()
+        self.assertEqual(interface.run([1, 2]), [3])
+        cairo_pie = interface.cairo_pie
+
+        other = self._interface()
+        self.assertEqual(other.run([1, 2]), [3])
+        self.assertEqual(other.cairo_pie, cairo_pie)
+        self.assertEqual(self.runner.runs, 1)
+
+        self.assertEqual(other.run([1, 3]), [4])
+        self.assertEqual(self.runner.runs, 2)
+
+    def test_skips_submission_of_registered_fact(self):
+        client = mock.Mock()
+        client.submit_cairo_pie.return_value = "job-1"
+        client.get_fact.return_value = "0xfact"
+        client.fact_registered.return_value = False
+
+        interface = self._interface()
+        interface._client = client
+        interface.run([1, 2])
+        self.assertEqual((interface.submit(), interface.get_fact()), ("job-1", "0xfact"))
+
+        other = self._interface()
+        other._client = client
+        other.run([1, 2])
+        client.fact_registered.return_value = True
+        self.assertEqual((other.submit(), other.get_fact()), ("job-1", "0xfact"))
+
+        self.assertEqual(client.submit_cairo_pie.call_count, 1)
+        self.assertEqual(client.get_fact.call_count, 1)
+        # the PIE is never needed, so it is not loaded
+        self.assertIsNone(other._cairo_pie)
+
+    def test_reuses_job_in_progress_and_resubmits_failed_one(self):
+        client = mock.Mock()
+        client.submit_cairo_pie.side_effect = ["job-1", "job-2"]
+        client.get_fact.return_value = "0xfact"
+        client.fact_registered.return_value = False
+        interface = self._interface()
+        interface._client = client
+        for status, job_id in [(None, "job-1"), ("IN_PROGRESS", "job-1"), ("FAILED: out of resources", "job-2")]:
+            client.get_job_status.return_value = status
+            interface.run([1, 2])
+            self.assertEqual(interface.submit(), job_id)
+            interface.get_fact()
+
+        self.assertEqual(client.submit_cairo_pie.call_count, 2)
+
+    def test_runs_again_if_pie_was_removed(self):
+        interface = self._interface()
+        interface.run([1, 2])
+        cairo_pie = interface.cairo_pie
+
+        other = self._interface()
+        self.assertEqual(other.run([1, 2]), [3])
+        os.remove(other._run_cache._pie_path(other._run_digest))
+        self.assertEqual(other.cairo_pie, cairo_pie)
+        self.assertEqual(self.runner.runs, 2)
+        self.assertIsNotNone(other._run_cache.load(other._run_digest))
+
+    def test_keeps_most_recent_runs(self):
+        interface = self._interface(max_runs=2)
+        for value in [1, 2, 1, 3]:
+            interface.run([value])
+        self.assertEqual(self.runner.runs, 3)
+
+        runs_folder = os.path.join(self._folder.name, CairoRunCache.NAMESPACE)
+        self.assertEqual(len([name for name in os.listdir(runs_folder) if name.endswith(".pie.zip")]), 2)
+        interface.run([1])
+        interface.run([2])
+        self.assertEqual(self.runner.runs, 4)
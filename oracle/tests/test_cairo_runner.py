@@ -0,0 +1,44 @@
+import json
+import shutil
+import tempfile
+import unittest
+
+from starkware.cairo.bootloaders.generate_fact import get_program_output
+from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
+from starkware.cairo.lang.compiler.cairo_compile import compile_cairo
+from starkware.cairo.sharp.sharp_client import init_client
+
+from cairo import InProcessCairoRunner
+
+PROGRAM = """
+%builtins output
+from starkware.cairo.common.serialize import serialize_word
+
+func main{output_ptr: felt*}() {
+    alloc_locals;
+    local total;
+    %{ ids.total = sum(int(value) for value in program_input["values"]) %}
+    serialize_word(total);
+    return ();
+}
+"""
+
+
+class TestInProcessCairoRunner(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.program = compile_cairo(PROGRAM, DEFAULT_PRIME)
+
+    def test_runs_on_in_memory_input(self):
+        cairo_pie = InProcessCairoRunner().run(self.program, {"values": [1, "2", 3]})
+        self.assertEqual(get_program_output(cairo_pie), [6])
+
+    @unittest.skipUnless(shutil.which("cairo-run"), "cairo-run is not installed")
+    def test_same_pie_as_cairo_run(self):
+        program_input = {"values": [1, 2, 3]}
+        with tempfile.NamedTemporaryFile("w") as input_file:
+            json.dump(program_input, input_file)
+            input_file.flush()
+            expected = init_client(bin_dir="", node_rpc_url="").run_program(self.program, input_file.name)
+
+        self.assertEqual(InProcessCairoRunner().run(self.program, program_input), expected)
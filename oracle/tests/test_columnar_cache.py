@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+from api.eth_api import Validator
+from disk_cache.columnar import Column, ColumnarTable, TypedColumnarDiskCache
+from utils import PubkeyUtils
+
+VALIDATORS = [Validator(PubkeyUtils.from_int(key), Decimal(key * 32 * 10**9)) for key in range(1, 6)]
+
+
+class TestColumnarTable(unittest.TestCase):
+    COLUMNS = [Column.fixed_bytes('key', 3), Column.uint64('value')]
+
+    def test_roundtrip(self):
+        rows = [(b"abc", 1), (b"def", 2**64 - 1), (b"ghi", 0)]
+        table = ColumnarTable(ColumnarTable.encode(self.COLUMNS, rows))
+
+        self.assertEqual(list(table.iter_rows()), rows)
+        self.assertEqual(bytes(table.column('key')), b"abcdefghi")
+        self.assertEqual(len(table), 3)
+
+    def test_rejects_invalid_values(self):
+        with self.assertRaises(ValueError):
+            ColumnarTable.encode(self.COLUMNS, [(b"ab", 1)])
+        with self.assertRaises(ValueError):
+            ColumnarTable.encode(self.COLUMNS, [(b"abc", -1)])
+
+    def test_detects_corruption(self):
+        encoded = bytearray(ColumnarTable.encode(self.COLUMNS, [(b"abc", 1)]))
+        encoded[-1] ^= 0xff
+        with self.assertRaises(ValueError):
+            ColumnarTable(encoded)
+        with self.assertRaises(ValueError):
+            ColumnarTable(b"JSON" + bytes(ColumnarTable.HEADER.size))
+
+
+class TestTypedColumnarDiskCache(unittest.TestCase):
+    def test_validators_roundtrip(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = TypedColumnarDiskCache(folder, Validator.COLUMNS, Validator.from_row, Validator.to_row)
+            self.assertEqual(list(cache.read_model('validators', 'head')), [])
+
+            cache.save_models(VALIDATORS, 'validators', 'head')
+            self.assertTrue(os.path.exists(os.path.join(folder, 'validators', 'head.cols')))
+            self.assertEqual(list(cache.read_model('validators', 'head')), VALIDATORS)
+
+            # overwriting keeps previously returned tables readable
+            table = cache.read_table('validators', 'head')
+            cache.save_models(VALIDATORS[:1], 'validators', 'head')
+            self.assertEqual(len(list(table.iter_rows())), len(VALIDATORS))
+            self.assertEqual(list(cache.read_model('validators', 'head')), VALIDATORS[:1])
@@ -0,0 +1,197 @@
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+
+from disk_cache.cache import JsonDiskCache, TypedJsonDiskCache
+from disk_cache.files import file_lock
+from json_protocol import JsonArrayStream
+
+def _entries(folder: str):
+    # lock files are left in place - removing them is not safe while other processes might be waiting on them
+    return sorted(name for name in os.listdir(folder) if not name.endswith(".lock"))
+
+
+VALUE = {"validators": [{"pubkey": "0x01", "balance": 32}] * 100}
+
+
+class TestJsonDiskCacheCompression(unittest.TestCase):
+    def test_compressed_roundtrip(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = JsonDiskCache(folder, compression={'gz': 'gzip', 'xz': 'lzma'})
+            for namespace, extension in [('gz', '.json.gz'), ('xz', '.json.xz'), ('plain', '.json')]:
+                cache.save_cache(VALUE, namespace, 'head')
+                self.assertEqual(_entries(os.path.join(folder, namespace)), ['head' + extension])
+                self.assertEqual(cache.read_cache(namespace, 'head'), VALUE)
+
+            self.assertLess(
+                os.path.getsize(os.path.join(folder, 'gz', 'head.json.gz')),
+                os.path.getsize(os.path.join(folder, 'plain', 'head.json')) // 10
+            )
+
+    def test_reads_entries_written_with_other_settings(self):
+        with tempfile.TemporaryDirectory() as folder:
+            JsonDiskCache(folder, compression={}).save_cache(VALUE, 'validators', 'head')
+
+            cache = JsonDiskCache(folder, compression={'validators': 'gzip'})
+            self.assertEqual(cache.read_cache('validators', 'head'), VALUE)
+
+            # re-saving converts the entry, leaving a single file
+            cache.save_cache(VALUE, 'validators', 'head')
+            self.assertEqual(_entries(os.path.join(folder, 'validators')), ['head.json.gz'])
+            self.assertEqual(JsonDiskCache(folder, compression={}).read_cache('validators', 'head'), VALUE)
+
+    def test_detects_compression_by_content(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = JsonDiskCache(folder, compression={'validators': 'lzma'})
+            cache.save_cache(VALUE, 'validators', 'head')
+            os.rename(os.path.join(folder, 'validators', 'head.json.xz'), os.path.join(folder, 'validators', 'head.json'))
+
+            self.assertEqual(JsonDiskCache(folder, compression={}).read_cache('validators', 'head'), VALUE)
+
+    def test_miss(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = JsonDiskCache(folder)
+            self.assertEqual(cache.read_cache('missing'), {})
+            self.assertEqual(cache.read_cache_raw('missing'), "{}")
+
+
+def _append_under_lock(path: str, marker: str):
+    with file_lock(path):
+        with open(path, "a") as target:
+            target.write(marker + "-start\n")
+            target.flush()
+            time.sleep(0.05)
+            target.write(marker + "-end\n")
+
+
+class TestJsonDiskCacheConcurrency(unittest.TestCase):
+    def test_readers_never_see_partial_writes(self):
+        values = [{"values": [index] * 20000} for index in range(5)]
+        with tempfile.TemporaryDirectory() as folder:
+            cache = JsonDiskCache(folder, compression={})
+            cache.save_cache(values[0], 'entry')
+            errors = []
+
+            def read():
+                for _ in range(50):
+                    try:
+                        self.assertIn(cache.read_cache('entry'), values)
+                    except Exception as error:
+                        errors.append(error)
+
+            reader = threading.Thread(target=read)
+            reader.start()
+            for value in values[1:] * 5:
+                cache.save_cache(value, 'entry')
+            reader.join()
+
+            self.assertEqual(errors, [])
+            self.assertEqual(_entries(folder), ['entry.json'])
+
+    def test_file_lock_excludes_other_processes(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "log")
+            processes = [multiprocessing.Process(target=_append_under_lock, args=(path, str(i))) for i in range(3)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+            with open(path) as log:
+                lines = log.read().splitlines()
+            self.assertEqual(len(lines), 6)
+            for start, end in zip(lines[::2], lines[1::2]):
+                self.assertEqual(start.replace("start", "end"), end)
+
+    def test_file_lock_is_reentrant(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = JsonDiskCache(folder)
+            with cache.write_lock('entry'):
+                cache.save_cache({"value": 1}, 'entry')
+            self.assertEqual(cache.read_cache('entry'), {"value": 1})
+
+
+def _parse_record(record):
+    return record["index"]
+
+
+class TestJsonDiskCacheSharding(unittest.TestCase):
+    RECORDS = [{"index": index, "pubkey": "0x" + "ab" * 48} for index in range(1000)]
+
+    def _cache(self, folder, load_workers=2):
+        return TypedJsonDiskCache(
+            folder, _parse_record, lambda index: {"index": index}, compression={'validators': 'gzip'},
+            shard_size={'validators': 300}, load_workers=load_workers
+        )
+
+    def test_sharded_roundtrip(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = JsonDiskCache(folder, compression={'validators': 'gzip'}, shard_size={'validators': 300})
+            cache.save_cache(self.RECORDS, 'validators', 'head')
+
+            entries = _entries(os.path.join(folder, 'validators'))
+            self.assertEqual(len(entries), 5)
+            self.assertIn('head.shards.json', entries)
+            self.assertEqual(cache.read_cache('validators', 'head'), self.RECORDS)
+            self.assertEqual(list(cache.iter_cache('validators', 'head')), self.RECORDS)
+            self.assertEqual(cache.load_shards('validators', 'head'), self.RECORDS)
+            self.assertEqual(json.loads(cache.read_cache_raw('validators', 'head')), self.RECORDS)
+
+            # small values are stored unsharded, replacing the shards
+            cache.save_cache(self.RECORDS[:10], 'validators', 'head')
+            self.assertEqual(_entries(os.path.join(folder, 'validators')), ['head.json.gz'])
+            self.assertIsNone(cache.load_shards('validators', 'head'))
+
+            cache.save_cache(self.RECORDS, 'validators', 'head')
+            cache.clear_cache('validators', 'head')
+            self.assertEqual(_entries(os.path.join(folder, 'validators')), [])
+
+    def test_parallel_load_keeps_order(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = self._cache(folder)
+            cache.save_cache(self.RECORDS, 'validators', 'head')
+            self.assertEqual(list(cache.read_model('validators', 'head')), list(range(1000)))
+
+            cache.save_cache(self.RECORDS[::-1], 'validators', 'head')
+            sequential = self._cache(folder, load_workers=1)
+            self.assertEqual(list(sequential.read_model('validators', 'head')), list(range(999, -1, -1)))
+            self.assertEqual(len(_entries(os.path.join(folder, 'validators'))), 5)
+
+
+class TestJsonArrayStream(unittest.TestCase):
+    DOCUMENTS = ['[]', ' [ 1 , 22, {"a": [1, 2]}, "x,]" ] ', '[1.5e3, -0.25e-3, true, null]']
+
+    def test_matches_json_loads(self):
+        for document in self.DOCUMENTS + [json.dumps(VALUE["validators"], indent=4)]:
+            for chunk_size in [1, 3, 64 * 1024]:
+                self.assertEqual(
+                    list(JsonArrayStream(io.StringIO(document), chunk_size=chunk_size)), json.loads(document)
+                )
+
+    def test_rejects_malformed(self):
+        for document in ['{}', '[1,', '[1 2]', '', '[1,]', '[1.]']:
+            with self.assertRaises(json.JSONDecodeError):
+                list(JsonArrayStream(io.StringIO(document), chunk_size=2))
+
+    def test_streams_cache_entries(self):
+        records = [{"index": index, "pubkey": "0x" + "ab" * 48} for index in range(20000)]
+        with tempfile.TemporaryDirectory() as folder:
+            cache = JsonDiskCache(folder, compression={'validators': 'gzip'})
+            cache.save_cache(records, 'validators', 'head')
+
+            tracemalloc.start()
+            try:
+                count = sum(1 for _ in cache.iter_cache('validators', 'head'))
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            self.assertEqual(count, len(records))
+            self.assertLess(peak, 1024 * 1024)
+            self.assertEqual(list(cache.iter_cache('missing')), [])
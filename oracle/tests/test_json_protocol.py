@@ -0,0 +1,65 @@
+import json
+import unittest
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from api.eth_api import Validator
+from json_protocol import (
+    CustomJsonEncoder, DecimalJsonProtocol, IntJsonProtocol, JsonSchema, StrJsonProtocol, DateTimeJsonProtocol
+)
+from utils import PubkeyUtils
+
+
+@dataclass
+class Record:
+    name: str
+    amount: Decimal
+    count: int
+    created: datetime
+
+
+RECORD_SCHEMA = JsonSchema(Record, {
+    'name': StrJsonProtocol(),
+    'amount': DecimalJsonProtocol(),
+    'count': IntJsonProtocol(),
+    'created': DateTimeJsonProtocol(),
+})
+
+
+class TestJsonSchema(unittest.TestCase):
+    def test_roundtrip(self):
+        record = Record("12345", Decimal("1.5"), 3, datetime(2022, 1, 2, tzinfo=timezone.utc))
+        encoded = json.loads(json.dumps(RECORD_SCHEMA.encode(record)))
+
+        self.assertEqual(encoded, {"name": "12345", "amount": "1.5", "count": 3, "created": "2022-01-02T00:00:00+00:00"})
+        decoded = RECORD_SCHEMA.decode(encoded)
+        self.assertEqual(decoded, record)
+        # numeric-looking strings are left alone unless declared otherwise
+        self.assertIsInstance(decoded.name, str)
+
+    def test_validator_matches_previous_format(self):
+        validator = Validator(PubkeyUtils.from_int(42), Decimal(32 * 10**9))
+        previous = json.loads(json.dumps(validator.to_dict(), cls=CustomJsonEncoder))
+
+        self.assertEqual(validator.to_json(), previous)
+        self.assertEqual(Validator.from_json(previous), validator)
+
+    def test_validator_pubkeys_are_padded_like_from_dict(self):
+        for pubkey in ['0x01', '0x1']:
+            raw = {'pubkey': pubkey, 'balance': '32000000000'}
+            self.assertEqual(Validator.from_json(raw), Validator.from_dict(raw))
+            self.assertEqual(Validator.from_json(raw).pubkey, PubkeyUtils.from_int(1))
+
+
+class TestCustomJsonEncoder(unittest.TestCase):
+    def test_dispatches_by_type(self):
+        class Amount(Decimal):
+            pass
+
+        self.assertEqual(
+            json.loads(json.dumps({"a": Decimal("2.5"), "b": Amount("1"), "c": 1}, cls=CustomJsonEncoder)),
+            {"a": "2.5", "b": "1", "c": 1}
+        )
+        with self.assertRaises(TypeError):
+            json.dumps({"a": object()}, cls=CustomJsonEncoder)
@@ -0,0 +1,91 @@
+import unittest
+
+from lido_sdk.methods.typing import Operator, OperatorKey
+
+from api.lido_api import IncrementalKeySync, OperatorKeyAdapter
+from utils import PubkeyUtils
+
+
+def _key(operator_index: int, index: int, used: bool, version: int = 0) -> OperatorKeyAdapter:
+    return OperatorKeyAdapter(OperatorKey(
+        index=index, operator_index=operator_index,
+        key=PubkeyUtils.from_int(operator_index * 1000 + index * 10 + version),
+        depositSignature=b'signature', used=used
+    ))
+
+
+def _operator(index: int, total: int, used: int) -> Operator:
+    return Operator(
+        index=index, active=True, name=f"operator{index}", rewardAddress="0x0", stakingLimit=total,
+        stoppedValidators=0, totalSigningKeys=total, usedSigningKeys=used
+    )
+
+
+class FakeRegistry:
+    """
+    On-chain keys, as key versions per operator - the first `used` keys of each operator are used
+    """
+    def __init__(self, keys, used):
+        self.requested = []
+        self.keys = keys
+        self.used = used
+
+    def operators(self):
+        return [_operator(index, len(versions), self.used[index]) for index, versions in self.keys.items()]
+
+    def fetch(self, key_indexes):
+        self.requested.extend(key_indexes)
+        return [
+            _key(operator_index, index, used=index < self.used[operator_index], version=self.keys[operator_index][index])
+            for operator_index, index in key_indexes
+        ]
+
+
+def _ids(keys):
+    return [(key.operator_index, key.index, key.used, key.key) for key in keys]
+
+
+class TestIncrementalKeySync(unittest.TestCase):
+    def test_no_changes(self):
+        cached = [_key(0, 0, True), _key(0, 1, False), _key(1, 0, True)]
+        registry = FakeRegistry({0: [0, 0], 1: [0]}, used={0: 1, 1: 1})
+        synced, changed = IncrementalKeySync.sync(cached, registry.operators(), registry.fetch)
+
+        self.assertFalse(changed)
+        # unused keys could have been replaced, so they are always refetched
+        self.assertEqual(registry.requested, [(0, 1)])
+        self.assertEqual(_ids(synced), _ids(cached))
+
+    def test_fetches_unused_and_new_keys(self):
+        cached = [_key(0, 0, True), _key(0, 1, False), _key(1, 0, True)]
+        registry = FakeRegistry({0: [0, 0, 0, 0], 1: [0, 0], 2: [0]}, used={0: 2, 1: 1, 2: 0})
+        synced, changed = IncrementalKeySync.sync(cached, registry.operators(), registry.fetch)
+
+        self.assertTrue(changed)
+        self.assertEqual(registry.requested, [(0, 1), (0, 2), (0, 3), (1, 1), (2, 0)])
+        self.assertEqual(
+            [(key.operator_index, key.index, key.used) for key in synced],
+            [(0, 0, True), (0, 1, True), (0, 2, False), (0, 3, False), (1, 0, True), (1, 1, False), (2, 0, False)]
+        )
+
+    def test_refetches_unused_keys_after_removal(self):
+        cached = [_key(0, 0, True), _key(0, 1, False), _key(0, 2, False)]
+        registry = FakeRegistry({0: [0, 1]}, used={0: 1})
+        synced, changed = IncrementalKeySync.sync(cached, registry.operators(), registry.fetch)
+
+        self.assertTrue(changed)
+        self.assertEqual(registry.requested, [(0, 1)])
+        self.assertEqual(_ids(synced), _ids([_key(0, 0, True), _key(0, 1, False, version=1)]))
+
+    def test_removal_and_additions_keeping_count_are_picked_up(self):
+        # one unused key removed - the last one moves into its slot - and two added: 3 keys before, 4 after
+        cached = [_key(0, 0, True), _key(0, 1, False), _key(0, 2, False)]
+        registry = FakeRegistry({0: [0, 0, 1, 1]}, used={0: 1})
+        registry.keys[0][1] = 2
+        synced, changed = IncrementalKeySync.sync(cached, registry.operators(), registry.fetch)
+
+        self.assertTrue(changed)
+        self.assertEqual(
+            _ids(synced),
+            _ids([_key(0, 0, True), _key(0, 1, False, 2), _key(0, 2, False, 1), _key(0, 3, False, 1)])
+        )
@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from api.eth_api import Validator
+from disk_cache.cache import TypedJsonDiskCache
+from disk_cache.columnar import TypedColumnarDiskCache
+from disk_cache.memory import FileStamp, MemoryTier
+from utils import PubkeyUtils
+
+VALIDATORS = [Validator(PubkeyUtils.from_int(key), Decimal(key)) for key in range(1, 4)]
+
+
+def _stamp(size: int, inode: int = 1) -> FileStamp:
+    return FileStamp("path", inode, 0, size)
+
+
+class TestMemoryTier(unittest.TestCase):
+    def test_lru_by_bytes(self):
+        tier = MemoryTier(max_bytes=250)
+        tier.put("a", _stamp(1), ["a"], size=100)
+        tier.put("b", _stamp(1), ["b"], size=100)
+        tier.get("a", _stamp(1))
+        tier.put("c", _stamp(1), ["c"], size=100)
+
+        self.assertIsNone(tier.get("b", _stamp(1)))
+        self.assertEqual(tier.get("a", _stamp(1)), ["a"])
+        self.assertEqual(tier.total_bytes, 200)
+
+        tier.put("huge", _stamp(1), ["huge"], size=300)
+        self.assertIsNone(tier.get("huge", _stamp(1)))
+
+    def test_stale_stamp_invalidates(self):
+        tier = MemoryTier(max_bytes=250)
+        tier.put("a", _stamp(1), ["a"], size=100)
+        self.assertIsNone(tier.get("a", _stamp(1, inode=2)))
+        self.assertEqual((len(tier), tier.total_bytes), (0, 0))
+
+    def test_estimate_size(self):
+        self.assertGreater(MemoryTier.estimate_size(VALIDATORS * 100), MemoryTier.estimate_size(VALIDATORS) * 50)
+
+
+class TestCachesWithMemoryTier(unittest.TestCase):
+    def _check_cache(self, cache, parse_target):
+        cache.save_models(VALIDATORS, 'validators', 'head')
+        self.assertEqual(list(cache.read_model('validators', 'head')), VALIDATORS)
+        with mock.patch.object(*parse_target) as parse:
+            self.assertEqual(list(cache.read_model('validators', 'head')), VALIDATORS)
+            parse.assert_not_called()
+
+        cache.save_models(VALIDATORS[:1], 'validators', 'head')
+        self.assertEqual(list(cache.read_model('validators', 'head')), VALIDATORS[:1])
+
+    def test_json_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = TypedJsonDiskCache(folder, Validator.from_dict, Validator.to_dict, memory=MemoryTier(2**20))
+            self._check_cache(cache, (cache, 'iter_cache'))
+
+    def test_columnar_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = TypedColumnarDiskCache(
+                folder, Validator.COLUMNS, Validator.from_row, Validator.to_row, memory=MemoryTier(2**20)
+            )
+            self._check_cache(cache, (cache, 'read_table'))
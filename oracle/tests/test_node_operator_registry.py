@@ -0,0 +1,93 @@
+import tempfile
+import unittest
+
+import config
+
+from api.node_operator_registry import CachedNodeOperatorRegistryMirror, MTRLeafAdded, NodeOperatorRegistryMirror
+from merkle.merkle_tree import ProgressiveMerkleTreeBuilder
+from utils import PubkeyUtils
+
+
+class FakeRegistryLogs:
+    """
+    Emits MTRLeafAdded like NodeOperatorRegistry.add_key - two leaves per key, both with the first leaf index
+    """
+    def __init__(self):
+        self.events = []
+        self.keys = []
+        self.requested_ranges = []
+
+    def add_key(self, block_number: int, key_value: int):
+        key = PubkeyUtils.from_int(key_value)
+        first_leaf = len(self.keys) * 2
+        for part in PubkeyUtils.to_keccak_input(key):
+            self.events.append(MTRLeafAdded(block_number, len(self.events), first_leaf, part))
+        self.keys.append(key)
+
+    def fetch(self, from_block: int, to_block: int):
+        self.requested_ranges.append((from_block, to_block))
+        return [event for event in reversed(self.events) if from_block <= event.block_number <= to_block]
+
+    def expected_root(self) -> bytes:
+        builder = ProgressiveMerkleTreeBuilder()
+        for key in self.keys:
+            builder.add_values(PubkeyUtils.to_keccak_input(key))
+        return builder.build().hash()
+
+
+class TestNodeOperatorRegistryMirror(unittest.TestCase):
+    def test_empty_tree_root(self):
+        mirror = NodeOperatorRegistryMirror(FakeRegistryLogs().fetch, lambda: 0)
+        self.assertEqual(mirror.get_keys_root(), ProgressiveMerkleTreeBuilder().build().hash())
+
+    def test_incremental_sync(self):
+        logs = FakeRegistryLogs()
+        mirror = NodeOperatorRegistryMirror(logs.fetch, lambda: 20, confirmations=0)
+        for block_number, key_value in [(1, 10), (1, 11), (5, 12)]:
+            logs.add_key(block_number, key_value)
+
+        self.assertEqual(mirror.sync(), 6)
+        self.assertEqual(mirror.get_keys_root(), logs.expected_root())
+
+        logs.add_key(21, 13)
+        self.assertEqual(mirror.sync(25), 2)
+        self.assertEqual(mirror.get_keys_root(), logs.expected_root())
+        self.assertEqual(logs.requested_ranges, [(0, 20), (21, 25)])
+
+    def test_unconfirmed_blocks_not_applied(self):
+        logs = FakeRegistryLogs()
+        logs.add_key(50, 10)
+        logs.add_key(100, 11)
+        head = [150]
+        mirror = NodeOperatorRegistryMirror(logs.fetch, lambda: head[0])
+
+        self.assertEqual(mirror.sync(), 2)
+        self.assertEqual(mirror.next_block, 150 - config.WEB3_RPC_CACHE_CONFIRMATIONS + 1)
+        head[0] = 100 + config.WEB3_RPC_CACHE_CONFIRMATIONS
+        self.assertEqual(mirror.sync(), 2)
+        self.assertEqual(mirror.get_keys_root(), logs.expected_root())
+
+    def test_missed_events_detected(self):
+        logs = FakeRegistryLogs()
+        logs.add_key(1, 10)
+        logs.add_key(3, 11)
+        mirror = NodeOperatorRegistryMirror(logs.fetch, lambda: 3, next_block=2, confirmations=0)
+
+        with self.assertRaises(ValueError):
+            mirror.sync()
+        self.assertEqual((mirror.tree.leaf_count, mirror.next_block), (0, 2))
+
+    def test_persists_branch_and_cursor(self):
+        logs = FakeRegistryLogs()
+        logs.add_key(1, 10)
+        logs.add_key(2, 11)
+        with tempfile.TemporaryDirectory() as folder:
+            CachedNodeOperatorRegistryMirror(logs.fetch, lambda: 2, "registry", folder, confirmations=0).sync()
+            logs.add_key(3, 12)
+
+            restored = CachedNodeOperatorRegistryMirror(logs.fetch, lambda: 3, "registry", folder, confirmations=0)
+            self.assertEqual(restored.next_block, 3)
+            self.assertEqual(restored.sync(), 2)
+
+        self.assertEqual(restored.get_keys_root(), logs.expected_root())
+        self.assertEqual(logs.requested_ranges, [(0, 2), (3, 3)])
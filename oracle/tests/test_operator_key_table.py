@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from lido_sdk.methods.typing import OperatorKey
+
+from api.lido_api import LidoOperatorList, OperatorKeyAdapter, OperatorKeyTable
+from utils import PubkeyUtils
+
+
+def _key(operator_index: int, index: int, used: bool) -> OperatorKeyAdapter:
+    return OperatorKeyAdapter(OperatorKey(
+        index=index, operator_index=operator_index, key=PubkeyUtils.from_int(operator_index * 1000 + index + 1),
+        depositSignature=bytes([index]) * 96, used=used
+    ))
+
+
+KEYS = [_key(0, 0, True), _key(0, 1, False), _key(3, 0, True), _key(3, 1, True)]
+
+
+def _as_tuples(keys):
+    return [(key.operator_index, key.index, key.key, key.used) for key in keys]
+
+
+class TestOperatorKeyTable(unittest.TestCase):
+    def test_in_memory_roundtrip(self):
+        table = OperatorKeyTable.from_keys(KEYS)
+
+        self.assertEqual(len(table), 4)
+        self.assertEqual(_as_tuples(table), _as_tuples(KEYS))
+        self.assertEqual(_as_tuples([table[-1]]), _as_tuples(KEYS[-1:]))
+        self.assertEqual(_as_tuples(table[1:3]), _as_tuples(KEYS[1:3]))
+        self.assertEqual(table.keys, [key.key for key in KEYS])
+        self.assertEqual(table.operator_indices, [0, 0, 3, 3])
+        self.assertIsNone(table[0].deposit_signature)
+        with self.assertRaises(IndexError):
+            table[4]
+
+    def test_file_roundtrip_with_signatures(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path, signatures_path = os.path.join(folder, "keys"), os.path.join(folder, "sigs")
+            OperatorKeyTable.write(path, KEYS, signatures_path)
+            self.assertEqual(os.path.getsize(path), OperatorKeyTable.HEADER.size + 4 * OperatorKeyTable.RECORD.size)
+
+            with OperatorKeyTable.open(path, signatures_path) as table:
+                self.assertEqual(_as_tuples(table), _as_tuples(KEYS))
+                self.assertEqual([key.deposit_signature for key in table], [key.deposit_signature for key in KEYS])
+
+                # rewriting the file does not affect tables that are already open
+                OperatorKeyTable.write(path, KEYS[:1])
+                self.assertEqual(len(table), 4)
+                self.assertEqual(table.keys, [key.key for key in KEYS])
+
+    def test_rejects_foreign_data(self):
+        with self.assertRaises(ValueError):
+            OperatorKeyTable(b"NOPE" + bytes(6))
+        with self.assertRaises(ValueError):
+            OperatorKeyTable(OperatorKeyTable.encode(KEYS)[:-1])
+
+    def test_operator_list_over_table(self):
+        from_list = LidoOperatorList(KEYS)
+        from_table = LidoOperatorList(OperatorKeyTable.from_keys(KEYS))
+
+        self.assertEqual(from_table.keys, from_list.keys)
+        self.assertEqual(from_table.operator_indices, from_list.operator_indices)
+        self.assertEqual(from_table.to_cairo(), from_list.to_cairo())
+        self.assertEqual(from_table.merkle_tree_root().hash(), from_list.merkle_tree_root().hash())
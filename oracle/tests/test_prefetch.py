@@ -0,0 +1,145 @@
+import tempfile
+import threading
+import unittest
+
+import requests
+
+from api.eth_api import CachedBeaconAPIWrapper
+from api.prefetch import BackgroundPrefetcher
+from utils import PubkeyUtils
+
+
+class FakeBeacon:
+    """
+    Serves a fixed validator set for any state; `get_validators` blocks until `release` is set.
+    Slots in `skipped` have no block
+    """
+    def __init__(self, count: int = 5, skipped=()):
+        self.requested = []
+        self.skipped = set(skipped)
+        self.fetching = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self._count = count
+
+    def get_hash_root(self, state_id):
+        return {"data": {"root": f"0xroot{state_id}"}}
+
+    def get_block_header(self, block_id):
+        if int(block_id) in self.skipped:
+            response = requests.Response()
+            response.status_code = 404
+            raise requests.HTTPError(response=response)
+        return {"data": {"header": {"message": {"state_root": f"0xblock{block_id}"}}}}
+
+    def get_validators(self, state_id):
+        self.requested.append(state_id)
+        self.fetching.set()
+        self.release.wait(5)
+        return {"data": [
+            {"balance": str(32 * 10**9 + key), "validator": {"pubkey": PubkeyUtils.to_hex_str(PubkeyUtils.from_int(key))}}
+            for key in range(self._count)
+        ]}
+
+
+class TestBackgroundPrefetcher(unittest.TestCase):
+    def test_keeps_only_latest_pending(self):
+        started, release, warmed = threading.Event(), threading.Event(), []
+
+        def warm(key, cancelled):
+            if key == "first":
+                started.set()
+                release.wait(5)
+            warmed.append((key, cancelled.is_set()))
+
+        prefetcher = BackgroundPrefetcher(warm, max_pending=1)
+        prefetcher.submit("first")
+        started.wait(5)
+        prefetcher.submit("second")
+        prefetcher.submit("third")
+        prefetcher.submit("third")
+        release.set()
+
+        self.assertTrue(prefetcher.wait(5))
+        self.assertEqual(warmed, [("first", False), ("third", False)])
+        prefetcher.close(5)
+
+    def test_cancel_signals_running_task(self):
+        started, warmed = threading.Event(), []
+
+        def warm(key, cancelled):
+            started.set()
+            cancelled.wait(5)
+            warmed.append((key, cancelled.is_set()))
+
+        prefetcher = BackgroundPrefetcher(warm)
+        prefetcher.submit("state")
+        started.wait(5)
+        prefetcher.cancel()
+
+        self.assertTrue(prefetcher.wait(5))
+        self.assertEqual(warmed, [("state", True)])
+        prefetcher.close(5)
+        with self.assertRaises(RuntimeError):
+            prefetcher.submit("state")
+
+    def test_failures_are_not_propagated(self):
+        def warm(key, cancelled):
+            raise ValueError(key)
+
+        prefetcher = BackgroundPrefetcher(warm)
+        prefetcher.submit("state")
+        self.assertTrue(prefetcher.wait(5))
+        prefetcher.close(5)
+
+
+class TestCachedBeaconPrefetch(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.beacon = FakeBeacon()
+        self.api = CachedBeaconAPIWrapper(self.beacon, self._folder.name)
+
+    def tearDown(self):
+        self.api.close(5)
+        self._folder.cleanup()
+
+    def test_prefetched_state_is_served_from_cache(self):
+        self.api.prefetch("64")
+        self.assertTrue(self.api._prefetcher.wait(5))
+
+        validators = self.api.validators("0xblock64")
+        self.assertEqual(len(validators), 5)
+        self.assertEqual(self.beacon.requested, ["0xblock64"])
+
+    def test_prefetched_checkpoint_with_skipped_slot_is_keyed_by_block_state(self):
+        # the state at slot 64 differs from the one the finalized_checkpoint event reports - the post-state of block 62
+        self.beacon.skipped = {63, 64}
+        self.api.prefetch("64")
+        self.assertTrue(self.api._prefetcher.wait(5))
+
+        self.api.validators("0xblock62")
+        self.assertEqual(self.beacon.requested, ["0xblock62"])
+
+    def test_request_during_prefetch_waits_for_it(self):
+        self.beacon.release.clear()
+        self.api.prefetch("0xstate")
+        self.assertTrue(self.beacon.fetching.wait(5))
+        result = []
+        reader = threading.Thread(target=lambda: result.append(self.api.validators("0xstate")))
+        reader.start()
+        self.beacon.release.set()
+        reader.join(5)
+
+        self.assertEqual(len(result[0]), 5)
+        self.assertEqual(self.beacon.requested, ["0xstate"])
+
+    def test_cancelled_prefetch_is_not_saved(self):
+        self.beacon.release.clear()
+        self.api.prefetch("0xstate")
+        self.beacon.fetching.wait(5)
+        self.api.cancel_prefetch()
+        self.beacon.release.set()
+        self.assertTrue(self.api._prefetcher.wait(5))
+
+        self.api.validators("0xstate")
+        self.assertEqual(self.beacon.requested, ["0xstate", "0xstate"])
@@ -0,0 +1,61 @@
+import io
+import json
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from api.eth_api import BeaconState, Validator
+from cairo import CairoInterface
+from json_protocol import CustomJsonEncoder
+from model import ProverPayload, OperatorTVL
+from utils import PubkeyUtils
+
+
+def _beacon_state(*balances: int) -> BeaconState:
+    return BeaconState([
+        Validator(PubkeyUtils.from_int(index + 1), Decimal(balance))
+        for index, balance in enumerate(balances)
+    ])
+
+
+class TestProverPayload(unittest.TestCase):
+    def setUp(self):
+        self.beacon_state = _beacon_state(10, 20, 30, 40)
+        # keys 1-4 are on the beacon chain, 5 and 6 are not
+        self.keys = [PubkeyUtils.from_int(key) for key in [1, 3, 5, 2, 4, 6]]
+
+    def test_tlv_by_operator(self):
+        payload = ProverPayload(self.beacon_state, self.keys, lido_operator_indices=[0, 0, 0, 1, 2, 2])
+        self.assertEqual(payload.lido_tlv_by_operator(), {
+            0: OperatorTVL(0, total_value_locked=40, validators=2, missing_keys=1),
+            1: OperatorTVL(1, total_value_locked=20, validators=1, missing_keys=0),
+            2: OperatorTVL(2, total_value_locked=40, validators=1, missing_keys=1),
+        })
+        self.assertEqual(payload.lido_tlv, 100)
+
+    def test_tlv_without_operator_indices(self):
+        payload = ProverPayload(self.beacon_state, self.keys)
+        self.assertEqual(payload.lido_tlv_by_operator(), {
+            None: OperatorTVL(None, total_value_locked=100, validators=4, missing_keys=2),
+        })
+        self.assertEqual(payload.lido_tlv, 100)
+
+    def test_streamed_cairo_input_matches_serialized(self):
+        payload = ProverPayload(self.beacon_state, self.keys)
+        with mock.patch.object(BeaconState, "CAIRO_CHUNK", 3):
+            out = io.StringIO()
+            payload.write_cairo(out)
+
+        expected = json.dumps(payload.to_cairo(), sort_keys=True, separators=(",", ":"), cls=CustomJsonEncoder)
+        self.assertEqual(out.getvalue(), expected)
+
+    def test_cairo_input_from_serializer(self):
+        interface = CairoInterface("", "", "program.cairo", serializer=lambda value: value, program_cache=mock.Mock())
+        out = io.StringIO()
+        interface.write_input({"values": [Decimal(1), "0x02"]}, out)
+        self.assertEqual(out.getvalue(), '{"values":["1","0x02"]}')
+
+        with mock.patch("config.CAIRO_INPUT_PRETTY", True):
+            out = io.StringIO()
+            interface.write_input({"values": [Decimal(1)]}, out)
+        self.assertEqual(out.getvalue(), '{\n    "values": [\n        "1"\n    ]\n}')
@@ -0,0 +1,33 @@
+import unittest
+
+from hypothesis import given, strategies as st
+
+from utils import IntUtils, PubkeyUtils
+
+pubkeys = st.binary(min_size=48, max_size=48)
+
+
+class TestPubkeyUtils(unittest.TestCase):
+    @given(pubkeys)
+    def test_hex_roundtrip(self, pubkey):
+        hex_str = PubkeyUtils.to_hex_str(pubkey)
+        self.assertEqual(len(hex_str), 98)
+        self.assertEqual(PubkeyUtils.from_hex_str(hex_str), pubkey)
+
+    @given(pubkeys)
+    def test_short_hex(self, pubkey):
+        as_int = IntUtils.from_bytes(pubkey, 'big')
+        self.assertEqual(PubkeyUtils.from_hex_str(IntUtils.to_hex_str(as_int)), pubkey)
+        self.assertEqual(PubkeyUtils.from_int(as_int), pubkey)
+
+    @given(pubkeys)
+    def test_zero_padded_bytes(self, pubkey):
+        self.assertEqual(PubkeyUtils.from_bytes(b'\x00' * 32 + pubkey), pubkey)
+
+    @given(pubkeys)
+    def test_keccak_input_matches_generic_implementation(self, pubkey):
+        self.assertEqual(PubkeyUtils.to_keccak_input(pubkey), IntUtils.pubkey_bytes_to_keccak_input(pubkey))
+        self.assertEqual(
+            PubkeyUtils.to_keccak_input(pubkey),
+            IntUtils.pubkey_to_keccak_input(IntUtils.from_bytes(pubkey, 'big'))
+        )
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+from api.eth_api import Validator
+from disk_cache.snapshots import SnapshotStore
+from utils import PubkeyUtils
+
+
+def _validators(count: int, changed=(), delta: int = 0):
+    return [
+        Validator(PubkeyUtils.from_int(key), Decimal(32 * 10**9 + (delta if key in changed else 0)))
+        for key in range(count)
+    ]
+
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.store = SnapshotStore(
+            self._folder.name, Validator.COLUMNS, Validator.from_row, Validator.to_row, rebase_ratio=0.1
+        )
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def _objects(self):
+        return sorted(os.listdir(os.path.join(self._folder.name, SnapshotStore.OBJECTS)))
+
+    def test_stores_deltas_against_base(self):
+        snapshots = {
+            "1": _validators(100),
+            "2": _validators(102, changed={3, 50}, delta=5),
+            "3": _validators(103, changed={7}, delta=-5),
+        }
+        for slot, validators in snapshots.items():
+            self.store.save_models(validators, 'validators', slot)
+
+        for slot, validators in snapshots.items():
+            self.assertEqual(list(self.store.read_model('validators', slot)), validators)
+        # a base, plus changed balances and appended rows of each delta
+        self.assertEqual(len(self._objects()), 5)
+        self.assertEqual(list(self.store.read_model('validators', 'missing')), [])
+
+    def test_balance_changes_store_only_balances(self):
+        store = SnapshotStore(self._folder.name, Validator.COLUMNS, Validator.from_row, Validator.to_row)
+        store.save_models(_validators(1000), 'validators', '1')
+        every_balance = _validators(1000, changed=set(range(1000)), delta=1)
+        some_balances = _validators(1000, changed=set(range(10)), delta=1)
+        store.save_models(every_balance, 'validators', '2')
+        store.save_models(some_balances, 'validators', '3')
+
+        manifest = store._load_manifest()
+        base_size = os.path.getsize(store._object_path(manifest["base"]))
+        # the whole balance column if every balance changed, positions and balances if only some did
+        for slot, validators, max_ratio in [('2', every_balance, 0.2), ('3', some_balances, 0.01)]:
+            delta = manifest["snapshots"][f"validators/{slot}"]["delta"]
+            self.assertEqual(list(delta["changed"]), ["balance"])
+            self.assertLess(os.path.getsize(store._object_path(delta["changed"]["balance"])), base_size * max_ratio)
+            self.assertEqual(list(store.read_model('validators', slot)), validators)
+
+    def test_objects_removed_while_reading_are_a_miss(self):
+        self.store.save_models(_validators(10), 'validators', '1')
+        for name in self._objects():
+            os.remove(os.path.join(self._folder.name, SnapshotStore.OBJECTS, name))
+
+        self.assertEqual(list(self.store.read_model('validators', '1')), [])
+
+    def test_rebases_large_deltas(self):
+        self.store.save_models(_validators(100), 'validators', '1')
+        large_change = _validators(100, changed=set(range(100)), delta=1)
+        self.store.save_models(large_change, 'validators', '2')
+        self.store.save_models(_validators(101, changed=set(range(100)), delta=1), 'validators', '3')
+
+        manifest = self.store._load_manifest()
+        self.assertEqual(manifest["snapshots"]["validators/2"]["base"], manifest["base"])
+        self.assertIsNone(manifest["snapshots"]["validators/2"]["delta"])
+        self.assertEqual(manifest["snapshots"]["validators/3"]["base"], manifest["base"])
+        self.assertEqual(list(self.store.read_model('validators', '1')), _validators(100))
+        self.assertEqual(list(self.store.read_model('validators', '2')), large_change)
+
+    def test_clear_removes_unreferenced_objects(self):
+        self.store.save_models(_validators(100), 'validators', '1')
+        self.store.save_models(_validators(101), 'validators', '2')
+        self.store.clear_cache('validators', '2')
+
+        self.assertEqual(self.store.keys(), ['validators/1'])
+        self.assertEqual(len(self._objects()), 1)
+
+    def _store(self, **kwargs) -> SnapshotStore:
+        self.now = 0
+        return SnapshotStore(
+            self._folder.name, Validator.COLUMNS, Validator.from_row, Validator.to_row, rebase_ratio=0.1,
+            clock=lambda: self.now, **kwargs
+        )
+
+    def test_expired_snapshots_are_misses_and_dropped(self):
+        store = self._store(ttl={'validators': 100})
+        store.save_models(_validators(100), 'validators', '1')
+        store.pin('validators', '2')
+        store.save_models(_validators(101), 'validators', '2')
+        self.now = 101
+        self.assertEqual(list(store.read_model('validators', '1')), [])
+        self.assertEqual(list(store.read_model('validators', '2')), _validators(101))
+
+        store.save_models(_validators(102), 'validators', '3')
+        self.assertEqual(store.keys(), ['validators/2', 'validators/3'])
+
+    def test_drops_oldest_unpinned_snapshots_over_max_bytes(self):
+        store = self._store()
+        store.save_models(_validators(100), 'validators', '1')
+        base_size = sum(os.path.getsize(os.path.join(self._folder.name, SnapshotStore.OBJECTS, name))
+                        for name in self._objects())
+
+        store = self._store(max_bytes=base_size)
+        store.pin('validators', '1')
+        for slot in range(2, 5):
+            self.now = slot
+            store.save_models(_validators(100 + slot), 'validators', str(slot))
+        # the pinned base and the latest snapshot are kept, the appended rows of dropped ones are collected
+        self.assertEqual(store.keys(), ['validators/1', 'validators/4'])
+        self.assertEqual(len(self._objects()), 2)
+        self.assertEqual(list(store.read_model('validators', '4')), _validators(104))
+
+        store.unpin('validators', '1')
+        self.now = 5
+        store.save_models(_validators(105), 'validators', '5')
+        self.assertEqual(store.keys(), ['validators/5'])
@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+from decimal import Decimal
+
+from api.eth_api import BeaconState, Validator
+from utils import Pubkey, PubkeyUtils
+from validator_index import CachedValidatorIndexMap, ValidatorIndexMap
+
+
+def _key(value: int) -> Pubkey:
+    return PubkeyUtils.from_int(value)
+
+
+def _beacon_state(*keys: int) -> BeaconState:
+    return BeaconState([Validator(_key(key), Decimal(key * 10)) for key in keys])
+
+
+class ReadTrackingList(list):
+    def __init__(self, values, read):
+        super().__init__(values)
+        self._read = read
+
+    def __getitem__(self, index):
+        self._read.append(index)
+        return super().__getitem__(index)
+
+
+class TestValidatorIndexMap(unittest.TestCase):
+    def test_resolves_indices(self):
+        index_map = ValidatorIndexMap()
+        beacon_state = _beacon_state(1, 2, 3, 4)
+        index_map.update(beacon_state, [_key(4), _key(2), _key(5)])
+
+        self.assertEqual(index_map.indices_for(beacon_state, [_key(4), _key(2), _key(5)]), [3, 1])
+        self.assertEqual(index_map.scanned_validators, 4)
+
+    def test_extends_map_only_with_appended_validators(self):
+        index_map = ValidatorIndexMap()
+        index_map.update(_beacon_state(1, 2), [_key(3)])
+
+        read = []
+        new_state = _beacon_state(1, 2, 3, 4)
+        validators = new_state.validators
+        new_state.validators = ReadTrackingList(validators, read)
+        self.assertTrue(index_map.update(new_state, [_key(3), _key(1)]))
+        self.assertEqual(index_map.indices_for(new_state, [_key(1), _key(3), _key(4)]), [0, 2, 3])
+        # the last scanned validator is checked, the new ones added - the prefix is not scanned again
+        self.assertEqual(sorted(set(read)), [0, 1, 2, 3])
+        self.assertEqual(read.count(1), 1)
+
+    def test_no_changes_after_full_scan(self):
+        index_map = ValidatorIndexMap()
+        beacon_state = _beacon_state(1, 2, 3)
+        self.assertTrue(index_map.update(beacon_state, [_key(2), _key(7)]))
+        self.assertFalse(index_map.update(beacon_state, [_key(2), _key(7)]))
+
+    def test_ignores_indices_beyond_beacon_state(self):
+        index_map = ValidatorIndexMap()
+        index_map.update(_beacon_state(1, 2, 3), [_key(3)])
+        self.assertEqual(index_map.indices_for(_beacon_state(1, 2), [_key(3)]), [])
+
+    def test_rebuilds_map_of_another_state(self):
+        index_map = ValidatorIndexMap()
+        index_map.update(_beacon_state(1, 2, 3), [_key(2), _key(3)])
+        other_state = _beacon_state(3, 1, 2, 4)
+
+        self.assertEqual(index_map.indices_for(other_state, [_key(2), _key(3)]), [])
+        self.assertIsNone(index_map.index_of(other_state, _key(2)))
+        self.assertTrue(index_map.update(other_state, [_key(2), _key(3)]))
+        self.assertEqual(index_map.indices_for(other_state, [_key(2), _key(3)]), [2, 0])
+
+    def test_persists_scanned_pubkeys(self):
+        beacon_state = _beacon_state(1, 2, 3)
+        with tempfile.TemporaryDirectory() as folder:
+            CachedValidatorIndexMap(folder).update(_beacon_state(1, 2), [_key(2)])
+            CachedValidatorIndexMap(folder).update(beacon_state, [_key(2)])
+            restored = CachedValidatorIndexMap(folder)
+
+            self.assertEqual(restored.pubkeys(), [_key(1), _key(2), _key(3)])
+            self.assertFalse(restored.update(beacon_state, [_key(3)]))
+            self.assertEqual(restored.indices_for(beacon_state, [_key(3), _key(1)]), [2, 0])
+
+            restored.update(_beacon_state(4, 5), [])
+            self.assertEqual(CachedValidatorIndexMap(folder).pubkeys(), [_key(4), _key(5)])
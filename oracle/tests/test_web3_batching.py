@@ -0,0 +1,78 @@
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from api.web3_batching import BatchingHTTPProvider
+
+
+class StandInNode:
+    """
+    Local JSON-RPC stand-in - answers eth_call with the call data, records received payloads
+    """
+    def __init__(self):
+        self.payloads = []
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                node.payloads.append(payload)
+                requests = payload if isinstance(payload, list) else [payload]
+                responses = [
+                    {"jsonrpc": "2.0", "id": request["id"], "result": request["params"][0]["data"]}
+                    if request["method"] == "eth_call" else
+                    {"jsonrpc": "2.0", "id": request["id"], "result": "0x1"}
+                    for request in requests
+                ]
+                body = json.dumps(responses if isinstance(payload, list) else responses[0]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _eth_call(provider, value: int):
+    return provider.make_request("eth_call", [{"to": "0x0", "data": hex(value)}, "latest"])
+
+
+class TestBatchingHTTPProvider(unittest.TestCase):
+    def test_coalesces_concurrent_calls(self):
+        with StandInNode() as node:
+            provider = BatchingHTTPProvider(node.url, batch_size=8, parallel_batches=2, linger=0.2)
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                responses = list(executor.map(lambda value: _eth_call(provider, value), range(16)))
+
+        self.assertEqual([response["result"] for response in responses], [hex(value) for value in range(16)])
+        self.assertTrue(all(isinstance(payload, list) for payload in node.payloads))
+        self.assertLess(len(node.payloads), 16)
+        self.assertTrue(all(len(payload) <= 8 for payload in node.payloads))
+
+    def test_other_methods_not_batched(self):
+        with StandInNode() as node:
+            provider = BatchingHTTPProvider(node.url)
+            response = provider.make_request("eth_chainId", [])
+
+        self.assertEqual(response["result"], "0x1")
+        self.assertIsInstance(node.payloads[0], dict)
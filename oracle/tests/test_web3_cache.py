@@ -0,0 +1,187 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import config
+from api.eth_api import get_web3_connection
+from api.lido_api import LidoWrapper
+from api.web3_cache import RPCCacheMiddleware, RPCResponseStore
+
+BLOCK_HASH = "0x" + "ab" * 32
+
+
+class FakeNode:
+    """
+    make_request stand-in - chain 5 with head at block 256, eth_call answers with its call data
+    """
+    def __init__(self, genesis: str = "0x" + "01" * 32):
+        self.requests = []
+        self.genesis = genesis
+
+    def __call__(self, method, params):
+        self.requests.append(method)
+        if method == "eth_chainId":
+            return {"jsonrpc": "2.0", "id": 1, "result": "0x5"}
+        if method == "eth_blockNumber":
+            return {"jsonrpc": "2.0", "id": 1, "result": hex(256)}
+        if method == "eth_getBlockByNumber" and params[0] == "0x0":
+            return {"jsonrpc": "2.0", "id": 1, "result": {"number": "0x0", "hash": self.genesis}}
+        if method == "eth_call" and params[0]["data"] == "0xbad":
+            return {"jsonrpc": "2.0", "id": 1, "error": {"code": -32000, "message": "execution reverted"}}
+        return {"jsonrpc": "2.0", "id": 1, "result": params[0].get("data", [])}
+
+
+class StandInRPCNode:
+    """
+    Local JSON-RPC endpoint answering with a FakeNode - eth_call returns `call_result`, whatever the call
+    """
+    def __init__(self, call_result: str):
+        self.node = FakeNode()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                responses = [stand_in.respond(request) for request in (payload if isinstance(payload, list) else [payload])]
+                body = json.dumps(responses if isinstance(payload, list) else responses[0]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._call_result = call_result
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def respond(self, request):
+        response = self.node(request["method"], request["params"])
+        if request["method"] == "eth_call":
+            response = {**response, "result": self._call_result}
+        return {**response, "id": request["id"]}
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _call(data: str, block):
+    return "eth_call", [{"to": "0x0", "data": data}, block]
+
+
+class TestRPCCacheMiddleware(unittest.TestCase):
+    def setUp(self):
+        self._folder = tempfile.TemporaryDirectory()
+        self.node = FakeNode()
+
+    def tearDown(self):
+        self._folder.cleanup()
+
+    def _middleware(self, node=None):
+        return RPCCacheMiddleware(self._folder.name, confirmations=64)(node or self.node, None)
+
+    def _node_calls(self):
+        return [method for method in self.node.requests if method not in ("eth_chainId", "eth_blockNumber", "eth_getBlockByNumber")]
+
+    def test_caches_pinned_calls(self):
+        make_request = self._middleware()
+        for block in [hex(100), BLOCK_HASH, {"blockHash": BLOCK_HASH}, "earliest"]:
+            for _ in range(2):
+                self.assertEqual(make_request(*_call("0x01", block))["result"], "0x01")
+
+        self.assertEqual(self._node_calls(), ["eth_call"] * 4)
+
+    def test_bypasses_recent_and_tagged_blocks(self):
+        make_request = self._middleware()
+        for block in ["latest", "pending", "finalized", hex(250)]:
+            for _ in range(2):
+                make_request(*_call("0x01", block))
+
+        self.assertEqual(self._node_calls(), ["eth_call"] * 8)
+
+    def test_does_not_cache_errors(self):
+        make_request = self._middleware()
+        for _ in range(2):
+            self.assertIn("error", make_request(*_call("0xbad", hex(100))))
+
+        self.assertEqual(self._node_calls(), ["eth_call"] * 2)
+
+    def test_get_logs_pinned_by_range(self):
+        make_request = self._middleware()
+        for log_filter in [{"fromBlock": hex(1), "toBlock": hex(100)}, {"fromBlock": hex(1)}]:
+            for _ in range(2):
+                make_request("eth_getLogs", [log_filter])
+
+        self.assertEqual(self._node_calls(), ["eth_getLogs"] * 3)
+
+    def test_persists_between_instances(self):
+        self._middleware()(*_call("0x01", hex(100)))
+        other_node = FakeNode()
+        response = self._middleware(other_node)(*_call("0x01", hex(100)))
+
+        self.assertEqual(response["result"], "0x01")
+        self.assertNotIn("eth_call", other_node.requests)
+        self.assertIn("rpc_responses.5.0101010101010101.log", os.listdir(self._folder.name))
+
+    def test_separates_chains_with_same_id(self):
+        self._middleware()(*_call("0x01", hex(100)))
+        restarted = FakeNode(genesis="0x" + "02" * 32)
+        self._middleware(restarted)(*_call("0x01", hex(100)))
+
+        self.assertIn("eth_call", restarted.requests)
+
+
+    def test_head_taken_from_block_number_responses(self):
+        make_request = self._middleware()
+        make_request("eth_blockNumber", [])
+        make_request(*_call("0x01", hex(100)))
+
+        self.assertEqual(self.node.requests.count("eth_blockNumber"), 1)
+
+    def test_lido_reads_cached_between_runs(self):
+        operators_count = "0x" + "00" * 31 + "03"
+        with mock.patch.object(config, "WEB3_CACHE_LOCATION", self._folder.name):
+            for run in range(2):
+                with StandInRPCNode(operators_count) as node:
+                    lido = LidoWrapper(get_web3_connection(node.url))
+                    with lido.pinned_block() as block:
+                        self.assertEqual(lido._lido_api.get_operators_indexes(), [0, 1, 2])
+
+                self.assertEqual(block, 256 - config.WEB3_RPC_CACHE_CONFIRMATIONS)
+                # lido_sdk calls don't take a block - pinned, the second run is answered from the cache
+                self.assertEqual(node.node.requests.count("eth_call"), 1 - run)
+
+
+class TestRPCResponseStore(unittest.TestCase):
+    def test_skips_torn_lines(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "responses.log")
+            store = RPCResponseStore(path, memory_entries=1)
+            store.put("a", {"value": 1})
+            with open(path, "ab") as log:
+                log.write(b'b\t{"val')
+
+            other = RPCResponseStore(path, memory_entries=1)
+            self.assertEqual(len(other), 1)
+            other.put("c", [1, 2])
+            store.put("d", None)
+
+            reopened = RPCResponseStore(path, memory_entries=1)
+            self.assertEqual(len(reopened), 3)
+            self.assertEqual((reopened.get("a"), reopened.get("c"), reopened.get("b")), ({"value": 1}, [1, 2], None))
@@ -4,11 +4,14 @@ from dataclasses import asdict
 
 from datetime import date, datetime
 from eth_typing import HexStr
-from typing import Union, List, Literal, Iterable
+from typing import Union, List, Literal, Iterable, NewType
 from keccak_utils import KeccakInput
 
 ByteEndianness = Literal['little', 'big']
 KECCAK_INPUT_LENGTH = 32
+PUBKEY_LENGTH = 48
+
+Pubkey = NewType('Pubkey', bytes)
 
 class DateFormatter:
     @staticmethod
@@ -125,3 +128,41 @@ class IntUtils:
         # return value
         # "shortcut" implementation - only 32-byte values are allowed
         return list(BytesUtils.chunks(value, KECCAK_INPUT_LENGTH, with_padding=True, byteorder='big'))
+
+
+class PubkeyUtils:
+    """
+    Validator pubkeys are kept as 48-byte big-endian `bytes` (`Pubkey`) internally. Conversion to and from hex strings
+    only happens at I/O boundaries - beacon API responses, json caches and Cairo program input.
+    """
+    _KECCAK_INPUT_PADDING = b'\x00' * (2 * KECCAK_INPUT_LENGTH - PUBKEY_LENGTH)
+
+    @classmethod
+    def from_bytes(cls, value: bytes) -> Pubkey:
+        if len(value) == PUBKEY_LENGTH:
+            return Pubkey(bytes(value))
+        # shorter or zero-padded values - normalize to the fixed length
+        return cls.from_int(int.from_bytes(value, 'big', signed=False))
+
+    @classmethod
+    def from_int(cls, value: int) -> Pubkey:
+        return Pubkey(value.to_bytes(PUBKEY_LENGTH, 'big', signed=False))
+
+    @classmethod
+    def from_hex_str(cls, value: str) -> Pubkey:
+        digits = value[2:] if value[:2] in ('0x', '0X') else value
+        if len(digits) == 2 * PUBKEY_LENGTH:
+            return Pubkey(bytes.fromhex(digits))
+        return cls.from_int(int(digits, 16))
+
+    @classmethod
+    def to_hex_str(cls, value: Pubkey) -> HexStr:
+        return HexStr('0x' + value.hex())
+
+    @classmethod
+    def to_keccak_input(cls, value: Pubkey) -> List[KeccakInput]:
+        """
+        Same as `IntUtils.pubkey_bytes_to_keccak_input`, specialized for fixed-length pubkeys
+        """
+        padded = cls._KECCAK_INPUT_PADDING + value
+        return [padded[:KECCAK_INPUT_LENGTH], padded[KECCAK_INPUT_LENGTH:]]
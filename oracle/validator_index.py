@@ -0,0 +1,149 @@
+import logging
+import os
+import time
+
+from itertools import islice
+from typing import Iterable, List, Optional
+
+import config
+from api.eth_api import BeaconState
+from disk_cache.files import atomic_write, file_lock
+from disk_cache.metrics import CACHE_METRICS
+from utils import PUBKEY_LENGTH, Pubkey
+
+
+class ValidatorIndexMap:
+    """
+    Maps validator pubkeys to their index in the beacon chain validator registry.
+
+    Beacon chain validator indices are append-only and never reassigned, so the map of the first `scanned_validators`
+    validators holds forever - each update only adds the validators appended since, and keys are then resolved by
+    lookup, whether they were seen before or not.
+    The map is checked against the beacon state before use - if the last scanned validator or one of the keys is not
+    at its recorded index (e.g. the map was built for another network), the whole map is dropped and rebuilt.
+    """
+    LOGGER = logging.getLogger(__name__ + ".ValidatorIndexMap")
+
+    def __init__(self, pubkeys: Iterable[Pubkey] = ()):
+        # pubkeys are unique in the registry - a deposit for an existing one tops it up - so the map is the prefix
+        self._indices = {pubkey: index for index, pubkey in enumerate(pubkeys)}
+
+    @property
+    def scanned_validators(self) -> int:
+        return len(self._indices)
+
+    def pubkeys(self, start: int = 0) -> List[Pubkey]:
+        """
+        Pubkeys of the scanned validators from `start` on, in index order
+        """
+        return list(islice(self._indices, start, None))
+
+    def update(self, beacon_state: BeaconState, keys: Iterable[Pubkey]) -> bool:
+        """
+        Adds validators appended since the last update. Returns True if the map has changed.
+        """
+        total_validators = beacon_state.total_validators
+        validators = beacon_state.validators
+        if not self._matches_state(beacon_state, keys):
+            self.LOGGER.warning("Validator index map does not match the beacon state - rebuilding it")
+            self._reset()
+
+        scan_from = self.scanned_validators
+        if scan_from >= total_validators:
+            return False
+
+        self.LOGGER.debug(f"Adding validators {scan_from}..{total_validators} to the index map")
+        for index in range(scan_from, total_validators):
+            self._indices[validators[index].pubkey] = index
+        return True
+
+    def _matches_state(self, beacon_state: BeaconState, keys: Iterable[Pubkey]) -> bool:
+        last = min(self.scanned_validators, beacon_state.total_validators) - 1
+        if last >= 0 and self._indices.get(beacon_state.validators[last].pubkey) != last:
+            return False
+        recorded = ((key, self._indices.get(key)) for key in keys)
+        return not any(
+            index is not None and index < beacon_state.total_validators and not self._matches(beacon_state, key, index)
+            for key, index in recorded
+        )
+
+    def _reset(self):
+        self._indices = {}
+
+    def index_of(self, beacon_state: BeaconState, key: Pubkey) -> Optional[int]:
+        """
+        Validator index of the key, if it is present in the beacon_state - should be called after `update`
+        """
+        index = self._indices.get(key)
+        return index if index is not None and self._matches(beacon_state, key, index) else None
+
+    def indices_for(self, beacon_state: BeaconState, keys: Iterable[Pubkey]) -> List[int]:
+        """
+        Validator indices for the keys that are present in the beacon_state - should be called after `update`
+        """
+        indices = ((key, self._indices.get(key)) for key in keys)
+        return [index for key, index in indices if index is not None and self._matches(beacon_state, key, index)]
+
+    @classmethod
+    def _matches(cls, beacon_state: BeaconState, key: Pubkey, index: int) -> bool:
+        return index < beacon_state.total_validators and beacon_state.validators[index].pubkey == key
+
+    def __len__(self):
+        return len(self._indices)
+
+
+class CachedValidatorIndexMap(ValidatorIndexMap):
+    """
+    ValidatorIndexMap persisted next to the Lido keys cache as a flat file of scanned pubkeys, in index order -
+    each update only appends the validators it added
+    """
+    LOGGER = logging.getLogger(__name__ + ".CachedValidatorIndexMap")
+    FILE_NAME = 'validator_pubkeys.bin'
+
+    def __init__(self, storage_folder: str = config.LIDO_CACHE_LOCATION):
+        self._path = os.path.join(storage_folder, self.FILE_NAME)
+        self._metrics = CACHE_METRICS.namespace('lido')
+        super(CachedValidatorIndexMap, self).__init__(self._load())
+        self.LOGGER.debug(f"Loaded {self.scanned_validators} validator pubkeys")
+
+    def _load(self) -> List[Pubkey]:
+        try:
+            with open(self._path, "rb") as pubkeys_file:
+                content = pubkeys_file.read()
+        except FileNotFoundError:
+            if self._metrics is not None:
+                self._metrics.miss()
+            return []
+        if self._metrics is not None:
+            self._metrics.hit(len(content))
+        # a record partially appended by an interrupted update is dropped
+        return [
+            Pubkey(content[offset:offset + PUBKEY_LENGTH])
+            for offset in range(0, len(content) - PUBKEY_LENGTH + 1, PUBKEY_LENGTH)
+        ]
+
+    def _reset(self):
+        super(CachedValidatorIndexMap, self)._reset()
+        with file_lock(self._path), atomic_write(self._path):
+            pass
+
+    def update(self, beacon_state: BeaconState, keys: Iterable[Pubkey]) -> bool:
+        changed = super(CachedValidatorIndexMap, self).update(beacon_state, keys)
+        if changed:
+            self._append()
+        return changed
+
+    def _append(self):
+        with file_lock(self._path):
+            # another process might have appended the same validators meanwhile
+            saved = os.path.getsize(self._path) // PUBKEY_LENGTH if os.path.exists(self._path) else 0
+            if saved >= self.scanned_validators:
+                return
+            start = time.perf_counter() if self._metrics is not None else None
+            content = b"".join(self.pubkeys(saved))
+            with open(self._path, "ab") as pubkeys_file:
+                pubkeys_file.truncate(saved * PUBKEY_LENGTH)
+                pubkeys_file.write(content)
+            if self._metrics is not None:
+                self._metrics.written(len(content), time.perf_counter() - start)
+            self.LOGGER.debug(f"Appended {len(content) // PUBKEY_LENGTH} validator pubkeys")